@@ -11,10 +11,8 @@ import base64
 import io
 import sys
 import time
-import json
 import pathlib
 import warnings
-import numpy as np
 import pandas as pd
 from PIL import Image
 import plotly.express as px
@@ -25,6 +23,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 sns.set_style('white')
 
+import flask
+from markupsafe import escape
 import dash
 from dash import dcc
 from dash import dash_table
@@ -32,7 +32,7 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash_extensions import Download
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input,Output
+from dash.dependencies import Input,Output,State
 from dash_extensions.snippets import send_data_frame
 
 external_stylesheets = [dbc.themes.BOOTSTRAP]
@@ -52,24 +52,79 @@ tab_style = {
 }
 
 # App libraries
-from data_input.read_system_info import gather_inputs
-from data_input.read_meteo_data import read_weather_data
-from data_input.read_operational_data import read_inverter_data
-from data_input.poa_irradiance import get_operational_irradiance
-
-from data_sanitization.utc import get_tz
-from data_sanitization.models import predict_missing_data
-from data_sanitization.site_location_pvlib import get_site_location
-from data_sanitization.clear_sky_irradiance import clearsky_irradiance
-from data_sanitization.eliminate_night_values import eliminate_nightvalues
-from data_sanitization.filtering import multiindex_irradiance_filter
-from data_sanitization.filtering import multiindex_current_filter
-from data_sanitization.filtering import multiindex_voltage_filter
-
 # from data_sanitization.plot_graph import plot_data_analysis_graph
 # from data_sanitization.plot_graph import input_data_summary
 # from data_sanitization.misc_func import fig_to_uri
 from data_sanitization.misc_func import data_summary_table
+from data_sanitization.downsampling import downsample, relayout_x_range
+from data_sanitization.utc import preload_timezones
+
+from data_store.frame_cache import FrameCache
+from data_store.result_store import ResultStore
+from data_pipeline.jobs import JOB_START_METHOD, JobManager
+from data_pipeline.pipeline import PARAMS, PipelineError
+
+# processed uploads are kept on the server, the browser only holds their id.
+# Frames read by the callbacks are cached in memory by content hash.
+result_store = ResultStore(cache=FrameCache())
+# uploads are processed in a background process pool (see data_pipeline)
+job_manager = JobManager(store=result_store)
+# time zone boundaries loaded once, before gunicorn --preload forks the
+# workers, when the job pools are forked from them too. Spawned pool processes
+# load their own (see data_pipeline.jobs), the server does not need them.
+if JOB_START_METHOD == 'fork':
+    preload_timezones()
+# the /admin pages expose the uploads of every user, set to 1 to serve them
+ADMIN_ENDPOINTS = os.environ.get('DST_ADMIN_ENDPOINTS', '0') == '1'
+
+
+def admin_route(rule):
+    """server.route, the page being only registered with ADMIN_ENDPOINTS."""
+    if ADMIN_ENDPOINTS:
+        return server.route(rule)
+    return lambda func: func
+
+
+@admin_route('/admin/cache-stats')
+def cache_stats():
+    """Hit/miss counters of the in-process frame cache of this worker."""
+    return flask.jsonify(pid=os.getpid(), **result_store.cache.stats())
+
+
+@admin_route('/admin/profiles')
+def profiles():
+    """Total time of the pipeline stages of the stored uploads."""
+    rows = []
+    for result_id in result_store.results():
+        meta = result_store.read_meta(result_id)
+        stages = pd.DataFrame(meta.get('profile', []))
+        if stages.empty:
+            continue
+        top = stages[stages['depth'] <= 1].set_index('name')
+        row = {'result': '<a href="/admin/profiles/{0}">{0}</a>'.format(result_id),
+               'file': escape(meta.get('filename') or ''),
+               'created': pd.Timestamp(meta['created'], unit='s').strftime('%Y-%m-%d %H:%M:%S')}
+        row.update(top['wall_s'].groupby(level=0, sort=False).sum().to_dict())
+        rows.append(row)
+    return '<h3>Pipeline profiles</h3>' + pd.DataFrame(rows).to_html(
+        escape=False, index=False, na_rep='')
+
+
+@admin_route('/admin/profiles/<result_id>')
+def profile_detail(result_id):
+    """Timings, memory and shapes of every profiled stage of an upload."""
+    try:
+        meta = result_store.read_meta(result_id)
+    except KeyError:
+        flask.abort(404)
+    stages = pd.DataFrame(meta.get('profile', []))
+    if not stages.empty:
+        stages = stages.sort_values('start_s', kind='stable')
+        stages['name'] = ['&nbsp;' * 4 * depth + name for depth, name
+                          in zip(stages['depth'], stages['name'])]
+    return '<h3>Profile of {} ({})</h3>'.format(
+        result_id, escape(meta.get('filename') or '')) + stages.to_html(
+        escape=False, index=False, na_rep='')
 
 
 # In[2]:
@@ -115,22 +170,28 @@ def input_data_summary(array_info, df_in):
 
 
 def plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name,
-                             variable, ylabel, title):
-    df = pd.DataFrame()
+                             variable, ylabel, title, x_range=None):
     inverter, mppt = inv_name.split('-')[0], inv_name.split('-')[1]
     input_name = inv_name + '-' + variable
 
-    df['Pre Sanitation'] = inverter_data[inverter][mppt][variable]
-    df['Post Sanitation'] = inverter_data_sanitized[inverter][mppt][variable]
+    pre_sanitation = inverter_data[inverter][mppt][variable]
+    post_sanitation = inverter_data_sanitized[inverter][mppt][variable]
+    if x_range is not None:
+        # zoomed graph, only the visible window is sent
+        pre_sanitation = pre_sanitation.loc[x_range[0]:x_range[1]]
+        post_sanitation = post_sanitation.loc[x_range[0]:x_range[1]]
+    # the traces are downsampled to about 2 points per pixel
+    pre_sanitation = downsample(pre_sanitation)
+    post_sanitation = downsample(post_sanitation)
 
     fig = go.Figure()
-    dash_obj1 = go.Scatter(x=df.index,
-                           y=df['Pre Sanitation'],
+    dash_obj1 = go.Scatter(x=pre_sanitation.index,
+                           y=pre_sanitation,
                            name='Pre Sanitation',
                            line=dict(color='#636EFA', dash='dash'))
 
-    dash_obj2 = go.Scatter(x=df.index,
-                           y=df['Post Sanitation'],
+    dash_obj2 = go.Scatter(x=post_sanitation.index,
+                           y=post_sanitation,
                            name='Post Sanitation',
                            line=dict(color='#FF8800'))
 
@@ -144,6 +205,8 @@ def plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name,
     fig.add_trace(dash_obj1)
     fig.add_trace(dash_obj2)
     fig.update_layout(margin=dict(l=20, r=20, t=5, b=20))
+    if x_range is not None:
+        fig.update_xaxes(range=list(x_range))
     return fig
 
 
@@ -432,10 +495,53 @@ def upload_data_card():
                 # Don't allow multiple files to be uploaded
                 multiple=False
             ),
+            html.Div(id='job-progress', style={'font-family': 'Roboto'}),
+        ]
+    )
+
+
+# THRESHOLDS OF THE FILTERS
+THRESHOLD_CONTROLS = [
+    ('irrad_low', 'Irradiance lower bound (W/m2)', 10),
+    ('irrad_high', 'Irradiance upper bound (W/m2)', 10),
+    ('isc_factor', 'Current bound (x Isc)', 0.05),
+    ('voc_factor', 'Voltage bound (x Voc)', 0.05),
+    ('night_threshold', 'Night threshold (W/m2)', 1),
+    ('imputation_trigger', 'Imputation trigger (% missing)', 0.1),
+    ('short_gap', 'Short gap (samples)', 1),
+]
+
+
+def threshold_card():
+    """
+    :return: A Div containing the thresholds of the filters, changing one
+        recomputes the affected stages of the uploaded file.
+    """
+    return html.Div(
+        id='threshold-card',
+        children=[
+            html.Label('Filter thresholds', style={'font-family': 'Roboto',
+                                                   'font-weight': 'bold'}),
+        ] + [
+            html.Div([
+                html.Label(label, style={'font-family': 'Roboto',
+                                         'width': '220px',
+                                         'display': 'inline-block'}),
+                dcc.Input(id='param-' + name, type='number',
+                          value=PARAMS[name], step=step, min=0,
+                          debounce=True, style={'width': '100px'}),
+            ])
+            for name, label, step in THRESHOLD_CONTROLS
         ]
     )
 
 
+def threshold_params(values):
+    """Parameters of the pipeline from the values of the threshold inputs."""
+    return {name: PARAMS[name] if value is None else value
+            for (name, _, _), value in zip(THRESHOLD_CONTROLS, values)}
+
+
 # LEFT SIDE TAB INFORMATION
 def description_card():
     """
@@ -555,156 +661,81 @@ def generate_modal():
 # In[8]:
 
 
-def deserialize_multiindex_dataframe(dataframe_json: str) -> pd.DataFrame:
+def read_data_summary(result_id):
     """
-    Deserialize the dataframe json into a dataframe object.
-    The dataframe json must be generated with DataFrame.to_json(orient="split")
-    This function is to address the fact that `pd.read_json()` isn't behaving correctly (yet)
-    https://github.com/pandas-dev/pandas/issues/4889
+    Read the data summary table of a processed upload from the result store.
     """
-    def convert_index(json_obj):
-        to_tuples = [tuple(i) if isinstance(i, list) else i for i in json_obj]
-        if all(isinstance(i, list) for i in json_obj):
-            return pd.MultiIndex.from_tuples(to_tuples)
-        else:
-            return pd.Index(to_tuples)
-    json_dict = json.loads(dataframe_json)
-    columns = convert_index(json_dict['columns'])
-    index = convert_index(json_dict['index'])
-    dataframe = pd.DataFrame(json_dict["data"], index, columns)
-    return dataframe
+    meta = result_store.read_meta(result_id)
+    return pd.read_json(meta['data_summary'], orient='index')
 
 ## Reading the uploaded file 
+# the only callback writing the result key, the job key and job-poll.disabled:
+# Dash allows a single callback per output, so the uploads, the threshold
+# changes and the polling of their jobs share it
 @app.callback(
     Output('intermediate-value', 'data'),
-    [
-        Input('upload-data', 'contents'),
-        Input('upload-data', 'filename')
-    ],
+    Output('job-id', 'data'),
+    Output('job-progress', 'children'),
+    Output('job-poll', 'disabled'),
+    Input('upload-data', 'contents'),
+    Input('upload-data', 'filename'),
+    Input('job-poll', 'n_intervals'),
+    [Input('param-' + name, 'value') for name, _, _ in THRESHOLD_CONTROLS],
+    State('job-id', 'data'),
+    State('intermediate-value', 'data'),
     prevent_initial_call=True
 )
-def create_data(contents, filename):
-    # Starting the timer
-    start_time = time.time()
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-
+def update_result(contents, filename, n_intervals, *args):
+    *values, job_id, result_id = args
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    if any(t.startswith('upload-data') for t in triggered):
+        content_type, content_string = contents.split(',')
+        decoded = base64.b64decode(content_string)
+        # the pipeline runs in the background, its progress is polled
+        return start_job(lambda: job_manager.submit(
+            decoded, filename, params=threshold_params(values)))
+    if not any(t.startswith('job-poll') for t in triggered):
+        return apply_thresholds(result_id, threshold_params(values))
+    return (dash.no_update,) + poll_job(job_id)
+
+
+def start_job(submit):
+    """
+    Submit a job and start polling it, or show why it could not be submitted.
+    """
     try:
-        if 'csv' in filename:
-            array_info, general_info = gather_inputs(
-                io.StringIO(decoded.decode('utf-8')))
+        job_id = submit()
+    except PipelineError as e:
+        return dash.no_update, dash.no_update, str(e), dash.no_update
+    return dash.no_update, job_id, 'Waiting for a worker...', False
 
-            inverter_data,data_points = read_inverter_data(
-                general_info, io.StringIO(decoded.decode('utf-8')))
-            
-            meteo_data, irr_df = read_weather_data(
-                general_info, io.StringIO(decoded.decode('utf-8')))
 
-        elif 'xls' or 'xlsx' in filename:
-            array_info, general_info = gather_inputs(io.BytesIO(decoded))
-            print(array_info)
-                        
-            inverter_data,data_points = read_inverter_data(general_info, io.BytesIO(decoded))
-            print(inverter_data)
-            print('INVERTER DATA PROCESSED')
-            meteo_data,irr_df = read_weather_data(general_info, io.BytesIO(decoded))
-            print(meteo_data)
-            
-    except Exception as e:
-        return html.Div(['There was an error processing this file.'])
-    
-    # converting irradinace GHI to POA 
-    meteo_data = get_operational_irradiance(
-        meteo_data, general_info, array_info, poa_model='isotropic')
-    
-    # Data Sanitization- meteo
-    meteo_data_filtered = multiindex_irradiance_filter(meteo_data,
-                                                       irrad_low=0,
-                                                       irrad_high=1200)
-    # Clear sky curve
-    csky_curve = clearsky_irradiance(times=inverter_data.index, general_info=general_info,
-                                          array_info=array_info, convertGHI_toPOA=True)
-
-    tz_str = get_tz(latitude=general_info['lat'], longitude=general_info['long'])
-    csky_curve.index = csky_curve.index.tz_localize('UTC').tz_convert(tz_str).tz_localize(None)
-
-    inverter_data_csky = eliminate_nightvalues(inverter_data,
-                                               cs_data=csky_curve, threshold=10)
-    
-    # Checking for % of missing data
-    missing_data = round((inverter_data_csky.isna().sum().sum()/inverter_data_csky.size)*100,2)
-    print('Missing data for Inverter is {}'.format(missing_data))
-    
-    # Data Sanitization-inverter
-    inverter_data_filtered = multiindex_current_filter(inverter_data_csky, array_info)
-    inverter_data_filtered = multiindex_voltage_filter(inverter_data_filtered,
-                                                       array_info)
-    # % of outliers
-    outlier_data = round(((inverter_data_filtered.isna().sum().sum()/
-                               inverter_data_csky.isna().sum().sum())),2)
-    print('Outliers: ', outlier_data)
-
-    # meteo data - for graph
-    csky_curve_meteo = clearsky_irradiance(times=irr_df.index, general_info=general_info,
-                                          array_info=array_info, convertGHI_toPOA=True)
-    csky_curve_meteo.index = csky_curve_meteo.index.tz_localize('UTC').tz_convert(tz_str).tz_localize(None)
-    meteo_data_csky = eliminate_nightvalues(meteo_data_filtered,
-                                               cs_data=csky_curve_meteo, threshold=10)
-    
-        # Timer ends here
-    end_time = time.time()
-    print('File Execution Time is {} seconds'.format(end_time - start_time))
-
-    if missing_data > 0.5:
-        print('\n MISSING DATA FOUND!!')
-        print('\n Computing Missing Data using Machine Learning Models')
-        inverter_data_sanitized = predict_missing_data(inverter_data_filtered,
-                                                       meteo_data_filtered,
-                                                       array_info, general_info)
-        # converting df into a multi-index df
-        colname = [(i, j, z) for i, j, z in [x.split('-') for x in inverter_data_sanitized.columns]]
-        inverter_data_sanitized.columns = pd.MultiIndex.from_tuples(colname, names=['ag_level_2', 'ag_level_1', 'curve'])
-        inverter_data_sanitized.index.names = ['datetime']
+def apply_thresholds(result_id, params):
+    """
+    Rerun the pipeline of the displayed result with new thresholds, in the
+    background as the uploads. The parsed data, POA and clear sky curves come
+    from the stage cache, only the stages below the changed thresholds are
+    recomputed.
+    """
+    if not result_id or not result_store.exists(result_id):
+        return dash.no_update, dash.no_update, '', dash.no_update
+    return start_job(lambda: job_manager.refilter(result_id, params))
 
-    else:
-        inverter_data_sanitized = inverter_data_csky.fillna(method = 'ffill').fillna(method='bfill')
-        print('\nData Availability {} %'.format(100 - missing_data))
-        print('\n FINAL STATUS : GOOD FOR ANALYSIS')
 
-    inverter_data_sanitized[inverter_data_sanitized<0] = np.nan
-    missing_data_post_sanitation = round((inverter_data_sanitized.isna().sum().sum()/inverter_data_csky.size)*100,2)
-    
-    data_summary = pd.DataFrame(index=['Data Points Available',
-                                         'Temporal Resolution', 'Missing Data (%)',
-                                         'Outliers (%)', 'missing_data_post_sanitation'], columns=['Values'])
-
-    data_summary.loc['Data Points Available'] = str(data_points/1000) + ' K'
-    data_summary.loc['Temporal Resolution'] = str(general_info['inverter_time_resolution']) + ' Mins'
-    data_summary.loc['Missing Data (%)'] = missing_data
-    data_summary.loc['Outliers (%)'] = outlier_data
-    data_summary.loc['missing_data_post_sanitation'] = missing_data_post_sanitation
-    data_summary = data_summary.replace(np.nan,0)
-    print('Printing data summary in reading files:', data_summary)
-    print('#####################')
-
-    print(array_info)
-#     converting dataframes into json object
-    datasets = {
-        'array_info': array_info.to_json(orient='split', date_format='iso'),
-        'inv_data': inverter_data.to_json(orient='split', date_format='iso'),
-        'inv_data_csky': inverter_data_csky.to_json(orient='split', date_format='iso'),
-        'inv_data_sani': inverter_data_sanitized.to_json(orient='split', date_format='iso'),
-        'meteo_data': meteo_data.to_json(orient='split', date_format='iso'),
-        'irr_df': irr_df.to_json(orient='split', date_format='iso'),
-        'meteo_data_csky': meteo_data_csky.to_json(orient='split', date_format='iso'),
-        'data_summary': data_summary.to_json(orient='index'),
-        'general_info': json.dumps(general_info)
-    } 
-    
-    end_time = time.time()
-    print('Timt taken for processing the data: {}'.format(end_time-start_time))
-    
-    return json.dumps(datasets)
+def poll_job(job_id):
+    try:
+        status = job_manager.status(job_id)
+    except KeyError:
+        return dash.no_update, '', True
+    if status['state'] == 'done':
+        # only the key of the result is sent to the browser
+        return status['result_id'], '', True
+    if status['state'] == 'error':
+        return dash.no_update, status['error'], True
+    if status['state'] == 'queued':
+        return dash.no_update, 'Waiting for a worker...', False
+    return dash.no_update, 'Processing: {} ({}/{})'.format(
+        status['stage'], status['stage_index'] + 1, status['n_stages']), False
 
 
 # In[9]:
@@ -746,6 +777,8 @@ app.layout = html.Div(
                         html.Br(),
                         upload_data_card(),
                         html.Br(),
+                        threshold_card(),
+                        html.Br(),
                 #                 html.H4('----OR----',style={'font-family': 'Roboto',
 #                                        'fontSize':'130%', 'font-weight':'bold'}),
 
@@ -868,7 +901,9 @@ app.layout = html.Div(
         ],
     ),            
     generate_modal(),
-    dcc.Store(id='intermediate-value', storage_type = 'session')
+    dcc.Store(id='intermediate-value', storage_type = 'session'),
+    dcc.Store(id='job-id'),
+    dcc.Interval(id='job-poll', interval=1000, disabled=True)
 ])
 
 
@@ -880,11 +915,8 @@ app.layout = html.Div(
     Input('intermediate-value', 'data'),
     prevent_initial_call=True
 )
-def update_output(jsonified_cleaned_data):
-    datasets = json.loads(jsonified_cleaned_data)
-    
-    array_info = deserialize_multiindex_dataframe(datasets['array_info'])
-    array_info.index.names = ['ag_level_2', 'ag_level_1']
+def update_output(result_id):
+    array_info = result_store.read_frame(result_id, 'array_info')
     all_inputs = array_info['input_name'].unique().tolist()
 
     return dcc.Dropdown(
@@ -899,13 +931,7 @@ def update_output(jsonified_cleaned_data):
     Output('download-btn', 'n_clicks'),
     Input('intermediate-value', 'data'),
 )              
-def download_data_button(jsonified_cleaned_data):
-    
-    datasets = json.loads(jsonified_cleaned_data)
-    inverter_data_sanitized = deserialize_multiindex_dataframe(datasets['inv_data_sani'])
-    inverter_data_sanitized.index = pd.to_datetime(inverter_data_sanitized.index)
-    inverter_data_sanitized.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    inverter_data_sanitized.index.names = ['datetime']
+def download_data_button(result_id):
     
     return html.Button("Download Sanitized Data", id="btn-download-txt",
             style={'background-color': '#737373','color': '#FFFFFF', 'width':'280px',
@@ -937,16 +963,10 @@ def markdown_text_cards(clicks):
     Output('bar_plot_missing', 'figure'),
     Input('intermediate-value', 'data'),
 )
-def bar_plot_graph(jsonified_cleaned_data):
-    datasets = json.loads(jsonified_cleaned_data)
-    
-    array_info = deserialize_multiindex_dataframe(datasets['array_info'])
-    array_info.index.names = ['ag_level_2', 'ag_level_1']
-    
-    inverter_data_csky = deserialize_multiindex_dataframe(datasets['inv_data_csky'])
-    inverter_data_csky.index = pd.to_datetime(inverter_data_csky.index)
-    inverter_data_csky.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    inverter_data_csky.index.names = ['datetime']
+def bar_plot_graph(result_id):
+    datasets = result_store.read_frames(result_id, ['array_info', 'inv_data_csky'])
+    array_info = datasets['array_info']
+    inverter_data_csky = datasets['inv_data_csky']
     
     figure=input_data_summary(array_info=array_info, df_in=inverter_data_csky)
     return figure
@@ -971,10 +991,9 @@ def update_click_output(button_click, close_click):
     Output('data-values-pre', 'children'),
     Input('intermediate-value', 'data'),
 )
-def update_data_summary(jsonified_cleaned_data):
+def update_data_summary(result_id):
 
-    datasets = json.loads(jsonified_cleaned_data)
-    data_summary = pd.read_json(datasets['data_summary'], orient='index')
+    data_summary = read_data_summary(result_id)
     print('data summary:',data_summary)
     print('dat_summary_value: ', data_summary.loc['Data Points Available']['Values'])
     return generate_cards1(data_summary)
@@ -984,9 +1003,8 @@ def update_data_summary(jsonified_cleaned_data):
     Output('data-values-post', 'children'),
     Input('intermediate-value', 'data'),
 )
-def update_data_summary(jsonified_cleaned_data):
-    datasets = json.loads(jsonified_cleaned_data)
-    data_summary = pd.read_json(datasets['data_summary'], orient='index')
+def update_data_summary(result_id):
+    data_summary = read_data_summary(result_id)
     print('data summary:',data_summary)
     print('dat_summary_value: ', data_summary.loc['Data Points Available']['Values'])
     return generate_cards2(data_summary)
@@ -998,42 +1016,52 @@ def update_data_summary(jsonified_cleaned_data):
     Output('irradiance_graph', 'figure'),
     Input('intermediate-value', 'data'),
     Input("input-select", "value"),
+    Input('current_graph', 'relayoutData'),
+    Input('voltage_graph', 'relayoutData'),
+    Input('irradiance_graph', 'relayoutData'),
 )
-def update_current_graph(jsonified_cleaned_data, input_name):
+def update_current_graph(result_id, input_name, current_relayout,
+                         voltage_relayout, irradiance_relayout):
     """
     :param input_name:
     :return:
     """
-    datasets = json.loads(jsonified_cleaned_data)
-    
-    inverter_data = deserialize_multiindex_dataframe(datasets['inv_data'])
-    inverter_data.index = pd.to_datetime(inverter_data.index)
-    inverter_data.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    inverter_data.index.names = ['datetime']
-    print('update_current_graph: ',inverter_data)
-    
-    inverter_data_sanitized = deserialize_multiindex_dataframe(datasets['inv_data_sani'])
-    inverter_data_sanitized.index = pd.to_datetime(inverter_data_sanitized.index)
-    inverter_data_sanitized.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    inverter_data_sanitized.index.names = ['datetime']
-    print('update_current_graph: ',inverter_data_sanitized)
-    
-    irr_df = deserialize_multiindex_dataframe(datasets['irr_df'])
-    irr_df.index = pd.to_datetime(irr_df.index)
-    irr_df.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    irr_df.index.names = ['datetime']
-    
-    meteo_data_csky = deserialize_multiindex_dataframe(datasets['meteo_data_csky'])
-    meteo_data_csky.index = pd.to_datetime(meteo_data_csky.index)
-    meteo_data_csky.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-    meteo_data_csky.index.names = ['datetime']
-
-    fig1 = plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name=input_name,
-                     variable='I', ylabel='Current (A)', title='')
-    fig2 = plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name=input_name,
-                     variable='V', ylabel='Voltage (V)', title='')
-    fig3 = plot_data_analysis_graph(irr_df, meteo_data_csky, inv_name=input_name, variable='G',
-                    ylabel='Irradiance (W/m\u00b2)',title='')
+    changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
+    relayout = {'current_graph': current_relayout,
+                'voltage_graph': voltage_relayout,
+                'irradiance_graph': irradiance_relayout}
+    graph_id = changed_id.split('.')[0]
+    x_range = None
+    if graph_id in relayout:
+        # zoom or reset of a single graph, only this one is refetched
+        x_range = relayout_x_range(relayout[graph_id])
+        if x_range is None:
+            return dash.no_update, dash.no_update, dash.no_update
+        if x_range == (None, None):
+            x_range = None
+
+    # a zoom refreshes the zoomed graph, anything else all of them
+    refresh = [graph_id] if graph_id in relayout else list(relayout)
+    inverter, mppt = input_name.split('-')[0], input_name.split('-')[1]
+    fig1 = fig2 = fig3 = dash.no_update
+    if 'current_graph' in refresh or 'voltage_graph' in refresh:
+        inverter_data = result_store.read_partition(
+            result_id, 'inv_data', (inverter, mppt), curves=['I', 'V'])
+        inverter_data_sanitized = result_store.read_partition(
+            result_id, 'inv_data_sani', (inverter, mppt), curves=['I', 'V'])
+    if 'current_graph' in refresh:
+        fig1 = plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name=input_name,
+                         variable='I', ylabel='Current (A)', title='', x_range=x_range)
+    if 'voltage_graph' in refresh:
+        fig2 = plot_data_analysis_graph(inverter_data, inverter_data_sanitized, inv_name=input_name,
+                         variable='V', ylabel='Voltage (V)', title='', x_range=x_range)
+    if 'irradiance_graph' in refresh:
+        irr_df = result_store.read_partition(
+            result_id, 'irr_df', (inverter, mppt), curves=['G'])
+        meteo_data_csky = result_store.read_partition(
+            result_id, 'meteo_data_csky', (inverter, mppt), curves=['G'])
+        fig3 = plot_data_analysis_graph(irr_df, meteo_data_csky, inv_name=input_name, variable='G',
+                        ylabel='Irradiance (W/m\u00b2)',title='', x_range=x_range)
 
     return fig1, fig2, fig3
 
@@ -1045,15 +1073,11 @@ def update_current_graph(jsonified_cleaned_data, input_name):
     Input('intermediate-value', 'data'),
     prevent_initial_call=True,
 )
-def func2(clicks, n_clicks, jsonified_cleaned_data):
+def func2(clicks, n_clicks, result_id):
     changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
 
     if 'btn-download-txt' in changed_id:
-        datasets = json.loads(jsonified_cleaned_data)
-        inverter_data_sanitized = deserialize_multiindex_dataframe(datasets['inv_data_sani'])
-        inverter_data_sanitized.index = pd.to_datetime(inverter_data_sanitized.index)#, origin = 'unix', unit = 'ms')
-        inverter_data_sanitized.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
-        inverter_data_sanitized.index.names = ['datetime']
+        inverter_data_sanitized = result_store.read_frame(result_id, 'inv_data_sani')
         
     return dcc.send_data_frame(inverter_data_sanitized.to_csv,
                                "sanitized_data.csv")
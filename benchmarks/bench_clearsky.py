@@ -0,0 +1,111 @@
+"""
+Benchmark of the clear sky models on time grids of growing length.
+
+For each model of data_sanitization.clear_sky_models and each duration, the
+clear sky GHI, DNI and DHI of a site are timed (best of --repeat runs):
+  - pvlib: pvlib Location.get_clearsky, the previous implementation,
+  - cold: solar geometry and model computed, no cache,
+  - model: the model alone, from the cached solar geometry,
+  - table: read from the per-site tables on disk (built before timing).
+The agreement of each model with pvlib and with simplified_solis is reported
+as the maximum absolute difference and the RMSE of the daytime GHI.
+
+Run from the repository root:
+    python -m benchmarks.bench_clearsky --days 7 30 365
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+warnings.filterwarnings('ignore')
+# tables of this benchmark only
+os.environ['DST_EPHEMERIS_DIR'] = tempfile.mkdtemp(prefix='bench_clearsky_')
+
+from pvlib.location import Location
+from data_sanitization import solar_geometry, ephemeris_tables
+from data_sanitization.clear_sky_models import CLEAR_SKY_MODELS
+# the tables of the short grids are built too, to time their lookups
+ephemeris_tables.TABLES_MIN_ROWS = 0
+
+
+def best_time(func, repeat):
+    """Best wall time over repeat runs and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def run(days, resolution, latitude, longitude, altitude, repeat=3,
+        models=None):
+    site_location = Location(latitude, longitude, altitude=altitude)
+    rows = []
+    for n_days in days:
+        times = pd.date_range('2021-01-01', periods=int(n_days * 1440 / resolution),
+                              freq='{}min'.format(resolution))
+        reference = solar_geometry.get_clearsky(site_location, times,
+                                                tables=False)
+        day = reference['ghi'].to_numpy() > 0
+        for model in models or list(CLEAR_SKY_MODELS):
+            def cold():
+                solar_geometry.clear_cache()
+                return solar_geometry.get_clearsky(site_location, times,
+                                                   model=model, tables=False)
+            # the solar geometry computed too, not read from its table
+            solar_geometry.TABLES_ENABLED = False
+            cold_time, clearsky = best_time(cold, repeat)
+            solar_geometry.TABLES_ENABLED = ephemeris_tables.TABLES_ENABLED
+            geometry = solar_geometry.get_solar_geometry(
+                times, latitude, longitude, altitude)
+            model_time, _ = best_time(lambda: solar_geometry.get_clearsky(
+                site_location, times, model=model, solar_geometry=geometry,
+                tables=False), repeat)
+            # building the tables of the years, then timing the lookups
+            solar_geometry.get_clearsky(site_location, times, model=model)
+            table_time, _ = best_time(lambda: solar_geometry.get_clearsky(
+                site_location, times, model=model), repeat)
+            row = {'days': n_days, 'rows': len(times), 'model': model,
+                   'cold (s)': round(cold_time, 4),
+                   'model (s)': round(model_time, 4),
+                   'table (s)': round(table_time, 4)}
+            ghi = clearsky['ghi'].to_numpy()
+            pvlib_time, pvlib_clearsky = best_time(
+                lambda: site_location.get_clearsky(times, model=model),
+                repeat)
+            row['pvlib (s)'] = round(pvlib_time, 4)
+            row['max |diff| pvlib'] = float(np.nanmax(np.abs(
+                ghi - pvlib_clearsky['ghi'].to_numpy())))
+            diff = ghi[day] - reference['ghi'].to_numpy()[day]
+            row['GHI RMSE vs solis'] = round(float(np.sqrt(np.mean(diff ** 2))), 2)
+            row['GHI MBE vs solis'] = round(float(np.mean(diff)), 2)
+            rows.append(row)
+    ephemeris_tables.clear_tables()
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=float, nargs='+', default=[7, 30])
+    parser.add_argument('--resolution', type=int, default=10,
+                        help='time resolution in minutes')
+    parser.add_argument('--latitude', type=float, default=46.2)
+    parser.add_argument('--longitude', type=float, default=7.36)
+    parser.add_argument('--altitude', type=float, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--models', nargs='+', default=None,
+                        help='subset of the models to run')
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = run(args.days, args.resolution, args.latitude, args.longitude,
+                  args.altitude, args.repeat, args.models)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
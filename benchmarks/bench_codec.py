@@ -0,0 +1,92 @@
+"""
+Benchmark of the Arrow IPC codec against the json path previously used to
+ship the dataframes to the browser (DataFrame.to_json(orient='split') then
+json.loads + deserialize_multiindex_dataframe + pd.to_datetime in each
+callback).
+
+Run from the repository root:
+    python -m benchmarks.bench_codec --inputs 200 --days 30 --freq 1
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from data_store import codec
+
+
+def make_frame(n_inputs, days, freq_minutes, seed=0):
+    """Random 3-level (ag_level_2, ag_level_1, curve) I/V/P frame."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2021-01-01', periods=int(days * 1440 / freq_minutes),
+                          freq='{}min'.format(freq_minutes), name='datetime')
+    columns = pd.MultiIndex.from_product(
+        [['Inv{:03d}'.format(i) for i in range(n_inputs)], ['M1'],
+         ['I', 'P', 'V']], names=['ag_level_2', 'ag_level_1', 'curve'])
+    values = rng.random((len(index), len(columns)))
+    values[rng.random(values.shape) < 0.02] = np.nan
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def json_encode(df):
+    return df.to_json(orient='split', date_format='iso')
+
+
+def json_decode(dataframe_json):
+    """The deserialization done by the callbacks before the result store."""
+    def convert_index(json_obj):
+        to_tuples = [tuple(i) if isinstance(i, list) else i for i in json_obj]
+        if all(isinstance(i, list) for i in json_obj):
+            return pd.MultiIndex.from_tuples(to_tuples)
+        else:
+            return pd.Index(to_tuples)
+    json_dict = json.loads(dataframe_json)
+    columns = convert_index(json_dict['columns'])
+    index = convert_index(json_dict['index'])
+    df = pd.DataFrame(json_dict["data"], index, columns)
+    df.index = pd.to_datetime(df.index)
+    df.columns.names = ['ag_level_2', 'ag_level_1', 'curve']
+    df.index.names = ['datetime']
+    return df
+
+
+def best_of(func, arg, repeat):
+    """Best wall time over repeat runs, and the last result."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func(arg)
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def run(n_inputs, days, freq_minutes, repeat=3):
+    df = make_frame(n_inputs, days, freq_minutes)
+    rows = []
+    for name, encode, decode in [('json', json_encode, json_decode),
+                                 ('arrow ipc', codec.encode_frame,
+                                  codec.decode_frame)]:
+        t_encode, payload = best_of(encode, df, repeat)
+        t_decode, decoded = best_of(decode, payload, repeat)
+        rows.append({'codec': name,
+                     'encode (s)': round(t_encode, 4),
+                     'decode (s)': round(t_decode, 4),
+                     'payload (MB)': round(len(payload) / 1e6, 2),
+                     'equal': np.allclose(decoded.values, df.values,
+                                          equal_nan=True)})
+    return df.shape, pd.DataFrame(rows).set_index('codec')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--inputs', type=int, default=50)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--freq', type=int, default=1,
+                        help='time resolution in minutes')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    shape, results = run(args.inputs, args.days, args.freq, args.repeat)
+    print('Frame of {} rows x {} columns'.format(*shape))
+    print(results.to_string())
@@ -0,0 +1,67 @@
+"""
+Benchmark of the figure payload of the pre/post sanitation graphs with and
+without downsampling (see data_sanitization.downsampling).
+
+Run from the repository root:
+    python -m benchmarks.bench_downsampling --days 365 --freq 1
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from data_sanitization.downsampling import downsample
+
+
+def make_series(days, freq_minutes, seed=0):
+    """Random daily current profile with gaps and spikes."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2021-01-01', periods=int(days * 1440 / freq_minutes),
+                          freq='{}min'.format(freq_minutes), name='datetime')
+    hours = index.hour + index.minute / 60
+    values = np.clip(np.sin((hours.to_numpy() - 6) / 12 * np.pi), 0, None) * 18
+    values = values * rng.uniform(0.8, 1.0, len(index))
+    values[rng.random(len(index)) < 0.02] = np.nan
+    spikes = rng.random(len(index)) < 0.001
+    values[spikes] = values[spikes] * 5
+    return pd.Series(values, index=index)
+
+
+def figure_json(pre_sanitation, post_sanitation):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=pre_sanitation.index, y=pre_sanitation))
+    fig.add_trace(go.Scatter(x=post_sanitation.index, y=post_sanitation))
+    return fig.to_json()
+
+
+def run(days, freq_minutes):
+    pre_sanitation = make_series(days, freq_minutes)
+    post_sanitation = pre_sanitation.where(pre_sanitation < 20)
+    rows = []
+    for method in [None, 'minmax', 'lttb']:
+        start_time = time.perf_counter()
+        if method is None:
+            pre, post = pre_sanitation, post_sanitation
+        else:
+            pre = downsample(pre_sanitation, method=method)
+            post = downsample(post_sanitation, method=method)
+        payload = figure_json(pre, post)
+        rows.append({'method': method or 'full resolution',
+                     'points per trace': len(pre),
+                     'max kept': pre.max() == pre_sanitation.max(),
+                     'build (s)': round(time.perf_counter() - start_time, 3),
+                     'payload (MB)': round(len(payload) / 1e6, 2)})
+    return len(pre_sanitation), pd.DataFrame(rows).set_index('method')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--freq', type=int, default=1,
+                        help='time resolution in minutes')
+    args = parser.parse_args()
+
+    n_samples, results = run(args.days, args.freq)
+    print('Series of {} samples, 3 graphs per input'.format(n_samples))
+    print(results.to_string())
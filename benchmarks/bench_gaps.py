@@ -0,0 +1,121 @@
+"""
+Benchmark of the gap-length-aware imputation against the models alone.
+
+A plant workbook without missing values is generated (see
+benchmarks.synthetic_plant) and read as the pipeline does, keeping the
+daytime rows. Gaps of 1 to --short-gap samples are cut at random in every
+input, and a long gap in --long-inputs inputs. The gaps are then filled
+(best of --repeat runs) by:
+  - models: data_sanitization.models.predict_missing_data,
+  - hybrid: data_sanitization.gap_filling.impute_gaps.
+The number of inputs predicted by the models and the RMSE of the filled
+values against the generated ones are reported. The synthetic noise is
+white, which favours the models over the interpolation.
+
+Run from the repository root:
+    python -m benchmarks.bench_gaps --inverters 50 150 --days 30
+"""
+
+import io
+import os
+import time
+import argparse
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+warnings.filterwarnings('ignore')
+# models fitted on each upload only
+os.environ['DST_MODEL_REGISTRY'] = '0'
+
+from benchmarks.synthetic_plant import write_plant_workbook
+from benchmarks.bench_imputation import imputation_inputs
+from data_sanitization.models import predict_missing_data
+from data_sanitization.gap_filling import impute_gaps
+
+
+def best_time(func, repeat):
+    """Best wall time over repeat runs and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def cut_gaps(inv_data, array_info, short_gap=2, per_input=40, long_inputs=5,
+             long_gap=20, seed=0):
+    """inv_data with random gaps, and the (time x column) mask of the gaps."""
+    rng = np.random.default_rng(seed)
+    gaps = np.zeros((len(inv_data), len(array_info)), dtype=bool)
+    for j in range(len(array_info)):
+        for start in rng.choice(len(inv_data) - short_gap, per_input,
+                                replace=False):
+            gaps[start:start + rng.integers(1, short_gap + 1), j] = True
+    for j in rng.choice(len(array_info), long_inputs, replace=False):
+        start = rng.integers(0, len(inv_data) - long_gap)
+        gaps[start:start + long_gap, j] = True
+    columns = array_info.index.get_indexer(inv_data.columns.droplevel('curve'))
+    gaps = gaps[:, columns]
+    return inv_data.mask(gaps), gaps
+
+
+def run(inverters, mppts, days, short_gap=2, long_inputs=5, resolution=10,
+        repeat=3):
+    rows = []
+    for n_inverters in inverters:
+        workbook = write_plant_workbook(
+            io.BytesIO(), n_inverters=n_inverters, n_mppts=mppts, days=days,
+            resolution=resolution, missing_rate=0, outlier_rate=0).getvalue()
+        with contextlib.redirect_stdout(io.StringIO()):
+            inv_data, meteo_data, array_info, general_info = \
+                imputation_inputs(workbook)
+        irradiance = meteo_data.xs('G', axis=1, level='curve').iloc[:, 0]
+        inv_data = inv_data[(irradiance.reindex(inv_data.index) > 20).to_numpy()]
+        masked, gaps = cut_gaps(inv_data, array_info, short_gap,
+                                long_inputs=long_inputs)
+        methods = {
+            'models': lambda: predict_missing_data(masked, meteo_data,
+                                                   array_info, general_info),
+            'hybrid': lambda: impute_gaps(masked, meteo_data, array_info,
+                                          general_info, short_gap=short_gap)}
+        for method, func in methods.items():
+            with contextlib.redirect_stdout(io.StringIO()) as log:
+                wall, result = best_time(func, repeat)
+            predicted = [line for line in log.getvalue().splitlines()
+                         if line.startswith('Inputs predicted')]
+            row = {'inverters': n_inverters, 'rows': len(inv_data),
+                   'method': method, 'wall (s)': round(wall, 4),
+                   'inputs predicted': predicted[-1].split(': ')[1]
+                   if predicted else '{0} of {0}'.format(len(array_info))}
+            for curve in ['V', 'I']:
+                cells = gaps[:, inv_data.columns.get_level_values('curve')
+                             == curve]
+                error = (result.xs(curve, axis=1, level='curve').to_numpy()
+                         - inv_data.xs(curve, axis=1, level='curve').to_numpy())
+                row['RMSE ' + curve] = round(
+                    float(np.sqrt(np.nanmean(error[cells] ** 2))), 4)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--inverters', type=int, nargs='+', default=[50])
+    parser.add_argument('--mppts', type=int, default=2)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--short-gap', type=int, default=2)
+    parser.add_argument('--long-inputs', type=int, default=5)
+    parser.add_argument('--resolution', type=int, default=10,
+                        help='inverter data resolution in minutes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = run(args.inverters, args.mppts, args.days, args.short_gap,
+                  args.long_inputs, args.resolution, args.repeat)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
@@ -0,0 +1,105 @@
+"""
+Benchmark of the parallel imputation of the numpy engine.
+
+For each plant of the sweep a workbook is generated (see
+benchmarks.synthetic_plant) and read as the pipeline does, then
+predict_missing_data is timed (best of --repeat runs, after a warm-up run
+creating the pool) serially and with each number of --workers. The speedup
+against the serial run and the largest difference of the predictions are
+reported. The speedup is bounded by the number of CPUs of the machine.
+
+Run from the repository root:
+    python -m benchmarks.bench_imputation --inverters 50 150 --workers 2 4
+"""
+
+import io
+import os
+import time
+import argparse
+import itertools
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+warnings.filterwarnings('ignore')
+
+from benchmarks.synthetic_plant import write_plant_workbook
+from data_input.workbook import WorkbookLoader
+from data_input.read_system_info import gather_inputs
+from data_input.read_meteo_data import read_weather_data
+from data_input.read_operational_data import read_inverter_data
+from data_sanitization.models import predict_missing_data
+from data_sanitization.filtering import multiindex_irradiance_filter
+from data_sanitization.filtering import multiindex_current_filter
+from data_sanitization.filtering import multiindex_voltage_filter
+
+
+def best_time(func, repeat):
+    """Best wall time over repeat runs and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def imputation_inputs(workbook_bytes):
+    """Arguments of predict_missing_data for a plant workbook."""
+    workbook = WorkbookLoader(io.BytesIO(workbook_bytes))
+    array_info, general_info = gather_inputs(workbook)
+    inverter_data, _ = read_inverter_data(general_info, workbook)
+    meteo_data, _ = read_weather_data(general_info, workbook)
+    inverter_data = multiindex_voltage_filter(
+        multiindex_current_filter(inverter_data, array_info), array_info)
+    meteo_data = multiindex_irradiance_filter(meteo_data, irrad_low=0,
+                                              irrad_high=1200)
+    return inverter_data, meteo_data, array_info, general_info
+
+
+def run(inverters, mppts, days, workers, resolution=10, repeat=3):
+    rows = []
+    for n_inverters, n_days in itertools.product(inverters, days):
+        workbook = write_plant_workbook(
+            io.BytesIO(), n_inverters=n_inverters, n_mppts=mppts,
+            days=n_days, resolution=resolution).getvalue()
+        with contextlib.redirect_stdout(io.StringIO()):
+            args = imputation_inputs(workbook)
+            serial_time, serial = best_time(
+                lambda: predict_missing_data(*args, workers=1), repeat)
+        for n_workers in [1] + list(workers):
+            with contextlib.redirect_stdout(io.StringIO()):
+                # warm-up, the pool processes are started once
+                predict_missing_data(*args, workers=n_workers)
+                wall, result = best_time(
+                    lambda: predict_missing_data(*args, workers=n_workers),
+                    repeat)
+            rows.append({'inverters': n_inverters, 'days': n_days,
+                         'inputs': len(args[2]), 'rows': len(args[0]),
+                         'workers': n_workers, 'wall (s)': round(wall, 4),
+                         'speedup': round(serial_time / wall, 2),
+                         'max |diff|': float(np.nanmax(np.abs(
+                             result.to_numpy() - serial.to_numpy())))})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--inverters', type=int, nargs='+', default=[50, 150])
+    parser.add_argument('--mppts', type=int, default=2)
+    parser.add_argument('--days', type=float, nargs='+', default=[30])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[2, os.cpu_count() or 2])
+    parser.add_argument('--resolution', type=int, default=10,
+                        help='inverter data resolution in minutes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = run(args.inverters, args.mppts, args.days, args.workers,
+                  args.resolution, args.repeat)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print('CPUs: {}'.format(os.cpu_count()))
+    print(results.to_string(index=False))
@@ -0,0 +1,163 @@
+"""
+Benchmark of the pipeline stages on synthetic plants of growing size.
+
+For each plant of the sweep a workbook is generated (see
+benchmarks.synthetic_plant), then each public function of the pipeline is
+timed (best of --repeat runs) and its peak memory allocation measured with
+tracemalloc in a separate run.
+
+Run from the repository root:
+    python -m benchmarks.bench_stages --inverters 2 8 32 --days 7 30
+"""
+
+import io
+import time
+import argparse
+import tempfile
+import itertools
+import warnings
+import tracemalloc
+import pandas as pd
+warnings.filterwarnings('ignore')
+
+from benchmarks.synthetic_plant import write_plant_workbook
+from data_input.workbook import WorkbookLoader
+from data_input.clean_using_pecos import pecos_clean
+from data_input.read_system_info import gather_inputs
+from data_input.read_meteo_data import read_weather_data
+from data_input.read_operational_data import read_inverter_data
+from data_input.poa_irradiance import transpose_irradiance
+from data_sanitization.models import predict_missing_data
+from data_sanitization.clear_sky_irradiance import clearsky_irradiance
+from data_sanitization.eliminate_night_values import eliminate_nightvalues
+from data_sanitization.filtering import multiindex_irradiance_filter
+from data_sanitization.filtering import multiindex_current_filter
+from data_sanitization.filtering import multiindex_voltage_filter
+from data_sanitization.qc_flags import (CURRENT, VOLTAGE, qc_flags,
+                                        current_limits, voltage_limits)
+from data_store.result_store import ResultStore
+
+
+def measure(func, repeat):
+    """Best wall time over repeat runs and peak traced memory of one run."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 1024 ** 2, result
+
+
+def stage_functions(workbook_bytes, store):
+    """
+    The benchmarked stages of a plant, in pipeline order. Each stage gets the
+    outputs of the previous ones, computed once.
+    """
+    workbook = WorkbookLoader(io.BytesIO(workbook_bytes))
+    array_info, general_info = gather_inputs(workbook)
+    raw_inverter = workbook.sheet('Inverter Data', skiprows=[0])
+    inverter_data, _ = read_inverter_data(general_info, workbook)
+    meteo_data, _ = read_weather_data(general_info, workbook)
+    # measured POA relabelled as GHI for the transposition
+    meteo_ghi = meteo_data.rename(columns={'G': 'GHI'}, level='curve')
+    csky = clearsky_irradiance(times=inverter_data.index,
+                               general_info=general_info,
+                               array_info=array_info, convertGHI_toPOA=True)
+    meteo_filtered = multiindex_irradiance_filter(meteo_data, irrad_low=0,
+                                                  irrad_high=1200)
+    inverter_csky = eliminate_nightvalues(inverter_data, cs_data=csky,
+                                          threshold=10)
+    inverter_filtered = multiindex_voltage_filter(
+        multiindex_current_filter(inverter_csky, array_info), array_info)
+    frames = {'inv_data': inverter_data, 'inv_data_csky': inverter_csky,
+              'meteo_data': meteo_data}
+
+    def parse():
+        loader = WorkbookLoader(io.BytesIO(workbook_bytes))
+        gather_inputs(loader)
+        loader.sheet('Inverter Data', skiprows=[0])
+        loader.sheet('Weather Data', skiprows=[0])
+
+    def serialization():
+        result_id = store.write(frames)
+        store.read_frames(result_id, list(frames))
+
+    return inverter_data.shape, [
+        ('parse', parse),
+        ('pecos_clean', lambda: pecos_clean(
+            raw_inverter, general_info['date_format_inverter'],
+            general_info['inverter_time_resolution'])),
+        ('transpose_irradiance', lambda: transpose_irradiance(
+            meteo_ghi, general_info, array_info)),
+        ('clearsky_irradiance', lambda: clearsky_irradiance(
+            times=inverter_data.index, general_info=general_info,
+            array_info=array_info, convertGHI_toPOA=True)),
+        ('multiindex_irradiance_filter', lambda: multiindex_irradiance_filter(
+            meteo_data, irrad_low=0, irrad_high=1200)),
+        ('eliminate_nightvalues', lambda: eliminate_nightvalues(
+            inverter_data, cs_data=csky, threshold=10)),
+        ('multiindex_current_filter', lambda: multiindex_current_filter(
+            inverter_csky, array_info)),
+        ('multiindex_voltage_filter', lambda: multiindex_voltage_filter(
+            inverter_csky, array_info)),
+        # both filters above in one pass, as the pipeline runs them
+        ('qc_flags', lambda: qc_flags(inverter_csky, [
+            (CURRENT, 'I', 0, current_limits(array_info)),
+            (VOLTAGE, 'V', 0, voltage_limits(array_info))])),
+        ('predict_missing_data', lambda: predict_missing_data(
+            inverter_filtered, meteo_filtered, array_info, general_info)),
+        ('predict_missing_data (sklearn)', lambda: predict_missing_data(
+            inverter_filtered, meteo_filtered, array_info, general_info,
+            engine='sklearn')),
+        ('serialization', serialization),
+    ]
+
+
+def run(inverters, mppts, days, resolution, meteo_resolution, repeat=3,
+        stages=None):
+    store = ResultStore(root=tempfile.mkdtemp(prefix='bench_stages_'))
+    rows = []
+    for n_inverters, n_days in itertools.product(inverters, days):
+        workbook = write_plant_workbook(
+            io.BytesIO(), n_inverters=n_inverters, n_mppts=mppts,
+            days=n_days, resolution=resolution,
+            meteo_resolution=meteo_resolution).getvalue()
+        shape, functions = stage_functions(workbook, store)
+        for name, func in functions:
+            if stages and name not in stages:
+                continue
+            wall, peak, _ = measure(func, repeat)
+            rows.append({'inverters': n_inverters, 'days': n_days,
+                         'rows': shape[0], 'columns': shape[1],
+                         'stage': name, 'wall (s)': round(wall, 4),
+                         'peak memory (MB)': round(peak, 1)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--inverters', type=int, nargs='+', default=[2, 8])
+    parser.add_argument('--mppts', type=int, default=2)
+    parser.add_argument('--days', type=float, nargs='+', default=[7])
+    parser.add_argument('--resolution', type=int, default=10,
+                        help='inverter data resolution in minutes')
+    parser.add_argument('--meteo-resolution', type=int, default=5,
+                        help='weather data resolution in minutes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', default=None,
+                        help='subset of the stages to run')
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = run(args.inverters, args.mppts, args.days, args.resolution,
+                  args.meteo_resolution, args.repeat, args.stages)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.pivot_table(index='stage', columns=['inverters', 'days'],
+                              values=['wall (s)', 'peak memory (MB)'],
+                              sort=False).to_string())
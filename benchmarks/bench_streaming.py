@@ -0,0 +1,142 @@
+"""
+Benchmark of the streaming imputation on long histories.
+
+For each duration, the inverter and weather frames of a plant are generated
+in memory (1 minute data by default) with random gaps, then the gaps are
+predicted and the result written to an Arrow file of the result store:
+  - batch: predict_missing_data on the whole data, spread over --workers
+    processes, then codec.write_frame,
+  - stream: predict_missing_data by chunks of rows, spread over --workers
+    processes, each chunk written by a codec.FrameWriter.
+The wall time and the peak memory allocated in the calling process during a
+run (tracemalloc, the generated frames excluded) are reported, with the largest difference of
+the two files read back.
+
+Run from the repository root:
+    python -m benchmarks.bench_streaming --inputs 100 --days 30 90 180
+"""
+
+import io
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+warnings.filterwarnings('ignore')
+
+from data_store import codec
+from data_sanitization.models import predict_missing_data
+
+
+def make_frames(n_inputs, days, resolution=1, missing=0.05, seed=0):
+    """Inverter and weather frames, array_info and general_info of a plant."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2021-01-01', periods=int(days * 1440 / resolution),
+                          freq='{}min'.format(resolution), name='datetime')
+    hours = (times.hour + times.minute / 60).to_numpy()
+    g = np.clip(1000 * np.sin(np.pi * (hours - 6) / 12), 0, None)
+    keys = [('Inv{:03d}'.format(i // 2 + 1), 'M{}'.format(i % 2 + 1))
+            for i in range(n_inputs)]
+
+    def frame(curves):
+        columns = pd.MultiIndex.from_tuples(
+            [key + (curve,) for key in keys for curve in curves],
+            names=['ag_level_2', 'ag_level_1', 'curve'])
+        return pd.DataFrame(np.empty((len(times), len(columns))),
+                            index=times, columns=columns)
+
+    inv_data, meteo_data = frame(['I', 'P', 'V']), frame(['G', 'Tamb', 'Tmod'])
+    for j, key in enumerate(keys):
+        noise = rng.uniform(0.95, 1.0, (2, len(times)))
+        current = 8e-3 * g * noise[0]
+        voltage = np.where(g > 10, 600 * noise[1], 0)
+        gaps = rng.random((2, len(times))) < missing
+        inv_data[key + ('I',)] = np.where(gaps[0], np.nan, current)
+        inv_data[key + ('V',)] = np.where(gaps[1], np.nan, voltage)
+        inv_data[key + ('P',)] = current * voltage
+        meteo_data[key + ('G',)] = g
+        meteo_data[key + ('Tamb',)] = 15 + g / 100
+        meteo_data[key + ('Tmod',)] = 15 + g / 30
+    array_info = pd.DataFrame(
+        {'input_name': ['{}-{}'.format(*key) for key in keys]},
+        index=pd.MultiIndex.from_tuples(keys,
+                                        names=['ag_level_2', 'ag_level_1']))
+    general_info = {'meteo_time_resolution': resolution,
+                    'inverter_time_resolution': resolution}
+    return inv_data, meteo_data, array_info, general_info
+
+
+def measure(func):
+    """
+    Peak memory (MB) allocated by func then its wall time, in two runs as
+    tracemalloc slows the allocations down. The pool processes are started
+    by the first run.
+    """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    start_time = time.perf_counter()
+    func()
+    wall = time.perf_counter() - start_time
+    return wall, peak
+
+
+def run(n_inputs, days, resolution=1, chunk_rows=None, workers=1):
+    rows = []
+    folder = tempfile.mkdtemp(prefix='bench_streaming_')
+    for n_days in days:
+        args = make_frames(n_inputs, n_days, resolution)
+        batch_path = os.path.join(folder, 'batch.arrow')
+        stream_path = os.path.join(folder, 'stream.arrow')
+
+        def batch():
+            result = predict_missing_data(*args, chunk_rows=len(args[0]),
+                                          workers=workers)
+            codec.write_frame(result, batch_path)
+
+        def stream():
+            with codec.FrameWriter(stream_path) as writer:
+                predict_missing_data(*args, chunk_rows=chunk_rows,
+                                     sink=writer.write, workers=workers)
+
+        for method, func in [('batch', batch), ('stream', stream)]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                wall, peak = measure(func)
+            rows.append({'inputs': n_inputs, 'days': n_days,
+                         'rows': len(args[0]), 'method': method,
+                         'wall (s)': round(wall, 3),
+                         'peak (MB)': round(peak, 1),
+                         'input frames (MB)': round(
+                             (args[0].memory_usage().sum()
+                              + args[1].memory_usage().sum()) / 1024 ** 2,
+                             1)})
+        rows[-1]['max |diff|'] = float(np.nanmax(np.abs(
+            codec.read_frame(batch_path).to_numpy()
+            - codec.read_frame(stream_path).to_numpy())))
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--inputs', type=int, default=100)
+    parser.add_argument('--days', type=float, nargs='+', default=[30, 90])
+    parser.add_argument('--resolution', type=int, default=1,
+                        help='time resolution in minutes')
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help='rows per chunk, see IMPUTATION_CHUNK_CELLS')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes the chunks are spread over')
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = run(args.inputs, args.days, args.resolution, args.chunk_rows,
+                  args.workers)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
@@ -0,0 +1,114 @@
+"""
+Benchmark of the timestamp regularization of the data sheets.
+
+A sheet of 1 minute data (a year by default) is generated with a date column
+in text, as read from a workbook, and some duplicate, missing and off-grid
+timestamps. It is cleaned (best of --repeat runs) by:
+  - pecos: the previous pecos_clean, rounding the parsed index then running
+    pecos check_timestamp,
+  - native: data_input.clean_using_pecos.regularize_timestamps.
+Both include the parsing of the dates. The agreement of the cleaned frames
+and the counts of the native report are printed.
+
+Run from the repository root:
+    python -m benchmarks.bench_timestamps --days 365 --columns 8
+"""
+
+import io
+import time
+import argparse
+import contextlib
+import warnings
+import numpy as np
+import pandas as pd
+warnings.filterwarnings('ignore')
+
+from data_input.clean_using_pecos import regularize_timestamps
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def best_time(func, repeat):
+    """Best wall time over repeat runs and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def pecos_path(df_in, date_format, time_frequency):
+    """pecos_clean as it was before regularize_timestamps."""
+    import pecos
+    df = df_in.copy()
+    df.iloc[:, 0] = pd.to_datetime(df.iloc[:, 0], format=date_format)
+    df = df.set_index(df.iloc[:, 0])
+    df = df.iloc[:, 1:]
+    df.index = df.index.round(str(time_frequency) + 'min')
+    pecos.logger.initialize()
+    pm = pecos.monitoring.PerformanceMonitoring()
+    pm.add_dataframe(df)
+    pm.check_timestamp(time_frequency*60)
+    return pm.cleaned_data
+
+
+def make_sheet(days, columns, resolution=1, duplicates=0.01, missing=0.01,
+               off_grid=0.05, seed=0):
+    """Sheet of a date column and float columns, with timestamp defects."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2021-01-01', periods=int(days * 1440 / resolution),
+                          freq='{}min'.format(resolution))
+    times = times[rng.random(len(times)) >= missing]
+    # within a quarter of the resolution, rounded back to the grid
+    jitter = rng.random(len(times)) < off_grid
+    times = times + pd.to_timedelta(
+        np.where(jitter, rng.integers(-resolution * 15, resolution * 15,
+                                      len(times)), 0), unit='s')
+    # duplicate rows next to the original, as a logger writing twice
+    order = np.sort(np.concatenate([
+        np.arange(len(times)),
+        rng.choice(len(times), int(duplicates * len(times)))]))
+    times = times[order]
+    sheet = pd.DataFrame(rng.random((len(times), columns)) * 1000,
+                         columns=range(1, columns + 1))
+    sheet.insert(0, 0, times.strftime(DATE_FORMAT))
+    return sheet
+
+
+def run(days, columns, resolution=1, repeat=3):
+    sheet = make_sheet(days, columns, resolution)
+    native_time, (native, report) = best_time(
+        lambda: regularize_timestamps(sheet, DATE_FORMAT, resolution), repeat)
+    with contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        pecos_time, reference = best_time(
+            lambda: pecos_path(sheet, DATE_FORMAT, resolution), repeat)
+    row = {'days': days, 'rows': len(sheet), 'columns': columns,
+           'pecos (s)': round(pecos_time, 3),
+           'native (s)': round(native_time, 3),
+           'speedup': round(pecos_time / native_time, 1),
+           'same index': reference.index.equals(native.index),
+           'same values': bool(np.array_equal(
+               reference.to_numpy(dtype=float), native.to_numpy(),
+               equal_nan=True))}
+    row.update(report)
+    return pd.DataFrame([row])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=float, nargs='+', default=[365])
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--resolution', type=int, default=1,
+                        help='time resolution in minutes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help='csv file to save the results to')
+    args = parser.parse_args()
+
+    results = pd.concat([run(days, args.columns, args.resolution, args.repeat)
+                         for days in args.days], ignore_index=True)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
@@ -0,0 +1,224 @@
+"""
+Generator of synthetic plant workbooks in the layout read by
+data_input.read_system_info.gather_inputs and the data readers: a
+'General Info' sheet, an 'Array Info' sheet with one row per input, and the
+'Inverter Data' / 'Weather Data' sheets (a title row, then integer column
+headers referenced by the column numbers of 'Array Info').
+
+Run from the repository root:
+    python -m benchmarks.synthetic_plant plant.xlsx --inverters 10 --mppts 2 --days 30
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Trailing columns of 'Array Info' dropped by gather_inputs
+DATA_COLUMNS = ['datetime_column', 'current_column', 'voltage_column',
+                'power_column', 'datetime_column_meteo', 'irradiance_column',
+                'temperature_column', 'modtemperature_column',
+                'wind_speed_column', 'humidity_column', 'comments']
+
+# Module and string of every input, close to the example workbook
+MODULE = {'installed_capacity': 11.79, 'number_of_modules': 38,
+          'number_of_strings': 2, 'modules_per_string': 19,
+          'i_mpp': 9.29, 'v_mpp': 33.4, 'i_sc': 9.77, 'v_oc': 40.5,
+          'nominal_efficiency': 0.189, 'module_area': 1.636,
+          'gamma': -0.4, 'beta': -0.34, 'alpha': 0.06,
+          'inverter_eff': 0.982, 'pollution_red_factor': 0.98,
+          'expected_degradation': 0.5}
+
+
+def sun_profile(times, latitude):
+    """Clear-sky like irradiance in W/m2 with a seasonal day length."""
+    day_of_year = times.dayofyear.to_numpy()
+    hours = times.hour.to_numpy() + times.minute.to_numpy() / 60
+    declination = 23.44 * np.sin(2 * np.pi * (day_of_year - 81) / 365)
+    # half day length in hours from the sunrise equation
+    cos_omega = -np.tan(np.radians(latitude)) * np.tan(np.radians(declination))
+    half_day = np.degrees(np.arccos(np.clip(cos_omega, -1, 1))) / 15
+    elevation = np.cos(np.radians(latitude - declination))
+    shape = np.cos(np.pi / 2 * (hours - 12) / half_day)
+    return 1000 * elevation * np.clip(shape, 0, None)
+
+
+def corrupt(values, rng, missing_rate, outlier_rate):
+    """Set missing values to NaN and scale outliers by 5."""
+    values = values.copy()
+    values[rng.random(len(values)) < missing_rate] = np.nan
+    outliers = rng.random(len(values)) < outlier_rate
+    values[outliers] = values[outliers] * 5
+    return values
+
+
+def plant_sheets(n_inverters=3, n_mppts=2, days=7, resolution=10,
+                 meteo_resolution=None, missing_rate=0.02, outlier_rate=0.01,
+                 irradiance_type='POA', start='2021-06-01', latitude=46.2,
+                 longitude=7.36, altitude=500, time_zone=1, seed=0):
+    """
+    Build the four sheets of a synthetic plant.
+
+    Parameters
+    ----------
+    n_inverters : int, default 3
+        Number of inverters (ag_level_2).
+    n_mppts : int, default 2
+        Number of MPPT inputs per inverter (ag_level_1).
+    days : float, default 7
+        Duration of the data.
+    resolution : int, default 10
+        Time resolution of the inverter data in minutes.
+    meteo_resolution : int, optional
+        Time resolution of the weather data, resolution by default.
+    missing_rate : float, default 0.02
+        Fraction of the current and voltage values set to NaN.
+    outlier_rate : float, default 0.01
+        Fraction of the current and voltage values multiplied by 5.
+    irradiance_type : str, default 'POA'
+        'POA' or 'GHI', type of the measured irradiance.
+    start : str, default '2021-06-01'
+        First timestamp.
+    latitude, longitude, altitude, time_zone : float
+        Location of the site.
+    seed : int, default 0
+        Seed of the random generator.
+
+    Returns
+    -------
+    sheets : dict of Pandas DataFrame
+        'General Info', 'Array Info', 'Inverter Data' and 'Weather Data',
+        the data sheets without their title row.
+    """
+    rng = np.random.default_rng(seed)
+    meteo_resolution = meteo_resolution or resolution
+    times = pd.date_range(start, periods=int(days * 1440 / resolution),
+                          freq='{}min'.format(resolution))
+    meteo_times = pd.date_range(start,
+                                periods=int(days * 1440 / meteo_resolution),
+                                freq='{}min'.format(meteo_resolution))
+
+    irradiance = sun_profile(meteo_times, latitude) * rng.uniform(
+        0.7, 1.0, len(meteo_times))
+    t_amb = 15 + 10 * irradiance / 1000
+    t_mod = t_amb + irradiance * np.exp(-3.56)
+    weather = pd.DataFrame({0: meteo_times.strftime(DATE_FORMAT),
+                            1: irradiance, 2: t_amb, 3: t_mod})
+    # irradiance seen by the inverters at their own resolution
+    g_inv = pd.Series(irradiance, meteo_times).reindex(
+        meteo_times.union(times)).interpolate().reindex(times).to_numpy()
+
+    inverter = {0: times.strftime(DATE_FORMAT)}
+    rows = []
+    column = 1
+    for i in range(n_inverters):
+        for m in range(n_mppts):
+            ag_level_2, ag_level_1 = 'Inv{:02d}'.format(i + 1), 'M{}'.format(m + 1)
+            input_name = '{}-{}'.format(ag_level_2, ag_level_1)
+            current = (MODULE['i_mpp'] * MODULE['number_of_strings'] * g_inv
+                       / 1000 * rng.uniform(0.95, 1.0, len(times)))
+            voltage = np.where(g_inv > 10, MODULE['v_mpp']
+                               * MODULE['modules_per_string']
+                               * rng.uniform(0.95, 1.0, len(times)), 0)
+            current = corrupt(current, rng, missing_rate, outlier_rate)
+            voltage = corrupt(voltage, rng, missing_rate, outlier_rate)
+            inverter[column] = current
+            inverter[column + 1] = voltage
+            inverter[column + 2] = current * voltage
+            row = {'ag_level_2': ag_level_2, 'ag_level_1': ag_level_1,
+                   'inverter_ID': ag_level_2, 'input_name': input_name,
+                   'sensor_ID': input_name}
+            row.update(MODULE)
+            row.update({'surface_tilt': [6, 20, 30][i % 3],
+                        'surface_azimuth': [244, 180, 160][m % 3],
+                        'datetime_column': 0, 'current_column': column,
+                        'voltage_column': column + 1,
+                        'power_column': column + 2,
+                        'datetime_column_meteo': 0, 'irradiance_column': 1,
+                        'temperature_column': 2, 'modtemperature_column': 3,
+                        'wind_speed_column': np.nan,
+                        'humidity_column': np.nan, 'comments': ''})
+            rows.append(row)
+            column += 3
+    # the physical columns first, the data columns last
+    array_info = pd.DataFrame(rows)
+    array_info = array_info[[c for c in array_info if c not in DATA_COLUMNS]
+                            + DATA_COLUMNS]
+
+    general_info = pd.DataFrame([{
+        'system_name': 'Synthetic plant', 'address': 'Synthetic street 1',
+        'city': 'Sion', 'system_total_installed_capacity':
+            round(MODULE['installed_capacity'] * len(rows), 2),
+        'system_age': 2, 'latitude': latitude, 'longitude': longitude,
+        'altitude': altitude, 'time_zone': time_zone,
+        'electricity_price': 0.2, 'monetary_unit': 'CHF',
+        'kg_CO2_per_kWh': 0.1, 'site_photo': 'No', 'meteo_info': 'Yes',
+        'irradiance_type': irradiance_type, 'date_format': DATE_FORMAT,
+        'date_format_meteo': DATE_FORMAT, 'meteo_freq': meteo_resolution,
+        'inv_freq': resolution}])
+
+    return {'General Info': general_info, 'Array Info': array_info,
+            'Inverter Data': pd.DataFrame(inverter), 'Weather Data': weather}
+
+
+def write_plant_workbook(path, **kwargs):
+    """
+    Write a synthetic plant workbook.
+
+    Parameters
+    ----------
+    path : str or file-like
+        Excel file to write.
+    **kwargs
+        Options of plant_sheets.
+
+    Returns
+    -------
+    path : str or file-like
+        The written workbook.
+    """
+    sheets = plant_sheets(**kwargs)
+    with pd.ExcelWriter(path) as writer:
+        sheets['General Info'].to_excel(writer, sheet_name='General Info',
+                                        index=False)
+        sheets['Array Info'].to_excel(writer, sheet_name='Array Info',
+                                      index=False)
+        for name, title in [('Inverter Data', 'Inverter data'),
+                            ('Weather Data', 'Weather data')]:
+            # title row skipped by the readers, then the column numbers
+            pd.DataFrame([[title]]).to_excel(writer, sheet_name=name,
+                                             index=False, header=False)
+            sheets[name].to_excel(writer, sheet_name=name, index=False,
+                                  startrow=1)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='excel file to write')
+    parser.add_argument('--inverters', type=int, default=3)
+    parser.add_argument('--mppts', type=int, default=2)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--resolution', type=int, default=10,
+                        help='inverter data resolution in minutes')
+    parser.add_argument('--meteo-resolution', type=int, default=None,
+                        help='weather data resolution in minutes')
+    parser.add_argument('--missing', type=float, default=0.02,
+                        help='fraction of missing values')
+    parser.add_argument('--outliers', type=float, default=0.01,
+                        help='fraction of outliers')
+    parser.add_argument('--irradiance-type', choices=['POA', 'GHI'],
+                        default='POA')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_plant_workbook(args.path, n_inverters=args.inverters,
+                         n_mppts=args.mppts, days=args.days,
+                         resolution=args.resolution,
+                         meteo_resolution=args.meteo_resolution,
+                         missing_rate=args.missing,
+                         outlier_rate=args.outliers,
+                         irradiance_type=args.irradiance_type,
+                         seed=args.seed)
+    print('Wrote {}'.format(args.path))
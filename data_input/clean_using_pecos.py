@@ -1,18 +1,102 @@
 """
-This notebook reads the weather data.
+This notebook regularizes the timestamps of the data sheets.
 @author: DurejaBhavya
 """
 
 
-import pecos
+import numpy as np
 import pandas as pd
+from data_pipeline.profiling import profile_stage
 
 
-def pecos_clean(df_in, date_format, time_frequency):
+def _round_ns(epochs, step):
+    """
+    Round int64 epochs to a multiple of step, half to even as
+    pandas.DatetimeIndex.round does. Returns the rounded epochs and the
+    number of epochs which were not on a multiple of step.
+    """
+    quotient, remainder = np.divmod(epochs, step)
+    up = (2 * remainder > step) | ((2 * remainder == step) & (quotient % 2 == 1))
+    return (quotient + up) * step, int(np.count_nonzero(remainder))
+
+
+def regularize_timestamps(df_in, date_format, time_frequency):
+    """
+    This function regularizes the timestamps of a time series dataframe:
+    the timestamps are rounded to the time resolution, sorted, the duplicate
+    timestamps are removed (the first row is kept) and the missing ones are
+    inserted with nan in each column, in one sort and one reindex on the
+    int64 epochs. Note : the first column should be datetime.
+
+    Parameters
+    ----------
+    df_in : dataframe
+        the dataframe to be checked for missing/ duplicate timestamps
+    date_format : string for example "Y%-m%-d%"
+        date format of the first column of the dataframe
+    time_frequency : float (in minutes)
+        The time resolution of the dataframe
+
+    Returns
+    -------
+    df_cleaned : dataframe
+        the dataframe with index with no missing/duplicate timestamp.
+    report : dict
+        Number of rows read ('rows'), of rows without a timestamp which
+        were dropped ('invalid'), of timestamps rounded to the time
+        resolution ('off_grid'), of timestamps out of order ('unsorted'),
+        of duplicate timestamps dropped ('duplicates'), of missing
+        timestamps inserted ('missing') and of gaps they form ('gaps').
+    """
+    times = pd.to_datetime(df_in.iloc[:, 0], format=date_format)
+    values = df_in.iloc[:, 1:]
+    step = int(round(time_frequency * 60 * 10 ** 9))
+    report = {'rows': len(df_in)}
+
+    valid = times.notna().to_numpy()
+    report['invalid'] = int(len(valid) - np.count_nonzero(valid))
+    epochs = times.to_numpy(dtype='datetime64[ns]').view(np.int64)[valid]
+    epochs, report['off_grid'] = _round_ns(epochs, step)
+    report['unsorted'] = int(np.count_nonzero(np.diff(epochs) < 0))
+
+    # one stable sort, the first row of each timestamp is kept
+    order = np.argsort(epochs, kind='stable')
+    epochs = epochs[order]
+    first = np.ones(len(epochs), dtype=bool)
+    first[1:] = epochs[1:] != epochs[:-1]
+    report['duplicates'] = int(len(epochs) - np.count_nonzero(first))
+    rows = np.flatnonzero(valid)[order[first]]
+    epochs = epochs[first]
+
+    # positions of the rows on the regular grid from the first timestamp
+    if len(epochs):
+        positions = (epochs - epochs[0]) // step
+        n_rows = int(positions[-1]) + 1
+        index = pd.date_range(pd.Timestamp(epochs[0]), periods=n_rows,
+                              freq=pd.Timedelta(step))
+    else:
+        positions, n_rows, index = epochs, 0, pd.DatetimeIndex([])
+    report['missing'] = n_rows - len(epochs)
+    report['gaps'] = int(np.count_nonzero(np.diff(positions) > 1))
+
+    if all(np.issubdtype(dtype, np.number) for dtype in values.dtypes):
+        data = np.full((n_rows, values.shape[1]), np.nan)
+        data[positions] = values.to_numpy(dtype=float)[rows]
+        df_cleaned = pd.DataFrame(data, index=index, columns=values.columns)
+    else:
+        # text columns, reindexed by pandas
+        df_cleaned = values.iloc[rows].set_axis(index[positions], axis=0)
+        df_cleaned = df_cleaned.reindex(index)
+    return df_cleaned, report
+
+
+@profile_stage()
+def pecos_clean(df_in, date_format, time_frequency, report=None):
     """
     This function helps to clean a time series dataframe by removing duplicate
     indices or creating missing timestamps (with nan in each columns) to get a
-    continuous dataframe. Note : the first column should be datetime.
+    continuous dataframe, as pecos check_timestamp did (see
+    regularize_timestamps). Note : the first column should be datetime.
 
     Parameters
     ----------
@@ -22,32 +106,19 @@ def pecos_clean(df_in, date_format, time_frequency):
         date format of the first column of the dataframe
     time_frequency : float (in minutes)
         The time resolution of the dataframe
+    report : dict, optional
+        Updated with the counts of duplicate, missing and off-grid
+        timestamps of regularize_timestamps.
 
     Returns
     -------
     df_cleaned : dataframe
         the dataframe with index with no missing/duplicate timestamp.
     """
-
-    df = df_in.copy()
-    df.iloc[:, 0] = pd.to_datetime(df.iloc[:, 0], format=date_format)
-    df = df.set_index(df.iloc[:, 0])
-    df = df.iloc[:, 1:]
-    df.index = df.index.round(str(time_frequency) + 'min')
-
-    # initializing pecos
-    pecos.logger.initialize()
-    pm = pecos.monitoring.PerformanceMonitoring()
-    # adding dataframe to be cleaned
-    pm.add_dataframe(df)
-    # Time frequency needs to be specified in seconds
-    pm.check_timestamp(time_frequency*60)
-    # # Prints the errors found with timestamps
-    # print(pm.test_results)
-    # pecos.io.write_test_results(pm.test_results)
-    # pecos.io.write_monitoring_report(pm.data, pm.test_results)
-    # Saving the clean dataframe
-    df_cleaned = pm.cleaned_data
-    print('Cleaned Data using Pecos')
+    df_cleaned, counts = regularize_timestamps(df_in, date_format,
+                                               time_frequency)
+    if report is not None:
+        report.update(counts)
+    print('Cleaned timestamps: {}'.format(counts))
 
     return df_cleaned
@@ -6,6 +6,7 @@ This method creates a irradiance clear-sky curve in the PoA
 
 import pandas as pd
 from pvlib import location, irradiance
+from data_sanitization.solar_geometry import get_clearsky, get_solar_geometry
 
 
 def get_clearsky_gpoa(times, latitude, longitude, altitude,
@@ -116,10 +117,12 @@ def get_irradiance(times, surface_tilt, surface_azimuth, site_location,
     # Generate clearsky data using the simplified_solis model,
     # The get_clearsky method returns a dataframe with values for GHI, DNI,
     # and DHI
-    clearsky = site_location.get_clearsky(times=times,
-                                          model=model)
-    # Get solar azimuth and zenith to pass to the transposition function
-    solar_position = site_location.get_solarposition(times=times)
+    # Get solar azimuth and zenith from the shared solar geometry cache
+    solar_position = get_solar_geometry(times, site_location.latitude,
+                                        site_location.longitude,
+                                        site_location.altitude)
+    clearsky = get_clearsky(site_location, times, model=model,
+                            solar_geometry=solar_position)
     # Use the get_total_irradiance function to transpose the GHI to POA
     POA_irradiance = irradiance.get_total_irradiance(
         surface_tilt=surface_tilt,
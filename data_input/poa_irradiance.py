@@ -5,14 +5,85 @@ Created on Mon Dec 18 08:18:58 2021
 @author: Krithika
 """
 
+import numpy as np
 import pandas as pd
 from pvlib.irradiance import erbs
 from pvlib.irradiance import dirint
-from pvlib.location import Location
 from pvlib.irradiance import aoi_projection
 from pvlib.irradiance import clearness_index
 from pvlib.irradiance import get_extra_radiation
 from pvlib.irradiance import get_total_irradiance
+from data_pipeline.profiling import profile_stage
+from data_sanitization.solar_geometry import get_solar_geometry
+
+
+def transpose_inputs(array_info, solar_position, ghi, dni, dhi,
+                     model='isotropic', albedo=0.25):
+    '''
+    The function calculates the plane of array (POA) of every input of
+    array_info. The inputs are grouped by unique (surface_tilt,
+    surface_azimuth), the POA is computed once per orientation and copied to
+    the inputs sharing it.
+    Parameters
+    ----------
+    array_info : Dataframe
+        Contains the static details of the inverters - Surface tilt and Surface
+        azimuth angle(degree)
+    solar_position : Dataframe
+        Solar geometry of the timestamps (see
+        data_sanitization.solar_geometry.get_solar_geometry).
+    ghi, dni, dhi : array-like
+        Irradiance components, one value per timestamp.
+    model : string, optional
+        Sky diffuse model of pvlib get_total_irradiance. The isotropic model
+        is computed for all the orientations at once, the others once per
+        orientation. The default is 'isotropic'.
+    albedo : float, optional
+        Ground reflectance. The default is 0.25, as pvlib.
+
+    Returns
+    -------
+    poa_global : numpy array
+        POA of shape (number of timestamps, number of inputs), the columns
+        in the order of array_info.
+
+    '''
+    orientations, inverse = np.unique(
+        array_info[['surface_tilt', 'surface_azimuth']].to_numpy(dtype=float),
+        axis=0, return_inverse=True)
+    ghi, dni, dhi = [np.asarray(x, dtype=float) for x in (ghi, dni, dhi)]
+    if model == 'isotropic':
+        # one (timestamps, orientations) pass, as pvlib get_total_irradiance
+        tilt = np.radians(orientations[:, 0])
+        zenith = np.radians(solar_position['apparent_zenith'].to_numpy())
+        azimuth = np.radians(solar_position['azimuth'].to_numpy())
+        projection = np.clip(
+            np.cos(tilt) * np.cos(zenith)[:, None]
+            + np.sin(tilt) * np.sin(zenith)[:, None]
+            * np.cos(azimuth[:, None] - np.radians(orientations[:, 1])),
+            -1, 1)
+        poa_direct = np.maximum(dni[:, None] * projection, 0)
+        poa_sky_diffuse = dhi[:, None] * (1 + np.cos(tilt)) * 0.5
+        poa_ground_diffuse = ghi[:, None] * albedo * (1 - np.cos(tilt)) * 0.5
+        poa = poa_direct + (poa_sky_diffuse + poa_ground_diffuse)
+    else:
+        poa = np.empty((len(ghi), len(orientations)))
+        for i, (surface_tilt, surface_azimuth) in enumerate(orientations):
+            irrads = get_total_irradiance(
+                surface_tilt=surface_tilt,
+                surface_azimuth=surface_azimuth,
+                solar_zenith=solar_position['apparent_zenith'].to_numpy(),
+                solar_azimuth=solar_position['azimuth'].to_numpy(),
+                dni=dni,
+                ghi=ghi,
+                dhi=dhi,
+                dni_extra=solar_position['dni_extra'].to_numpy(),
+                airmass=solar_position['airmass_relative'].to_numpy(),
+                albedo=albedo,
+                model=model)
+            poa[:, i] = irrads['poa_global']
+    # scattering the orientations to the inputs
+    return poa[:, inverse.ravel()]
 
 
 def transpose_irradiance(meteo_data, general_info, array_info,
@@ -41,32 +112,23 @@ def transpose_irradiance(meteo_data, general_info, array_info,
     '''
     times = meteo_data.index
     ghi = meteo_data.xs('GHI', axis=1, level='curve').iloc[:, 0].values
-    location = Location(general_info['lat'], general_info['long'],
-                        general_info['timezone'], general_info['alt'])
-    # Calculate solar position
-    ephem_df = location.get_solarposition(times)
+    # Solar position, shared with the clear sky curves
+    ephem_df = get_solar_geometry(times, general_info['lat'],
+                                  general_info['long'], general_info['alt'])
     # Decompose GHI into DNI and DHI
     data = erbs(ghi, ephem_df['zenith'], times)
     meteo_data_transpose = meteo_data.copy()
     # Translate irradiance to POA
     if isinstance(meteo_data_transpose.columns, pd.MultiIndex):
-        for surface_tilt, surface_azimuth, col in zip(
-                array_info['surface_tilt'],
-                array_info['surface_azimuth'],
-                meteo_data.xs('GHI',
-                              axis=1,
-                              level='curve',
-                              drop_level=False).columns):
-            irrads = get_total_irradiance(
-                surface_tilt=surface_tilt,
-                surface_azimuth=surface_azimuth,
-                solar_zenith=ephem_df['apparent_zenith'],
-                solar_azimuth=ephem_df['azimuth'],
-                dni=data['dni'],
-                ghi=ghi,
-                dhi=data['dhi'],
-                model=poa_model)
-            meteo_data_transpose.loc[:, col] = irrads['poa_global']
+        # the GHI column of each input, in the order of array_info
+        ghi_columns = meteo_data.xs('GHI', axis=1, level='curve',
+                                    drop_level=False).columns
+        poa = transpose_inputs(array_info, ephem_df, ghi, data['dni'],
+                               data['dhi'], model=poa_model)
+        n_inputs = min(len(ghi_columns), poa.shape[1])
+        meteo_data_transpose.iloc[
+            :, meteo_data_transpose.columns.get_indexer(
+                ghi_columns[:n_inputs])] = poa[:, :n_inputs]
     else:
         irrads = get_total_irradiance(surface_tilt=surface_tilt,
                                       surface_azimuth=surface_azimuth,
@@ -75,11 +137,14 @@ def transpose_irradiance(meteo_data, general_info, array_info,
                                       dni=data['dni'],
                                       ghi=ghi,
                                       dhi=data['dhi'],
+                                      dni_extra=ephem_df['dni_extra'],
+                                      airmass=ephem_df['airmass_relative'],
                                       model=poa_model)
         meteo_data_transpose = irrads['poa_global']
     return meteo_data_transpose
 
 
+@profile_stage()
 def get_operational_irradiance(meteo_data, general_info, array_info,
                                poa_model='isotropic'):
     '''
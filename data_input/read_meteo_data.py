@@ -9,11 +9,15 @@ from data_input.add_multi_index_level import add_index_curve_level
 from data_input.clean_using_pecos import pecos_clean
 from data_input.estimate_tmod import estimate_module_temperature
 from data_input.estimate_tamb import estimate_air_temperature
+from data_input.workbook import open_workbook
+from data_pipeline.profiling import profile_stage
 
 
+@profile_stage()
 def read_weather_data(
         general_info,
-        path_input_file):
+        path_input_file,
+        report=None):
     """
     This function reads the weather csv file and creates a multi-index
     dataframe containing GHI/G, Tmod and Tamb.
@@ -25,9 +29,12 @@ def read_weather_data(
         dateformat of weather data
     path_input_file_meteo: str
         csv file path to read meteo data.
-    path_input_file: Str
-        input excel sheet path file containing column numbers of irradiance,
-        Tamb and Tmod in meteo csv.
+    path_input_file: Str or WorkbookLoader
+        input excel sheet path file (or the already opened workbook)
+        containing column numbers of irradiance, Tamb and Tmod in meteo csv.
+    report: dict, optional
+        Updated with the duplicate, missing and off-grid timestamp counts of
+        the weather data (see pecos_clean).
 
     Returns
     -------
@@ -35,11 +42,11 @@ def read_weather_data(
         The dataframe containing G, Tamb and Tmod values.
     """
     # READ WEATHER DATA SHEET
-    meteo_file = pd.read_excel(path_input_file, 
-                                       sheet_name='Weather Data',skiprows=[0])
+    workbook = open_workbook(path_input_file)
+    meteo_file = workbook.sheet('Weather Data', skiprows=[0])
     print('meteo file read')
     # Reading array info
-    array_info = pd.read_excel(path_input_file, sheet_name='Array Info')
+    array_info = workbook.sheet('Array Info')
     print('array_file_read')
     # Setting multi-level index for array info
     idx = ['ag_level_2', 'ag_level_1']
@@ -48,8 +55,11 @@ def read_weather_data(
     # Cleaning data with Pecos
     meteo_file = pecos_clean(meteo_file,
                              general_info['date_format_meteo'],
-                             general_info['meteo_time_resolution'])
+                             general_info['meteo_time_resolution'],
+                             report=report)
     print('cleaned_using_pecos')
+    # the regularized timestamps are the index of the data
+    meteo_datetime = meteo_file.index.rename('datetime')
     # Resetting the index
     meteo_file.index.rename('0', inplace=True)
     meteo_file.reset_index(inplace=True)
@@ -61,17 +71,6 @@ def read_weather_data(
     meteo_data = pd.DataFrame()
     meteo_data_orig = pd.DataFrame()
 
-    # CREATING DATETIME INDEX SERIES
-    # Creating dataframe using column number given in array info
-    meteo_datetime = meteo_file.loc[:, list(
-        set(array_info.loc[:, 'datetime_column_meteo'].values))]
-    # Converting column into datetime format
-    meteo_datetime.iloc[:, 0] = pd.to_datetime(
-        meteo_datetime.iloc[:, 0],
-        format=general_info['date_format_meteo'])
-    # Setting column name as datetime
-    meteo_datetime.columns = ['datetime']
-
     # CREATING A IRRADIANCE DATAFRAME
     # Checking if irradiance data is provided by client or not
     if not all(pd.isnull(array_info.loc[:, 'irradiance_column'])):
@@ -82,7 +81,7 @@ def read_weather_data(
         meteo_irradiance.columns = array_info.index
         # Setting datetime series as index
         meteo_irradiance = meteo_irradiance.set_index(
-            meteo_datetime['datetime'])
+            meteo_datetime)
         meteo_irradiance_orig = meteo_irradiance.copy()
     
         ## checking for % of data missing between 6am - 8 PM
@@ -122,7 +121,7 @@ def read_weather_data(
         meteo_temperature.columns = array_info.index
         # Setting datetime series as index
         meteo_temperature = meteo_temperature.set_index(
-            meteo_datetime['datetime'])
+            meteo_datetime)
 
         ## checking for % of data missing between 6am - 8 PM
         missing_tamb = round(meteo_temperature.between_time('06:00', '08:00').isna().sum().mean() /
@@ -157,7 +156,7 @@ def read_weather_data(
         # Using array info to get same multi-index column name
         meteo_modtemp.columns = array_info.index
         # Setting datetime series as index
-        meteo_modtemp = meteo_modtemp.set_index(meteo_datetime['datetime'])
+        meteo_modtemp = meteo_modtemp.set_index(meteo_datetime)
 
         ## checking for % of data missing between 6am - 8 PM
         missing_modtemp = round(meteo_modtemp.between_time('06:00', '08:00').isna().sum().mean() /
@@ -219,7 +218,7 @@ def irradiance_data(general_info, path_input_file_meteo,
         sys.exit("Invalid weather data file.")
 
     # Reading array info
-    array_info = pd.read_excel(path_input_file, sheet_name='Array Info')
+    array_info = open_workbook(path_input_file).sheet('Array Info')
     # Setting multi-level index for array info
     idx = ['ag_level_2', 'ag_level_1']
     array_info = array_info.set_index(idx)
@@ -228,6 +227,8 @@ def irradiance_data(general_info, path_input_file_meteo,
     meteo_file = pecos_clean(meteo_file,
                              general_info['date_format_meteo'],
                              general_info['meteo_time_resolution'])
+    # the regularized timestamps are the index of the data
+    meteo_datetime = meteo_file.index.rename('datetime')
     # Resetting the index
     meteo_file.index.rename('0', inplace=True)
     meteo_file.reset_index(inplace=True)
@@ -235,17 +236,6 @@ def irradiance_data(general_info, path_input_file_meteo,
     # Converting column name to integers
     meteo_file.columns = [int(i) for i in meteo_file.columns]
 
-    # CREATING DATETIME INDEX SERIES
-    # Creating dataframe using column number given in array info
-    meteo_datetime = meteo_file.loc[:, list(
-        set(array_info.loc[:, 'datetime_column_meteo'].values))]
-    # Converting column into datetime format
-    meteo_datetime.iloc[:, 0] = pd.to_datetime(
-        meteo_datetime.iloc[:, 0],
-        format=general_info['date_format_meteo'])
-    # Setting column name as datetime
-    meteo_datetime.columns = ['datetime']
-
     # CREATING A IRRADIANCE DATAFRAME
     # Creating a new dataframe irradiance_plot of unique irradiance data only
     if not all(pd.isnull(array_info.loc[:, 'irradiance_column'])):
@@ -258,6 +248,6 @@ def irradiance_data(general_info, path_input_file_meteo,
         irradiance_df.columns = col_name
         # setting datetime as index
         irradiance_df = irradiance_df.set_index(
-            meteo_datetime['datetime'])
+            meteo_datetime)
 
     return irradiance_df
@@ -8,18 +8,45 @@ import pandas as pd
 from os import sys
 from data_input.add_multi_index_level import add_index_curve_level
 from data_input.clean_using_pecos import pecos_clean
+from data_input.workbook import open_workbook
+from data_pipeline.profiling import profile_stage
 
-def read_inverter_data(general_info, path_input_file):
-    
+@profile_stage()
+def read_inverter_data(general_info, path_input_file, report=None):
+    """
+    This function reads the inverter data sheet and creates a multi-index
+    dataframe containing I, V and P of each input.
+
+    Parameters
+    ----------
+    general_info: dict
+        The site information with the date format and time resolution of
+        the inverter data
+    path_input_file: Str or WorkbookLoader
+        input excel sheet path file (or the already opened workbook)
+    report: dict, optional
+        Updated with the duplicate, missing and off-grid timestamp counts of
+        the inverter data (see pecos_clean).
+
+    Returns
+    -------
+    inverter_data = Multi index dataframe
+        The dataframe containing I, V and P values.
+    data_points = int
+        Number of values in the inverter data sheet.
+    """
     # reads data 
-    data_file = pd.read_excel(path_input_file, 
-                               sheet_name='Inverter Data',skiprows=[0])
+    workbook = open_workbook(path_input_file)
+    data_file = workbook.sheet('Inverter Data', skiprows=[0])
     data_points = data_file.iloc[:,1:].size
     # Cleaning data using Pecos
     data_file = pecos_clean(data_file,
                             general_info['date_format_inverter'],
-                            general_info['inverter_time_resolution'])
+                            general_info['inverter_time_resolution'],
+                            report=report)
     print('percos cleaning complete')
+    # the regularized timestamps are the index of the data
+    inputs_datetime = data_file.index.rename('datetime')
     # Resetting the index
     data_file.index.rename('0', inplace=True)
     data_file.reset_index(inplace=True)
@@ -27,33 +54,22 @@ def read_inverter_data(general_info, path_input_file):
     data_file.columns = [int(i) for i in data_file.columns]
 
     # Reading array info
-    array_info = pd.read_excel(path_input_file, sheet_name='Array Info')
+    array_info = workbook.sheet('Array Info')
     print('array_info_read')
 
     # SETTING MULTI-INDEX IN ARRAY INFO
     idx = ['ag_level_2', 'ag_level_1']
     array_info = array_info.set_index(idx)
 
-    # Creating Datetime series to be used as index
-    inputs_datetime = data_file.loc[:, list(
-        set(array_info.loc[:, 'datetime_column'].values))]
-
-    inputs_datetime.iloc[:, 0] = pd.to_datetime(
-        inputs_datetime.iloc[:, 0],
-        format=general_info['date_format_inverter'])
-
-    # setting index name as datetime
-    inputs_datetime.columns = ['datetime']
-
     #  CREATING CURRENT DATAFRAME USING ARRAY INFO CURRENT COLUMN NUMBERS
     inputs_current = data_file.loc[:, array_info.loc[:, 'current_column'].values]
     inputs_current.columns = array_info.index
-    inputs_current = inputs_current.set_index(inputs_datetime['datetime'])
+    inputs_current = inputs_current.set_index(inputs_datetime)
 
     #  CREATING VOLTAGE DATAFRAME USING ARRAY INFO VOLTAGE COLUMN NUMBERS
     inputs_voltage = data_file.loc[:, array_info.loc[:, 'voltage_column'].values]
     inputs_voltage.columns = array_info.index
-    inputs_voltage = inputs_voltage.set_index(inputs_datetime['datetime'])
+    inputs_voltage = inputs_voltage.set_index(inputs_datetime)
 
     # CALCULATING POWER VALUES AS I*V IF NOT PROVIDED IN INVERTER DATA
     if all(pd.isnull(array_info.loc[:, 'power_column'])):
@@ -61,7 +77,7 @@ def read_inverter_data(general_info, path_input_file):
     else:
         inputs_power = data_file.loc[:, array_info.loc[:, 'power_column'].values]
         inputs_power.columns = array_info.index
-        inputs_power = inputs_power.set_index(inputs_datetime['datetime'])
+        inputs_power = inputs_power.set_index(inputs_datetime)
 
     # CONVERTING I, P, V DATAFRAME INTO MULTI-INDEX DATAFRAMES
     inputs_current.columns = add_index_curve_level(inputs_current.columns, 'I')
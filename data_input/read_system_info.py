@@ -3,8 +3,10 @@ This notebook reads the system information.
 @author: DurejaBhavya
 """
 
-import pandas as pd
+from data_input.workbook import open_workbook
+from data_pipeline.profiling import profile_stage
 
+@profile_stage()
 def gather_inputs(path_input_file):
     """
     This function reads the data input excel file and creates the general info
@@ -13,8 +15,8 @@ def gather_inputs(path_input_file):
 
     Parameters
     ----------
-    path_input_file : str
-        input sheet file path
+    path_input_file : str or WorkbookLoader
+        input sheet file path, or the already opened workbook
 
     Returns
     -------
@@ -31,7 +33,8 @@ def gather_inputs(path_input_file):
     # except FileNotFoundError:
     #     sys.exit("Invalid input file.")
 
-    info_system = pd.read_excel(path_input_file, sheet_name='General Info')
+    workbook = open_workbook(path_input_file)
+    info_system = workbook.sheet('General Info')
 
     # PRINT THE SYSTEM NAME
     strID = info_system.at[0, 'system_name']
@@ -54,7 +57,11 @@ def gather_inputs(path_input_file):
     general_info['lat'] = float(info_system.at[IDi, 'latitude'])
     general_info['long'] = float(info_system.at[IDi, 'longitude'])
     general_info['alt'] = float(info_system.at[IDi, 'altitude'])
-    general_info['timezone'] = float(info_system.at[IDi, 'time_zone'])
+    # UTC offset in hours, or an IANA time zone name
+    try:
+        general_info['timezone'] = float(info_system.at[IDi, 'time_zone'])
+    except ValueError:
+        general_info['timezone'] = str(info_system.at[IDi, 'time_zone']).strip()
 
     # DEFINING OTHER RELEVANT VARIABLES
     # ELECTRICITY PRICE
@@ -83,7 +90,7 @@ def gather_inputs(path_input_file):
                                                                   'inv_freq'])
 
     # READ THE ARRAY INFO SHEET
-    array_info_raw = pd.read_excel(path_input_file, sheet_name='Array Info')
+    array_info_raw = workbook.sheet('Array Info')
     array_info = array_info_raw.iloc[:, 0:-11]
     # SETTING MULTI-INDEX
     idx = ['ag_level_2', 'ag_level_1']
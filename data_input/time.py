@@ -1,7 +1,7 @@
 """Obtain UTC for input files."""
 
 import pandas as pd
-from tzwhere import tzwhere
+from data_sanitization import utc
 
 
 def get_tz(latitude, longitude):
@@ -20,11 +20,8 @@ def get_tz(latitude, longitude):
     timezone_str : String
         Time zone in described in string.
     """
-    # Get the time zone based on the GPS location
-    tz = tzwhere.tzwhere()
-    timezone_str = tz.tzNameAt(latitude, longitude)
-
-    return timezone_str
+    # Get the time zone based on the GPS location, from the cached resolver
+    return utc.get_tz(latitude, longitude)
 
 
 def get_utc_index(index_in, latitude,
@@ -0,0 +1,93 @@
+"""
+This file opens the uploaded input workbook once and shares the parsed sheets
+between the readers.
+"""
+
+import time
+import pandas as pd
+
+
+class WorkbookLoader:
+    """
+    Input workbook opened a single time. Each sheet is parsed the first time
+    it is requested and the parsed dataframe is reused afterwards, so the
+    readers can share 'Array Info' and the workbook zip/XML is opened once.
+
+    The returned dataframes are shared between the readers and must not be
+    modified in place.
+
+    Parameters
+    ----------
+    path_input_file : str or file-like object
+        input excel sheet path or buffer (e.g. io.BytesIO of an upload).
+    """
+
+    def __init__(self, path_input_file):
+        self._source = path_input_file
+        self._excel_file = None
+        self._sheets = {}
+        # seconds spent parsing each sheet
+        self.parse_times = {}
+
+    @property
+    def excel_file(self):
+        """pandas.ExcelFile, opened on first access."""
+        if self._excel_file is None:
+            start_time = time.perf_counter()
+            self._excel_file = pd.ExcelFile(self._source)
+            self.parse_times['open'] = time.perf_counter() - start_time
+        return self._excel_file
+
+    def sheet(self, sheet_name, skiprows=None):
+        """
+        Return a parsed sheet of the workbook, parsing it only once.
+
+        Parameters
+        ----------
+        sheet_name : str
+            Name of the sheet, e.g. 'Array Info'.
+        skiprows : list of int, optional
+            Rows to skip at the start of the sheet.
+
+        Returns
+        -------
+        sheet_df : Pandas DataFrame
+            The parsed sheet.
+        """
+        key = (sheet_name, tuple(skiprows) if skiprows is not None else None)
+        if key not in self._sheets:
+            start_time = time.perf_counter()
+            self._sheets[key] = self.excel_file.parse(sheet_name,
+                                                      skiprows=skiprows)
+            self.parse_times[sheet_name] = time.perf_counter() - start_time
+        return self._sheets[key]
+
+    def close(self):
+        """Close the underlying workbook file."""
+        if self._excel_file is not None:
+            self._excel_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_workbook(path_input_file):
+    """
+    Wrap an input file in a WorkbookLoader unless it already is one.
+
+    Parameters
+    ----------
+    path_input_file : str, file-like object or WorkbookLoader
+        input excel sheet path, buffer or an already opened workbook.
+
+    Returns
+    -------
+    workbook : WorkbookLoader
+        The workbook to read sheets from.
+    """
+    if isinstance(path_input_file, WorkbookLoader):
+        return path_input_file
+    return WorkbookLoader(path_input_file)
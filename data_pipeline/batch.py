@@ -0,0 +1,136 @@
+"""
+Headless batch sanitation of a directory of plant workbooks.
+
+Each workbook is sanitized in a process pool sized to the cores (see
+data_pipeline.pipeline.sanitize_workbook). The sanitized frames of a
+workbook are written to Parquet under <output>/<workbook name>/ and the data
+summaries of all the workbooks to <output>/data_summary.parquet, one row per
+workbook.
+
+Run from the repository root:
+    python -m data_pipeline.batch plants/ sanitized/ --workers 8
+"""
+import os
+import glob
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+from data_pipeline.pipeline import sanitize_workbook
+
+# Frames written for each workbook
+OUTPUT_FRAMES = ['inv_data_sani', 'meteo_data_csky']
+SUMMARY_FILE = 'data_summary.parquet'
+
+
+def sanitize_file(path, output_dir, frames=OUTPUT_FRAMES):
+    """
+    Sanitize a workbook and write its frames to Parquet.
+
+    Parameters
+    ----------
+    path : str
+        Workbook to sanitize.
+    output_dir : str
+        Folder of the outputs, a sub folder named after the workbook is used.
+    frames : list of str, optional
+        Names of the frames of sanitize_workbook to write.
+
+    Returns
+    -------
+    summary : dict
+        file, status ('ok' or 'error'), rows and inputs of the inverter data,
+        duration and the values of the data summary, or the error message.
+    """
+    start_time = time.perf_counter()
+    name = os.path.splitext(os.path.basename(path))[0]
+    summary = {'file': os.path.basename(path)}
+    try:
+        with open(path, 'rb') as f:
+            datasets, data_summary, _ = sanitize_workbook(
+                f.read(), os.path.basename(path))
+        folder = os.path.join(output_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        for frame in frames:
+            datasets[frame].to_parquet(os.path.join(folder,
+                                                    frame + '.parquet'))
+        summary.update(status='ok', rows=len(datasets['inv_data']),
+                       inputs=len(datasets['array_info']))
+        summary.update({key: str(value) for key, value in
+                        data_summary['Values'].items()})
+    except Exception as e:
+        traceback.print_exc()
+        summary.update(status='error', error=str(e))
+    summary['seconds'] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+def run_batch(input_dir, output_dir, pattern='*.xls*', workers=None):
+    """
+    Sanitize all the workbooks of a directory in parallel.
+
+    Parameters
+    ----------
+    input_dir : str
+        Folder of the workbooks.
+    output_dir : str
+        Folder of the Parquet outputs.
+    pattern : str, default '*.xls*'
+        Glob pattern of the workbooks in input_dir.
+    workers : int, optional
+        Number of processes, the number of cores by default.
+
+    Returns
+    -------
+    summary : Pandas DataFrame
+        One row per workbook, see sanitize_file.
+    throughput : dict
+        files, failed, seconds, files_per_min and rows_per_sec.
+    """
+    paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    start_time = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(sanitize_file, path, output_dir)
+                   for path in paths]
+        for future in as_completed(futures):
+            row = future.result()
+            print('{file}: {status} in {seconds} s'.format(**row))
+            rows.append(row)
+    elapsed = time.perf_counter() - start_time
+
+    summary = pd.DataFrame(rows)
+    if not summary.empty:
+        summary = summary.sort_values('file').reset_index(drop=True)
+        summary.to_parquet(os.path.join(output_dir, SUMMARY_FILE))
+    done = summary[summary['status'] == 'ok'] if rows else summary
+    n_rows = int(done['rows'].sum()) if not done.empty else 0
+    throughput = {'files': len(paths),
+                  'failed': len(paths) - len(done),
+                  'seconds': round(elapsed, 2),
+                  'files_per_min': round(len(done) / elapsed * 60, 2)
+                  if elapsed else 0.0,
+                  'rows_per_sec': round(n_rows / elapsed, 1)
+                  if elapsed else 0.0}
+    return summary, throughput
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('input_dir', help='folder of the plant workbooks')
+    parser.add_argument('output_dir', help='folder of the Parquet outputs')
+    parser.add_argument('--pattern', default='*.xls*',
+                        help='glob pattern of the workbooks')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, all the cores by default')
+    args = parser.parse_args()
+
+    summary, throughput = run_batch(args.input_dir, args.output_dir,
+                                    args.pattern, args.workers)
+    print('Sanitized {files} files ({failed} failed) in {seconds} s: '
+          '{files_per_min} files/min, {rows_per_sec} rows/sec'.format(
+              **throughput))
@@ -0,0 +1,320 @@
+"""
+This file contains the background execution of the pipeline on the uploads.
+
+An upload is submitted as a job to a local process pool and the upload
+callback returns at once. The job writes its status (stage reached, result
+id, error) to a small json file, which any worker of the server can read when
+the dashboard polls for progress.
+
+Identical uploads (same bytes and parameters) share a job: an upload already
+queued, running or done returns the existing job. The server worker owning a
+pending job touches its status file every few seconds, a queued or running
+job whose status has not been touched for JOB_HEARTBEAT seconds (e.g. its
+worker was restarted) is taken as failed. Past the job TTL, the
+stage cache (see data_pipeline.stage_cache) still returns its stored result
+without recomputation.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from data_store.result_store import STORE_DIR, STORE_TTL, ResultStore
+from data_pipeline.pipeline import STAGES, run_pipeline, upload_key
+from data_pipeline.pipeline import refilter_args
+from data_pipeline.stage_cache import StageCache
+from data_sanitization.utc import preload_timezones
+
+# Folder of the job status files, shared by all the workers of the server
+JOBS_DIR = os.environ.get('DST_JOBS_DIR', os.path.join(STORE_DIR, '.jobs'))
+# Number of uploads processed in parallel by each server worker
+JOB_WORKERS = int(os.environ.get('DST_JOB_WORKERS', 2))
+# Seconds after which a queued or running job whose status file was not
+# touched by its server worker is taken as failed
+JOB_HEARTBEAT = float(os.environ.get('DST_JOB_HEARTBEAT', 120))
+# Start method of the pool processes, 'spawn' is safe in threaded servers.
+# With 'fork' the pool processes share the time zone index of the server.
+JOB_START_METHOD = os.environ.get('DST_JOB_START_METHOD', 'spawn')
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+
+def _status_path(jobs_dir, job_id):
+    # job ids are generated by the manager, refuse anything else
+    if not job_id or not str(job_id).isalnum():
+        raise KeyError('Invalid job id: {!r}'.format(job_id))
+    return os.path.join(jobs_dir, job_id + '.json')
+
+
+def _write_status(jobs_dir, status):
+    path = _status_path(jobs_dir, status['job_id'])
+    tmp_path = path + '.tmp'
+    status['updated'] = time.time()
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def _run_job(jobs_dir, status, decoded, filename, params=None, digest=None):
+    """
+    Run the pipeline on an upload, in a pool process. Without its bytes
+    (decoded=None), on a stored upload of content hash digest.
+    """
+    started = time.time()
+    status.update(state=RUNNING, started=started, stages={})
+
+    def progress(stage):
+        status['stage'] = stage
+        status['stage_index'] = STAGES.index(stage)
+        status['stages'][stage] = round(time.time() - started, 3)
+        _write_status(jobs_dir, status)
+
+    try:
+        status['result_id'] = run_pipeline(decoded, filename,
+                                           progress=progress, params=params,
+                                           cache=StageCache(), digest=digest)
+        status['state'] = DONE
+    except Exception as e:
+        traceback.print_exc()
+        status.update(state=ERROR, error=str(e))
+    status['duration'] = round(time.time() - started, 3)
+    _write_status(jobs_dir, status)
+    return status
+
+
+class JobManager:
+    """
+    Pool of processes running the pipeline on the uploads.
+
+    Parameters
+    ----------
+    jobs_dir : str, optional
+        Folder where the job status files are written.
+    max_workers : int, optional
+        Number of uploads processed in parallel.
+    ttl : float, optional
+        Seconds after which the status of a finished job is removed.
+    store : ResultStore, optional
+        Store the results are written to, to check that the result of a
+        finished identical upload is still there.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=JOB_WORKERS,
+                 ttl=STORE_TTL, store=None):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.store = store or ResultStore()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # jobs of this manager not finished yet, kept alive by _heartbeat
+        self._pending = set()
+        self._heartbeat_thread = None
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _heartbeat(self):
+        """Touch the status files of the pending jobs, see JOB_HEARTBEAT."""
+        while True:
+            time.sleep(JOB_HEARTBEAT / 6)
+            for job_id in list(self._pending):
+                try:
+                    os.utime(_status_path(self.jobs_dir, job_id))
+                except FileNotFoundError:
+                    pass
+
+    def _start_heartbeat(self):
+        with self._executor_lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, daemon=True)
+                self._heartbeat_thread.start()
+
+    @property
+    def executor(self):
+        # created on first use, i.e. in the server worker and not in the
+        # master process of gunicorn
+        with self._executor_lock:
+            if self._executor is None:
+                # the time zone index is loaded as the pool starts, not by
+                # the first job of each process (a no-op if inherited by
+                # fork)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(JOB_START_METHOD),
+                    initializer=preload_timezones)
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """
+        Drop a broken pool, e.g. after a process was killed out of memory.
+        The next submission creates a new one.
+        """
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _find(self, key):
+        """Job of an identical upload which is pending or still stored."""
+        try:
+            with open(os.path.join(self.jobs_dir, key + '.key')) as f:
+                status = self.status(f.read().strip())
+        except (FileNotFoundError, KeyError):
+            return None
+        if status['state'] in (QUEUED, RUNNING):
+            return status['job_id']
+        if status['state'] == DONE and self.store.exists(status['result_id']):
+            return status['job_id']
+        return None
+
+    def submit(self, decoded, filename, params=None, digest=None):
+        """
+        Submit an upload to the pool.
+
+        Parameters
+        ----------
+        decoded : bytes
+            Content of the uploaded file, None for a stored upload.
+        filename : str
+            Name of the uploaded file.
+        params : dict, optional
+            Parameters of the pipeline stages.
+        digest : str, optional
+            Content hash of the upload, to rerun it without its bytes.
+
+        Returns
+        -------
+        job_id : str
+            Key to poll the status of the job, the key of the existing job if
+            the same upload was already submitted.
+        """
+        self.cleanup()
+        key = upload_key(decoded, filename, params, digest)
+        job_id = self._find(key)
+        if job_id is not None:
+            return job_id
+        status = {'job_id': uuid.uuid4().hex, 'state': QUEUED,
+                  'filename': filename, 'stage': None, 'stage_index': -1,
+                  'n_stages': len(STAGES), 'submitted': time.time()}
+        _write_status(self.jobs_dir, status)
+        # the upload key points to the job, for the identical uploads to come
+        key_path = os.path.join(self.jobs_dir, key + '.key')
+        with open(key_path + '.' + status['job_id'], 'w') as f:
+            f.write(status['job_id'])
+        os.replace(key_path + '.' + status['job_id'], key_path)
+        self._pending.add(status['job_id'])
+        self._start_heartbeat()
+        try:
+            self._submit(status, decoded, filename, params, digest)
+        except Exception:
+            self._pending.discard(status['job_id'])
+            raise
+        return status['job_id']
+
+    def refilter(self, result_id, params):
+        """
+        Submit the upload of a stored result with other parameters, see
+        data_pipeline.pipeline.refilter. Only the stages below the changed
+        parameters are recomputed, unless their inputs left the stage cache.
+
+        Parameters
+        ----------
+        result_id : str
+            Key of the result in the store.
+        params : dict
+            Parameters overriding those of the result.
+
+        Returns
+        -------
+        job_id : str
+            Key to poll the status of the job, as submit.
+        """
+        filename, params, digest = refilter_args(
+            self.store.read_meta(result_id), params)
+        return self.submit(None, filename, params, digest)
+
+    def _submit(self, status, decoded, filename, params, digest=None,
+                retries=1):
+        """
+        Run a job in the pool. A broken pool is replaced, and the jobs it
+        lost are submitted again retries times.
+        """
+        executor = self.executor
+        try:
+            future = executor.submit(_run_job, self.jobs_dir, dict(status),
+                                     decoded, filename, params, digest)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            if not retries:
+                raise
+            return self._submit(status, decoded, filename, params, digest,
+                                retries - 1)
+
+        def on_done(future):
+            error = future.exception()
+            if error is None:
+                self._pending.discard(status['job_id'])
+                return
+            if isinstance(error, BrokenProcessPool):
+                # a pool process died (e.g. out of memory), the pool is
+                # unusable for the next jobs too
+                self._reset_executor(executor)
+                if retries:
+                    print('Job {} lost by the pool, submitted again'.format(
+                        status['job_id']))
+                    try:
+                        self._submit(status, decoded, filename, params,
+                                     digest, retries - 1)
+                        return
+                    except Exception as e:
+                        error = e
+            # the job died before reporting
+            self._pending.discard(status['job_id'])
+            status.update(state=ERROR, error=str(error))
+            _write_status(self.jobs_dir, status)
+        future.add_done_callback(on_done)
+
+    def status(self, job_id):
+        """
+        Read the status of a job.
+
+        Parameters
+        ----------
+        job_id : str
+            Key returned by JobManager.submit.
+
+        Returns
+        -------
+        status : dict
+            state (queued, running, done or error), stage reached and its
+            index in STAGES, result_id when done, error message on error.
+            A queued or running job without heartbeat is an error.
+        """
+        path = _status_path(self.jobs_dir, job_id)
+        try:
+            with open(path) as f:
+                status = json.load(f)
+            touched = os.path.getmtime(path)
+        except FileNotFoundError:
+            raise KeyError('Job {} not found'.format(job_id))
+        if status['state'] in (QUEUED, RUNNING) and \
+                time.time() - max(status['updated'], touched) > JOB_HEARTBEAT:
+            status.update(state=ERROR, error='The processing of the file was '
+                          'interrupted, please upload it again.')
+        return status
+
+    def cleanup(self):
+        """Remove the status files of the jobs older than the TTL."""
+        now = time.time()
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,507 @@
+"""
+This file contains the data sanitation pipeline run on an uploaded file.
+
+The pipeline used to run inside the upload callback of the dashboard; it is
+now a plain function so it can run in a background worker (see
+data_pipeline.jobs). Progress is reported stage by stage through a callback,
+and the timings and memory of each stage (see data_pipeline.profiling) are
+stored with the result.
+"""
+import io
+import numpy as np
+import pandas as pd
+
+from data_input.workbook import WorkbookLoader
+from data_input.read_system_info import gather_inputs
+from data_input.read_meteo_data import read_weather_data
+from data_input.read_operational_data import read_inverter_data
+from data_input.poa_irradiance import get_operational_irradiance
+
+from data_sanitization.utc import get_tz
+from data_sanitization import model_registry
+from data_sanitization.models import resampling_meteo
+from data_sanitization.gap_filling import (gap_histogram, fill_short_gaps,
+                                          impute_gaps)
+from data_sanitization.clear_sky_irradiance import clearsky_irradiance
+from data_sanitization.eliminate_night_values import eliminate_nightvalues
+from data_sanitization.eliminate_night_values import daytime_index
+from data_sanitization.eliminate_night_values import daytime_mask
+from data_sanitization.qc_flags import (CURRENT, VOLTAGE, IRRADIANCE, NIGHT,
+                                        qc_flags, apply_flags, flag_counts,
+                                        current_limits, voltage_limits)
+
+from data_store.result_store import ResultStore
+from data_pipeline.profiling import profiling, stage
+from data_pipeline.stage_cache import content_key, stage_key
+
+# Stages of the pipeline, in order, as reported to the progress callback
+STAGES = ['parse', 'pecos clean', 'daytime', 'POA transposition',
+          'clear sky', 'filters', 'imputation', 'serialization']
+
+# Default parameters of the stages
+PARAMS = {'poa_model': 'isotropic',
+          # clear sky model, see data_sanitization.clear_sky_models
+          'clear_sky_model': 'simplified_solis',
+          # irradiance bounds of the weather data filter
+          'irrad_low': 0, 'irrad_high': 1200,
+          # current upper bound, as a multiple of i_sc * number_of_strings
+          'isc_factor': 1.2,
+          # voltage upper bound, as a multiple of v_oc * modules_per_string
+          'voc_factor': 1.0,
+          # clear sky POA below which the data is considered night
+          'night_threshold': 10,
+          # missing data (%) above which the gaps are predicted by the models
+          'imputation_trigger': 0.5,
+          # longest gap (samples) interpolated instead of predicted
+          'short_gap': 2}
+
+# Version of each stage, to bump when its code changes so the outputs cached
+# by the previous code are not reused
+STAGE_VERSIONS = {'read': 2, 'daytime': 1, 'poa': 2, 'clear_sky': 2,
+                  'meteo_filter': 2, 'qc': 1, 'meteo_night': 1,
+                  'imputation': 4}
+
+# Frames plotted per input, stored partitioned by input so the input
+# dropdown reads one input's series whatever the size of the plant
+PARTITIONED_FRAMES = ['inv_data', 'inv_data_sani', 'irr_df',
+                      'meteo_data_csky']
+
+
+class PipelineError(Exception):
+    """The uploaded file could not be processed."""
+
+
+def read_upload(decoded, filename, progress):
+    """
+    Read the system information, the inverter data and the weather data of
+    an uploaded csv or excel file. The duplicate, missing and off-grid
+    timestamp counts of the data sheets are added to general_info.
+    """
+    timestamp_report = {'inverter': {}, 'meteo': {}}
+    if 'csv' in filename:
+        progress('parse')
+        array_info, general_info = gather_inputs(
+            io.StringIO(decoded.decode('utf-8')))
+
+        progress('pecos clean')
+        inverter_data, data_points = read_inverter_data(
+            general_info, io.StringIO(decoded.decode('utf-8')),
+            report=timestamp_report['inverter'])
+
+        meteo_data, irr_df = read_weather_data(
+            general_info, io.StringIO(decoded.decode('utf-8')),
+            report=timestamp_report['meteo'])
+    else:
+        progress('parse')
+        # the workbook is opened once and each sheet parsed once
+        with WorkbookLoader(io.BytesIO(decoded)) as workbook:
+            array_info, general_info = gather_inputs(workbook)
+            print(array_info)
+            workbook.sheet('Inverter Data', skiprows=[0])
+            workbook.sheet('Weather Data', skiprows=[0])
+
+            progress('pecos clean')
+            inverter_data, data_points = read_inverter_data(
+                general_info, workbook, report=timestamp_report['inverter'])
+            print(inverter_data)
+            print('INVERTER DATA PROCESSED')
+            meteo_data, irr_df = read_weather_data(
+                general_info, workbook, report=timestamp_report['meteo'])
+            print(meteo_data)
+        print('Workbook parse times (s): {}'.format(workbook.parse_times))
+    general_info['timestamp_report'] = timestamp_report
+    return array_info, general_info, inverter_data, data_points, meteo_data, \
+        irr_df
+
+
+def upload_key(decoded, filename, params=None, digest=None):
+    """
+    Key of the results of an upload: hash of its bytes, of the reader used
+    (csv or excel) and of the parameters.
+    """
+    params = dict(PARAMS, **(params or {}))
+    kind = 'csv' if 'csv' in filename else 'excel'
+    return stage_key('result', digest or content_key(decoded), kind, params)
+
+
+def run_pipeline(decoded, filename, progress=None, store=None, params=None,
+                 cache=None, digest=None):
+    """
+    Sanitize an uploaded file and write the results to the result store,
+    along with the profile of the pipeline stages under meta['profile'].
+
+    Parameters
+    ----------
+    decoded : bytes
+        Content of the uploaded file.
+    filename : str
+        Name of the uploaded file, csv or excel.
+    progress : callable, optional
+        Called with the name of each stage of STAGES when it starts.
+    store : ResultStore, optional
+        Store to write the results to. A store with the default settings is
+        used by default.
+    params : dict, optional
+        Parameters of the stages overriding PARAMS.
+    cache : StageCache, optional
+        Cache of the stage outputs. With a cache, an upload already processed
+        with the same parameters returns its stored result at once, and
+        concurrent identical uploads are computed once.
+    digest : str, optional
+        Content hash of the upload, to rerun a cached upload without its
+        bytes (decoded=None).
+
+    Returns
+    -------
+    result_id : str
+        Key of the results in the store.
+    """
+    progress = progress or (lambda stage: None)
+    store = store or ResultStore()
+    digest = digest or content_key(decoded)
+    if cache is None:
+        return _run_pipeline(decoded, filename, progress, store, params,
+                             cache, digest)
+    key = upload_key(decoded, filename, params, digest)
+    # an identical upload being processed by another worker is waited for
+    with cache.lock(key):
+        found, result_id = cache.get(key)
+        if found and store.exists(result_id):
+            print('Identical upload already processed: {}'.format(result_id))
+            return result_id
+        result_id = _run_pipeline(decoded, filename, progress, store, params,
+                                  cache, digest)
+        cache.put(key, result_id)
+    return result_id
+
+
+def _run_pipeline(decoded, filename, progress, store, params, cache, digest):
+    with profiling() as profile:
+        with stage('total'):
+            datasets, data_summary, general_info = sanitize_workbook(
+                decoded, filename, progress, params, cache, digest)
+            # writing the dataframes to the server-side result store
+            progress('serialization')
+            with stage('serialization'):
+                result_id = store.write(datasets, meta={
+                    'filename': filename,
+                    'digest': digest,
+                    'params': dict(PARAMS, **(params or {})),
+                    'data_summary': data_summary.to_json(orient='index'),
+                    'general_info': general_info,
+                }, partitioned=PARTITIONED_FRAMES)
+    print(profile.to_frame().to_string())
+    store.update_meta(result_id, {'profile': profile.to_dict()})
+    return result_id
+
+
+def refilter(result_id, params, store=None, cache=None):
+    """
+    Rerun the pipeline of a stored result with other parameters. With a
+    cache, only the stages depending on the changed parameters are
+    recomputed, from the cached outputs of the stages above them.
+
+    Parameters
+    ----------
+    result_id : str
+        Key of the result in the store.
+    params : dict
+        Parameters overriding those of the result.
+    store : ResultStore, optional
+        Store of the results.
+    cache : StageCache, optional
+        Cache of the stage outputs.
+
+    Returns
+    -------
+    result_id : str
+        Key of the new result in the store.
+    """
+    store = store or ResultStore()
+    filename, params, digest = refilter_args(store.read_meta(result_id),
+                                             params)
+    return run_pipeline(None, filename, store=store, params=params,
+                        cache=cache, digest=digest)
+
+
+def refilter_args(meta, params):
+    """
+    Filename, parameters and content hash of the upload of a stored result
+    (meta), rerun with other parameters, see refilter.
+    """
+    if 'digest' not in meta:
+        raise PipelineError('The upload has expired, please upload the '
+                            'file again.')
+    return (meta['filename'], dict(meta.get('params', PARAMS), **params),
+            meta['digest'])
+
+
+def cached_stage(cache, name, parents, params, func):
+    """
+    Run a stage of the DAG, through the cache if any.
+
+    Parameters
+    ----------
+    cache : StageCache or None
+        Cache of the stage outputs.
+    name : str
+        Name of the stage.
+    parents : list of str
+        Keys of the stages (or content) the stage reads from.
+    params : dict
+        Parameters of the stage.
+    func : callable
+        Function without arguments computing the stage output.
+
+    Returns
+    -------
+    key : str
+        Key of the stage output, a parent key for the stages below.
+    value : object
+        The stage output.
+    """
+    key = stage_key(name, STAGE_VERSIONS[name], parents, params)
+    with stage(name) as record:
+        if cache is None:
+            value = func()
+        else:
+            value, record['cached'] = cache.get_or_compute(key, func)
+    return key, value
+
+
+def sanitize_workbook(decoded, filename, progress=None, params=None,
+                      cache=None, digest=None):
+    """
+    Run the sanitation stages on an uploaded file, without storing anything.
+
+    The stages form a DAG: read -> POA and clear sky -> weather filter,
+    quality control flags (night, missing, current and voltage outliers,
+    see data_sanitization.qc_flags) -> imputation. With a cache,
+    each stage output is reused when the uploaded bytes, the parameters of
+    the stage and of the stages above it are the same.
+
+    Parameters
+    ----------
+    decoded : bytes
+        Content of the file.
+    filename : str
+        Name of the file, csv or excel.
+    progress : callable, optional
+        Called with the name of each stage of STAGES when it starts.
+    params : dict, optional
+        Parameters of the stages overriding PARAMS.
+    cache : StageCache, optional
+        Cache of the stage outputs.
+    digest : str, optional
+        Content hash of the file, to run from the cache without its bytes.
+
+    Returns
+    -------
+    datasets : dict of Pandas DataFrame
+        array_info, inv_data, inv_data_csky, inv_data_sani, meteo_data,
+        irr_df, meteo_data_csky and qc_flags, the uint8 flags of inv_data.
+    data_summary : Pandas DataFrame
+        Data points, resolution, missing data, outliers and number of gaps
+        by length.
+    general_info : dict
+        Site information read from the file.
+    """
+    progress = progress or (lambda stage: None)
+    params = dict(PARAMS, **(params or {}))
+    kind = 'csv' if 'csv' in filename else 'excel'
+
+    def read():
+        if decoded is None:
+            raise PipelineError('The upload has expired, please upload the '
+                                'file again.')
+        try:
+            return read_upload(decoded, filename, progress)
+        except Exception as e:
+            raise PipelineError('There was an error processing this file.') from e
+
+    read_key, (array_info, general_info, inverter_data, data_points,
+               meteo_data, irr_df) = cached_stage(
+        cache, 'read', [digest or content_key(decoded), kind], {}, read)
+
+    # Daytime timestamps, the night rows are pruned before the next stages
+    progress('daytime')
+
+    def daytime():
+        tz_str = get_tz(latitude=general_info['lat'], longitude=general_info['long'],
+                        time_zone=general_info['timezone'])
+
+        # the clear sky curves are computed on the timestamps taken as UTC,
+        # then labelled in local time
+        def local(index):
+            return index.tz_localize('UTC').tz_convert(tz_str).tz_localize(None)
+
+        inverter_day = daytime_index(inverter_data.index, general_info)
+        meteo_day = daytime_index(irr_df.index, general_info)
+        # whole inverter periods of weather data are kept, for its resampling
+        # to the inverter resolution in the imputation
+        meteo_bins = meteo_data.index.floor(
+            '{}min'.format(general_info['inverter_time_resolution']))
+        meteo_mask = meteo_bins.isin(
+            meteo_bins[meteo_data.index.isin(local(meteo_day))])
+        return (tz_str, inverter_day, meteo_day,
+                inverter_data.index.isin(local(inverter_day)), meteo_mask)
+
+    day_key, (tz_str, inverter_day, meteo_day, inverter_mask,
+              meteo_mask) = cached_stage(cache, 'daytime', [read_key], {},
+                                         daytime)
+    print('Daytime rows: {} of {}'.format(inverter_mask.sum(), len(inverter_mask)))
+
+    # converting irradinace GHI to POA
+    progress('POA transposition')
+    poa_key, meteo_data = cached_stage(
+        cache, 'poa', [read_key, day_key], {'poa_model': params['poa_model']},
+        lambda: get_operational_irradiance(meteo_data[meteo_mask], general_info,
+                                           array_info,
+                                           poa_model=params['poa_model']))
+
+    # Clear sky curve, on the daytime timestamps only
+    progress('clear sky')
+
+    def clear_sky():
+        csky_curve = clearsky_irradiance(times=inverter_day, general_info=general_info,
+                                         array_info=array_info, convertGHI_toPOA=True,
+                                         model_cs=params['clear_sky_model'])
+        csky_curve.index = csky_curve.index.tz_localize('UTC').tz_convert(tz_str).tz_localize(None)
+
+        # meteo data - for graph
+        csky_curve_meteo = clearsky_irradiance(times=meteo_day, general_info=general_info,
+                                               array_info=array_info, convertGHI_toPOA=True,
+                                               model_cs=params['clear_sky_model'])
+        csky_curve_meteo.index = csky_curve_meteo.index.tz_localize('UTC').tz_convert(tz_str).tz_localize(None)
+        return csky_curve, csky_curve_meteo
+
+    csky_key, (csky_curve, csky_curve_meteo) = cached_stage(
+        cache, 'clear_sky', [read_key, day_key],
+        {'clear_sky_model': params['clear_sky_model']}, clear_sky)
+
+    progress('filters')
+    # Data Sanitization- meteo
+    def meteo_filter():
+        flags = qc_flags(meteo_data, [(IRRADIANCE, 'G', params['irrad_low'],
+                                       params['irrad_high'])])
+        return apply_flags(meteo_data, flags)
+
+    meteo_filter_key, meteo_data_filtered = cached_stage(
+        cache, 'meteo_filter', [poa_key],
+        {name: params[name] for name in ['irrad_low', 'irrad_high']},
+        meteo_filter)
+
+    def quality_control():
+        # night, missing data and current/voltage outliers flagged in one
+        # pass over the daytime rows
+        inverter_data_day = inverter_data[inverter_mask]
+        night = ~daytime_mask(inverter_data_day.index, csky_curve,
+                              threshold=params['night_threshold'])
+        flags = qc_flags(inverter_data_day, [
+            (CURRENT, 'I', 0, current_limits(array_info, params['isc_factor'])),
+            (VOLTAGE, 'V', 0, voltage_limits(array_info, params['voc_factor']))],
+            night=night)
+        inverter_data_csky = inverter_data_day[~night]
+        day_flags = flags[~night]
+        inverter_data_filtered = apply_flags(inverter_data_csky, day_flags)
+
+        # % of missing data, and NaN after / NaN before the outlier filters
+        counts = flag_counts(day_flags)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            missing_data = round(np.float64(counts['missing']) / day_flags.size * 100, 2)
+            outlier_data = round(np.float64(np.count_nonzero(day_flags.to_numpy()))
+                                 / counts['missing'], 2)
+        print('Missing data for Inverter is {}'.format(missing_data))
+        print('Outliers: ', outlier_data)
+        # the rows pruned before the clear sky stage are night too
+        flags = flags.reindex(inverter_data.index, fill_value=NIGHT)
+        return (inverter_data_csky, inverter_data_filtered, flags,
+                missing_data, outlier_data)
+
+    qc_key, (inverter_data_csky, inverter_data_filtered, flags, missing_data,
+             outlier_data) = cached_stage(
+        cache, 'qc', [read_key, csky_key],
+        {name: params[name]
+         for name in ['night_threshold', 'isc_factor', 'voc_factor']},
+        quality_control)
+
+    _, meteo_data_csky = cached_stage(
+        cache, 'meteo_night', [meteo_filter_key, csky_key],
+        {'night_threshold': params['night_threshold']},
+        lambda: eliminate_nightvalues(meteo_data_filtered,
+                                      cs_data=csky_curve_meteo,
+                                      threshold=params['night_threshold']))
+
+    progress('imputation')
+    # the models of the site start from the registry, whose state is a
+    # parameter of the stage
+    site = model_registry.site_key(general_info, array_info)
+    registry = (model_registry.site_digest(site)
+                if model_registry.REGISTRY_ENABLED else None)
+
+    def imputation():
+        freq = pd.Timedelta(minutes=general_info['inverter_time_resolution'])
+        # gaps of the V and I of the inputs by length
+        curves = inverter_data_filtered.columns.get_level_values('curve')
+        gaps = gap_histogram(
+            inverter_data_filtered.loc[:, curves.isin(['V', 'I'])], freq)
+        print('Gaps by length (samples): {}'.format(gaps))
+        if missing_data > params['imputation_trigger']:
+            print('\n MISSING DATA FOUND!!')
+            print('\n Computing Missing Data using Machine Learning Models')
+            # multi-index df of the V and I of each input, the short gaps
+            # interpolated and the long ones predicted by the models, which
+            # start from the models of the previous uploads of the site
+            inverter_data_sanitized = impute_gaps(inverter_data_filtered,
+                                                  meteo_data_filtered,
+                                                  array_info, general_info,
+                                                  short_gap=params['short_gap'],
+                                                  site=site)
+
+        else:
+            irradiance = resampling_meteo(meteo_data_filtered, general_info)
+            inverter_data_sanitized = fill_short_gaps(
+                inverter_data_csky, irradiance, freq, params['short_gap'])
+            inverter_data_sanitized = inverter_data_sanitized.fillna(method = 'ffill').fillna(method='bfill')
+            print('\nData Availability {} %'.format(100 - missing_data))
+            print('\n FINAL STATUS : GOOD FOR ANALYSIS')
+
+        inverter_data_sanitized[inverter_data_sanitized<0] = np.nan
+        return inverter_data_sanitized, gaps
+
+    _, (inverter_data_sanitized, gaps) = cached_stage(
+        cache, 'imputation', [read_key, qc_key, meteo_filter_key],
+        dict({name: params[name] for name in ['imputation_trigger',
+                                              'short_gap']},
+             registry=registry),
+        imputation)
+
+    missing_data_post_sanitation = round((inverter_data_sanitized.isna().sum().sum()/inverter_data_csky.size)*100,2)
+
+    gap_rows = ['Gaps of length {}'.format(label) for label in gaps]
+    data_summary = pd.DataFrame(index=['Data Points Available',
+                                       'Temporal Resolution', 'Missing Data (%)',
+                                       'Outliers (%)', 'missing_data_post_sanitation']
+                                + gap_rows, columns=['Values'])
+
+    data_summary.loc['Data Points Available'] = str(data_points/1000) + ' K'
+    data_summary.loc['Temporal Resolution'] = str(general_info['inverter_time_resolution']) + ' Mins'
+    data_summary.loc['Missing Data (%)'] = missing_data
+    data_summary.loc['Outliers (%)'] = outlier_data
+    data_summary.loc['missing_data_post_sanitation'] = missing_data_post_sanitation
+    data_summary.loc[gap_rows, 'Values'] = list(gaps.values())
+    data_summary = data_summary.replace(np.nan,0)
+    print('Printing data summary in reading files:', data_summary)
+    print('#####################')
+
+    datasets = {
+        'array_info': array_info,
+        'inv_data': inverter_data,
+        'inv_data_csky': inverter_data_csky,
+        'inv_data_sani': inverter_data_sanitized,
+        'meteo_data': meteo_data,
+        'irr_df': irr_df,
+        'meteo_data_csky': meteo_data_csky,
+        'qc_flags': flags,
+    }
+    return datasets, data_summary, general_info
@@ -0,0 +1,152 @@
+"""
+This file contains the lightweight instrumentation of the pipeline stages.
+
+The functions of data_input and data_sanitization are decorated with
+profile_stage, and run_pipeline opens a Profile around each upload. While a
+profile is active every decorated call records its wall time, CPU time, peak
+RSS growth and the shape of the frame it returns. Outside a profile the
+decorators only cost a lookup, so the functions can be used as before.
+"""
+import sys
+import time
+import functools
+import contextlib
+import contextvars
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def frame_shape(result):
+    """(rows, columns) of a frame, or of the first frame of a tuple."""
+    if isinstance(result, tuple):
+        result = next((r for r in result
+                       if isinstance(r, (pd.DataFrame, pd.Series))), None)
+    if isinstance(result, pd.DataFrame):
+        return result.shape
+    if isinstance(result, pd.Series):
+        return len(result), 1
+    return None, None
+
+
+class Profile:
+    """
+    Per-stage timings and memory of a pipeline run.
+
+    Attributes
+    ----------
+    stages : list of dict
+        One record per stage, in the order the stages ended: name, depth
+        (nesting level), start_s, wall_s, cpu_s, peak_rss_delta_mb, rows,
+        columns.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._depth = 0
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager recording a stage. The yielded dict can be given
+        the output frame under 'result' to record its shape.
+        """
+        record = {'name': name, 'depth': self._depth}
+        rss_before = peak_rss_mb()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        record['start_s'] = round(wall_before - self._start, 4)
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            record['wall_s'] = round(time.perf_counter() - wall_before, 4)
+            record['cpu_s'] = round(time.process_time() - cpu_before, 4)
+            rss_after = peak_rss_mb()
+            record['peak_rss_delta_mb'] = (
+                round(rss_after - rss_before, 2) if rss_after is not None
+                else None)
+            record['rows'], record['columns'] = frame_shape(
+                record.pop('result', None))
+            self.stages.append(record)
+
+    def to_frame(self):
+        """The stages as a dataframe, in the order they started."""
+        df = pd.DataFrame(self.stages)
+        if not df.empty:
+            df = df.sort_values('start_s', kind='stable').reset_index(drop=True)
+        return df
+
+    def to_dict(self):
+        """json serializable records of the stages."""
+        return [dict(record) for record in self.stages]
+
+
+@contextlib.contextmanager
+def profiling():
+    """Activate a new Profile for the code run in the with block."""
+    profile = Profile()
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Record a block of code as a stage of the active profile, if any.
+
+    Examples
+    --------
+    >>> with stage('filters') as record:
+    ...     record['result'] = multiindex_current_filter(df, array_info)
+    """
+    profile = _active_profile.get()
+    if profile is None:
+        yield {}
+        return
+    with profile.stage(name) as record:
+        yield record
+
+
+def profile_stage(name=None):
+    """
+    Decorator recording each call of a function as a stage of the active
+    profile, with the shape of the frame it returns.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the stage, the name of the function by default.
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _active_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with profile.stage(stage_name) as record:
+                record['result'] = func(*args, **kwargs)
+                return record['result']
+        return wrapper
+    return decorator
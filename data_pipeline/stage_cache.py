@@ -0,0 +1,257 @@
+"""
+This file contains the content-addressed cache of the pipeline stages.
+
+The pipeline is a DAG of stages (see data_pipeline.pipeline). The key of a
+stage output is a hash of the stage name, its parameters and the keys of
+the stages it reads from, the first stage being keyed by the hash of the
+uploaded bytes. A re-upload of the same file therefore finds every stage in
+the cache, and changing a downstream parameter reruns only the stages
+below it.
+
+Outputs are pickled to local disk, shared by the workers of the server and
+the processes of the job pool. A file lock per key makes concurrent
+computations of the same stage wait for the first one instead of
+duplicating it.
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, stages are not coalesced
+    fcntl = None
+
+from data_store.result_store import STORE_DIR, STORE_TTL
+
+# Root folder of the cache, shared by all the workers of the server
+CACHE_DIR = os.environ.get('DST_STAGE_CACHE_DIR',
+                           os.path.join(STORE_DIR, '.stages'))
+# Maximum size of the cache on disk in bytes
+CACHE_MAX_BYTES = int(os.environ.get('DST_STAGE_CACHE_MAX_BYTES',
+                                     2 * 1024 ** 3))
+
+OUTPUT_SUFFIX = '.pkl'
+LOCK_SUFFIX = '.lock'
+
+
+def content_key(data):
+    """Hash of raw bytes, e.g. an uploaded file."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def stage_key(name, *parts):
+    """
+    Key of a stage output.
+
+    Parameters
+    ----------
+    name : str
+        Name (and version) of the stage.
+    *parts
+        json serializable parameters and keys of the parent stages.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal hash.
+    """
+    payload = json.dumps([name, parts], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class StageCache:
+    """
+    Disk cache of the stage outputs with file-lock coalescing.
+
+    Parameters
+    ----------
+    root : str, optional
+        Folder of the cached outputs.
+    max_bytes : int, optional
+        Disk quota, the least recently used outputs are removed above it.
+    ttl : float, optional
+        Seconds after the last access after which an output is removed.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES,
+                 ttl=STORE_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key, suffix=OUTPUT_SUFFIX):
+        # keys are hashes, refuse anything else
+        if not key or not str(key).isalnum():
+            raise KeyError('Invalid stage key: {!r}'.format(key))
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def get(self, key):
+        """
+        Read a cached output.
+
+        Returns
+        -------
+        found : bool
+            False if the key is not in the cache.
+        value : object
+            The cached output, None if not found.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False, None
+        try:
+            # last access time used by the eviction
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return True, value
+
+    def put(self, key, value):
+        """Write an output to the cache."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # writing then renaming, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-',
+                                        dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """Exclusive lock on a key, across threads and processes."""
+        if fcntl is None:
+            yield
+            return
+        path = self._path(key, LOCK_SUFFIX)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_or_compute(self, key, func):
+        """
+        Return the cached output of key, calling func() to compute it on a
+        miss. Concurrent misses on the same key call func only once.
+
+        Returns
+        -------
+        value : object
+            The output.
+        cached : bool
+            True if the output was read from the cache.
+        """
+        found, value = self.get(key)
+        if found:
+            return value, True
+        with self.lock(key):
+            # computed by another process while we were waiting
+            found, value = self.get(key)
+            if found:
+                return value, True
+            value = func()
+            self.put(key, value)
+            return value, False
+
+    def _entries(self):
+        """List of (last access, size in bytes, path) of the outputs."""
+        entries = []
+        for folder in os.scandir(self.root):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(OUTPUT_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _remove_lock(self, path):
+        """
+        Remove a lock file unless it is held, e.g. by a stage being computed.
+        A process waiting on it meanwhile may compute the stage twice.
+        """
+        if fcntl is None:
+            return
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _stale_locks(self, now):
+        """Lock files older than the TTL without an output."""
+        locks = []
+        for folder in os.scandir(self.root):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(LOCK_SUFFIX):
+                    continue
+                output = entry.path[:-len(LOCK_SUFFIX)] + OUTPUT_SUFFIX
+                try:
+                    if now - entry.stat().st_mtime > self.ttl and \
+                            not os.path.exists(output):
+                        locks.append(entry.path)
+                except FileNotFoundError:
+                    continue
+        return locks
+
+    def evict(self):
+        """
+        Remove the expired outputs, then the least recently used ones until
+        the cache fits in its disk quota, with their lock files. The lock
+        files of the stages which failed are removed after the TTL.
+
+        Returns
+        -------
+        removed : int
+            Number of removed outputs.
+        """
+        now = time.time()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for last_access, size, path in entries:
+            if now - last_access > self.ttl or total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._remove_lock(path[:-len(OUTPUT_SUFFIX)] + LOCK_SUFFIX)
+                total -= size
+                removed += 1
+        for path in self._stale_locks(now):
+            self._remove_lock(path)
+        return removed
@@ -6,13 +6,16 @@ Created on Tue Dec 21 08:05:37 2021
 """
 
 import pandas as pd
-from pvlib.irradiance import get_total_irradiance
 from data_sanitization.site_location_pvlib import get_site_location
+from data_sanitization.solar_geometry import get_clearsky, get_solar_geometry
 from data_input.add_multi_index_level import add_index_curve_level
+from data_input.poa_irradiance import transpose_inputs
+from data_pipeline.profiling import profile_stage
 
 
 def cs_transpose(times, site_location, clearsky, general_info, array_info,
-                 model_transpose='isotropic', temp_val=12):
+                 model_transpose='isotropic', temp_val=12,
+                 solar_position=None):
     '''
     Function that converts Multiindex dataframe containing clearsky GHI to POA
 
@@ -35,7 +38,11 @@ def cs_transpose(times, site_location, clearsky, general_info, array_info,
         DESCRIPTION. Scientific models used to transpose GHI to POA.
         The default is 'isotropic'.
     temp_val : int, optional
-        DESCRIPTION. Temperature. The default is 12.
+        DESCRIPTION. Air temperature (C) of the solar position refraction.
+        The default is 12.
+    solar_position : pandas.Dataframe, optional
+        DESCRIPTION. Solar geometry of times, read from the shared cache by
+        default.
 
     Returns
     -------
@@ -43,34 +50,23 @@ def cs_transpose(times, site_location, clearsky, general_info, array_info,
         DESCRIPTION. Multindex or single index dataframe having transposed GHI
 
     '''
-    solar_position = site_location.get_solarposition(times=times)
-    # Translate irradiance to POA
-    irradiance = pd.DataFrame([], columns=[])
-    # Estimates the POA for each input (in a for loop)
-    for surface_tilt, surface_azimuth in zip(
-            array_info['surface_tilt'],
-            array_info['surface_azimuth']):
-        irrads = get_total_irradiance(
-            surface_tilt=surface_tilt,
-            surface_azimuth=surface_azimuth,
-            solar_zenith=solar_position['apparent_zenith'],
-            solar_azimuth=solar_position['azimuth'],
-            dni=clearsky['dni'],
-            ghi=clearsky['ghi'],
-            dhi=clearsky['dhi'],
-            model=model_transpose)
-        if irradiance.empty:
-            irradiance = pd.DataFrame(irrads['poa_global'], index=times)
-        else:
-            irradiance = pd.concat([irradiance, pd.DataFrame(
-                irrads['poa_global'],
-                index=times)],
-                axis=1)
+    if solar_position is None:
+        solar_position = get_solar_geometry(times, site_location.latitude,
+                                            site_location.longitude,
+                                            site_location.altitude,
+                                            temperature=temp_val)
+    # Translate irradiance to POA, once per orientation of the inputs
+    poa = transpose_inputs(array_info, solar_position, clearsky['ghi'],
+                           clearsky['dni'], clearsky['dhi'],
+                           model=model_transpose)
     # The column names are included in the same order as in the array_info
-    irradiance.columns = add_index_curve_level(array_info.index, 'CS_G')
+    irradiance = pd.DataFrame(poa, index=times,
+                              columns=add_index_curve_level(array_info.index,
+                                                            'CS_G'))
     return irradiance
 
 
+@profile_stage()
 def clearsky_irradiance(times, general_info, array_info, convertGHI_toPOA=True,
                         model_cs='simplified_solis',
                         model_transpose='isotropic',
@@ -93,13 +89,15 @@ def clearsky_irradiance(times, general_info, array_info, convertGHI_toPOA=True,
         DESCRIPTION. Converts clearsky GHI to POA if condition is True.
         The default is True.
     model_cs : String, optional
-        DESCRIPTION. Scientific models used to estimate clear sky.
-        The default is 'simplified_solis'.
+        DESCRIPTION. Scientific models used to estimate clear sky: 'ineichen',
+        'haurwitz' or 'simplified_solis' (see
+        data_sanitization.clear_sky_models). The default is 'simplified_solis'.
     model_transpose : string, optional
         DESCRIPTION. Scientific models used to transpose GHI to POA.
         The default is 'isotropic'.
     temp_val : int, optional
-        DESCRIPTION. Temperature. The default is 12.
+        DESCRIPTION. Air temperature (C) of the solar position refraction.
+        The default is 12.
 
     Returns
     -------
@@ -114,14 +112,22 @@ def clearsky_irradiance(times, general_info, array_info, convertGHI_toPOA=True,
         longitude=general_info['long'],
         altitude=general_info['alt'],
         tz=general_info['timezone'])
-    # Create clearky data using get_clearsky object from pvlib
-    clearsky = site_location.get_clearsky(times=times, model=model_cs)
+    # Solar position computed once for the clear sky and its transposition
+    solar_position = get_solar_geometry(times, general_info['lat'],
+                                        general_info['long'],
+                                        general_info['alt'],
+                                        temperature=temp_val)
+    # Create clearky data with the selected clear sky model
+    clearsky = get_clearsky(site_location, times, model=model_cs,
+                            solar_geometry=solar_position,
+                            temperature=temp_val)
     # Converts GHI to POA if convertGHI_POA condition holds True
     if convertGHI_toPOA:
         print("Converting Clearsky GHI to Cleay sky POA...")
         cs_data = cs_transpose(times, site_location, clearsky, general_info,
                                array_info, model_transpose=model_transpose,
-                               temp_val=temp_val)
+                               temp_val=temp_val,
+                               solar_position=solar_position)
     else:
         # Estimating clearky GHI
         cs_data = clearsky['ghi']
@@ -0,0 +1,163 @@
+"""
+Clear sky models computed from the shared solar geometry.
+
+Each model of CLEAR_SKY_MODELS takes the solar geometry of an upload (see
+data_sanitization.solar_geometry.get_solar_geometry) and the site, and
+returns its clear sky GHI, DNI and DHI in one vectorized pass. A model
+giving the GHI only (haurwitz) is decomposed into DNI and DHI with erbs, as
+the measured GHI is in data_input.poa_irradiance.
+
+The monthly Linke turbidity of the ineichen model is read from the pvlib
+dataset once per site, then kept in memory and on disk.
+"""
+import os
+import calendar
+import threading
+import numpy as np
+import pandas as pd
+from pvlib import atmosphere, clearsky
+from pvlib.irradiance import erbs
+
+from data_sanitization.ephemeris_tables import TABLES_DIR
+
+# Folder of the monthly Linke turbidity of the sites
+TURBIDITY_DIR = os.path.join(TABLES_DIR, 'linke_turbidity')
+
+# Climatological defaults of simplified_solis, as pvlib
+AOD700 = 0.1
+PRECIPITABLE_WATER = 1.0
+
+# (latitude, longitude) -> 12 monthly Linke turbidity values
+_turbidity = {}
+_turbidity_lock = threading.Lock()
+
+
+def get_linke_turbidity(latitude, longitude, root=TURBIDITY_DIR):
+    """
+    Monthly Linke turbidity of a site, cached in memory and on disk.
+
+    Parameters
+    ----------
+    latitude : Float
+        Latitude of the site in decimal degrees.
+    longitude : Float
+        Longitude of the site in decimal degrees.
+    root : str, optional
+        Folder of the cached values.
+
+    Returns
+    -------
+    turbidity : numpy array
+        Linke turbidity of January to December.
+
+    """
+    site = (round(float(latitude), 6), round(float(longitude), 6))
+    turbidity = _turbidity.get(site)
+    if turbidity is not None:
+        return turbidity
+    path = os.path.join(root, '{}_{}.npy'.format(*site))
+    try:
+        turbidity = np.load(path)
+    except (FileNotFoundError, ValueError):
+        # one timestamp per month
+        months = pd.date_range('2015-01-01', periods=12, freq='MS')
+        turbidity = clearsky.lookup_linke_turbidity(
+            months, *site, interp_turbidity=False).to_numpy(dtype=float)
+        os.makedirs(root, exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, turbidity)
+        os.replace(tmp_path, path)
+    with _turbidity_lock:
+        _turbidity[site] = turbidity
+    return turbidity
+
+
+def _month_middles(year):
+    """Day of year of the middle of the months, with the Decembers and
+    Januaries around, as pvlib."""
+    days = np.array(calendar.mdays[1:])
+    if calendar.isleap(year):
+        days[1] += 1
+    return np.concatenate([[-calendar.mdays[12] / 2.0],
+                           np.cumsum(days) - days / 2.0,
+                           [days.sum() + calendar.mdays[1] / 2.0]])
+
+
+def interpolate_turbidity(turbidity, times):
+    """
+    Linke turbidity of each timestamp, interpolated from the monthly values
+    on the day of year as pvlib lookup_linke_turbidity does.
+    """
+    values = np.concatenate([[turbidity[-1]], turbidity, [turbidity[0]]])
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert('UTC')
+    dayofyear = times.dayofyear.to_numpy()
+    return np.where(times.is_leap_year,
+                    np.interp(dayofyear, _month_middles(2016), values),
+                    np.interp(dayofyear, _month_middles(2015), values))
+
+
+def ineichen(times, geometry, site):
+    """Ineichen and Perez model with the cached Linke turbidity."""
+    linke_turbidity = interpolate_turbidity(get_linke_turbidity(*site[:2]),
+                                            times)
+    return clearsky.ineichen(geometry['apparent_zenith'].to_numpy(),
+                             geometry['airmass_absolute'].to_numpy(),
+                             linke_turbidity, altitude=site[2],
+                             dni_extra=geometry['dni_extra'].to_numpy())
+
+
+def haurwitz(times, geometry, site):
+    """Haurwitz GHI, decomposed into DNI and DHI with erbs."""
+    ghi = clearsky.haurwitz(geometry['apparent_zenith'])['ghi'].to_numpy()
+    components = erbs(ghi, geometry['zenith'].to_numpy(), times)
+    return {'ghi': ghi, 'dni': components['dni'], 'dhi': components['dhi']}
+
+
+def simplified_solis(times, geometry, site):
+    """Simplified Solis model with climatological aerosol and water."""
+    return clearsky.simplified_solis(
+        geometry['apparent_elevation'].to_numpy(), aod700=AOD700,
+        precipitable_water=PRECIPITABLE_WATER,
+        pressure=atmosphere.alt2pres(site[2]),
+        dni_extra=geometry['dni_extra'].to_numpy())
+
+
+# Clear sky models by name, model(times, geometry, (lat, long, alt)) returns
+# the ghi, dni and dhi arrays
+CLEAR_SKY_MODELS = {'ineichen': ineichen, 'haurwitz': haurwitz,
+                    'simplified_solis': simplified_solis}
+
+
+def compute_clearsky(times, geometry, site, model='simplified_solis'):
+    """
+    Clear sky irradiance of a model.
+
+    Parameters
+    ----------
+    times : Pandas DatetimeIndex
+        Timestamps, in UTC when naive.
+    geometry : Pandas DataFrame
+        Solar geometry of times.
+    site : tuple
+        (latitude, longitude, altitude) of the site.
+    model : String, optional
+        Name of a model of CLEAR_SKY_MODELS.
+        The default is 'simplified_solis'.
+
+    Returns
+    -------
+    clearsky : Pandas DataFrame
+        Columns ghi, dni and dhi, indexed by times.
+
+    """
+    try:
+        func = CLEAR_SKY_MODELS[model]
+    except KeyError:
+        raise ValueError('{} is not a valid clear sky model. Must be one of '
+                         '{}'.format(model, ', '.join(CLEAR_SKY_MODELS)))
+    components = func(times, geometry, site)
+    return pd.DataFrame({name: np.asarray(components[name], dtype=float)
+                         for name in ['ghi', 'dni', 'dhi']}, index=times)
@@ -0,0 +1,165 @@
+"""
+Downsampling of the time series sent to the dashboard graphs.
+
+A year of 1-minute data is about half a million samples per trace, far more
+than the 1000 pixels of a graph. The series are reduced to a bounded number of
+points before being plotted, either keeping the min and the max of each pixel
+bucket (outliers stay visible) or with the Largest-Triangle-Three-Buckets
+algorithm. Zooming on a graph refetches the zoomed window only, at full
+resolution when it fits in the budget.
+"""
+import numpy as np
+import pandas as pd
+
+# Maximum number of points per trace, 2 per pixel of the 1000 px wide graphs
+MAX_POINTS = 2000
+
+
+def _bucket_edges(n, n_buckets):
+    """Start positions of n_buckets contiguous buckets over n samples."""
+    return np.linspace(0, n, n_buckets + 1).astype(np.int64)
+
+
+def _first_per_bucket(hit, bucket_id):
+    """First position where hit is True in each bucket."""
+    positions = np.flatnonzero(hit)
+    _, first = np.unique(bucket_id[positions], return_index=True)
+    return positions[first]
+
+
+def minmax_indices(y, n_out):
+    """
+    Positions of the min and the max of each bucket.
+
+    Parameters
+    ----------
+    y : numpy array
+        Values, may contain NaN.
+    n_out : int
+        Maximum number of positions returned.
+
+    Returns
+    -------
+    positions : numpy array
+        Sorted positions in y. A bucket containing only NaN keeps its first
+        position, so gaps are still drawn as gaps.
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return np.arange(n)
+    edges = _bucket_edges(n, n_buckets)
+    bucket_id = np.repeat(np.arange(n_buckets), np.diff(edges))
+    nan = np.isnan(y)
+    low = np.where(nan, np.inf, y)
+    high = np.where(nan, -np.inf, y)
+    bucket_min = np.minimum.reduceat(low, edges[:-1])[bucket_id]
+    bucket_max = np.maximum.reduceat(high, edges[:-1])[bucket_id]
+    # first position reaching the bucket extreme; in an all-NaN bucket every
+    # position does, so its first position is kept
+    first = _first_per_bucket(low == bucket_min, bucket_id)
+    last = _first_per_bucket(high == bucket_max, bucket_id)
+    return np.unique(np.concatenate([first, last]))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Positions kept by the Largest-Triangle-Three-Buckets algorithm.
+
+    Parameters
+    ----------
+    x : numpy array
+        Increasing abscissa, e.g. the timestamps as int64.
+    y : numpy array
+        Values, may contain NaN.
+    n_out : int
+        Number of positions returned.
+
+    Returns
+    -------
+    positions : numpy array
+        Sorted positions in y, the first and the last included.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    edges = _bucket_edges(n - 2, n_out - 2) + 1
+    positions = np.empty(n_out, dtype=np.int64)
+    positions[0], positions[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_y = y[end:next_end]
+        # mean point of the next bucket, the last point kept when it is empty
+        c_x = x[end:next_end].mean()
+        c_y = np.nanmean(next_y) if (~np.isnan(next_y)).any() else y[a]
+        area = np.abs((x[a] - c_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (c_y - y[a]))
+        if np.isnan(area).all():
+            a = start
+        else:
+            a = start + int(np.nanargmax(area))
+        positions[i + 1] = a
+    return positions
+
+
+def downsample(series, max_points=MAX_POINTS, method='minmax'):
+    """
+    Reduce a time series to at most max_points points.
+
+    Parameters
+    ----------
+    series : Pandas Series
+        Series with a datetime index.
+    max_points : int, default MAX_POINTS
+        Maximum number of points returned.
+    method : str, default 'minmax'
+        'minmax' keeps the min and max of each bucket, 'lttb' uses the
+        Largest-Triangle-Three-Buckets algorithm.
+
+    Returns
+    -------
+    series : Pandas Series
+        The series itself if it is short enough, a subset of it otherwise.
+    """
+    if len(series) <= max_points:
+        return series
+    y = series.to_numpy(dtype=np.float64)
+    if method == 'minmax':
+        positions = minmax_indices(y, max_points)
+    elif method == 'lttb':
+        positions = lttb_indices(series.index.asi8, y, max_points)
+    else:
+        raise ValueError('Unknown downsampling method: {}'.format(method))
+    return series.iloc[positions]
+
+
+def relayout_x_range(relayout_data):
+    """
+    Read the x axis range from the relayoutData of a dcc.Graph.
+
+    Parameters
+    ----------
+    relayout_data : dict or None
+        relayoutData property of the graph.
+
+    Returns
+    -------
+    x_range : tuple or None
+        (start, end) timestamps of a zoom, (None, None) when the graph was
+        reset to its full extent and None when the x axis did not change.
+    """
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return None, None
+    if 'xaxis.range[0]' in relayout_data:
+        start = relayout_data['xaxis.range[0]']
+        end = relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+    else:
+        return None
+    return pd.Timestamp(start), pd.Timestamp(end)
@@ -7,8 +7,66 @@ Created on Tue Dec 21 08:05:37 2021
 
 import pandas as pd
 import numpy as np
+from data_pipeline.profiling import profile_stage
+from data_sanitization.solar_geometry import get_solar_geometry
 
 
+@profile_stage()
+def daytime_index(times, general_info):
+    '''
+    This function returns the timestamps with the sun above the horizon,
+    from the apparent solar elevation. The clear sky irradiance is zero at
+    the other timestamps, so they can be pruned before any clear sky or POA
+    computation.
+
+    Parameters
+    ----------
+    times : pandas.core.indexes.datetimes.DatetimeIndex
+        Timestamps, in UTC when naive.
+    general_info : Dictionary
+         Latitude and Longitude in decimal degree format only
+         Altitude in meters
+
+    Returns
+    -------
+    pandas.core.indexes.datetimes.DatetimeIndex
+        Daytime timestamps of times
+
+    '''
+    solar_position = get_solar_geometry(times, general_info['lat'],
+                                        general_info['long'],
+                                        general_info['alt'])
+    return times[solar_position['apparent_elevation'].to_numpy() > 0]
+
+
+def daytime_mask(index, cs_data, threshold=0):
+    '''
+    This function returns which timestamps of index are daytime, i.e. have
+    a POA irradiance obtained using clearsky GHI above threshold.
+
+    Parameters
+    ----------
+    index : pandas.core.indexes.datetimes.DatetimeIndex
+        Timestamps of the data.
+    cs_data : pandas.Dataframe
+        DataFrame with POA based on clearsky values. Column name = 'G'
+    threshold : int, optional
+        The values below which the data is night. The default is 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array, True for the daytime timestamps of index
+
+    '''
+    # Get timestamp corresponding to solar-hours i.e  G > 0
+    day = cs_data.gt(threshold)
+    if isinstance(day, pd.DataFrame):
+        day = day.any(axis=1)
+    return index.isin(cs_data.index[day.to_numpy()])
+
+
+@profile_stage()
 def eliminate_nightvalues(data, cs_data, threshold=0):
     '''
     This function is used to filter out the night time values by using the
@@ -29,10 +87,6 @@ def eliminate_nightvalues(data, cs_data, threshold=0):
         Filtered dataframe
 
     '''
-    df = data.copy()
-    df1 = cs_data.copy()
-    # Get timestamp corresponding to solar-hours i.e  G > 0
-    day_df = df1[df1 > threshold].dropna(how="all")
     # Filtered dataframe
-    df = df[df.index.isin(day_df.index)]
+    df = data[daytime_mask(data.index, cs_data, threshold)]
     return df
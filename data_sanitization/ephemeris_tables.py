@@ -0,0 +1,254 @@
+"""
+Per-site tables of solar geometry and clear sky irradiance on disk.
+
+A table holds one UTC year of a site at 1 minute resolution, e.g. the
+output of data_sanitization.solar_geometry.get_solar_geometry or the clear
+sky GHI, DNI and DHI of a model. It is computed once, saved as a .npy file
+and memory-mapped by every process of the server, so the timestamps of an
+upload falling on whole minutes are read from it instead of recomputed. The
+sites uploaded every week therefore pay the computation once per year.
+
+A year is only built for an upload with at least TABLES_MIN_ROWS timestamps
+in it, a shorter one is computed directly unless the table is already on
+disk. The tables not read for TABLES_TTL are removed, then the least
+recently read ones until the folder fits in TABLES_MAX_BYTES.
+"""
+import os
+import time
+import contextlib
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, tables may be built twice
+    fcntl = None
+
+from data_store.result_store import STORE_DIR
+
+# Root folder of the tables, shared by all the workers of the server
+TABLES_DIR = os.environ.get('DST_EPHEMERIS_DIR',
+                            os.path.join(STORE_DIR, '.ephemeris'))
+# Set to 0 to compute the solar geometry of every upload instead
+TABLES_ENABLED = os.environ.get('DST_EPHEMERIS_TABLES', '1') != '0'
+# Timestamps of an upload in a year for its table to be built, about a tenth
+# of the rows of a table
+TABLES_MIN_ROWS = int(os.environ.get('DST_EPHEMERIS_MIN_ROWS', 50000))
+# Tables not read for this long (seconds) are removed
+TABLES_TTL = float(os.environ.get('DST_EPHEMERIS_TTL', 30 * 24 * 3600))
+# Maximum size of the tables on disk in bytes
+TABLES_MAX_BYTES = int(os.environ.get('DST_EPHEMERIS_MAX_BYTES',
+                                      2 * 1024 ** 3))
+
+TABLE_SUFFIX = '.npy'
+LOCK_SUFFIX = '.lock'
+
+# Resolution of the tables
+STEP_NS = 60 * 10 ** 9
+
+# Memory maps opened by this process, by path
+_tables = {}
+
+
+def site_folder(site, root=TABLES_DIR):
+    """Folder of the tables of a site, e.g. (latitude, longitude, altitude)."""
+    return os.path.join(root, '_'.join(str(part) for part in site))
+
+
+def year_range(year):
+    """First timestamp (UTC ns) and number of rows of the table of a year."""
+    start = pd.Timestamp(year=year, month=1, day=1).value
+    end = pd.Timestamp(year=year + 1, month=1, day=1).value
+    return start, (end - start) // STEP_NS
+
+
+@contextlib.contextmanager
+def _lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path + LOCK_SUFFIX, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _open(path, year, build):
+    """
+    Memory map of a table, built by build(timestamps) if missing. None if
+    build is None and the table is not on disk.
+    """
+    table = _tables.get(path)
+    if table is not None:
+        try:
+            # last access time used by the eviction
+            os.utime(path)
+            return table
+        except FileNotFoundError:
+            # evicted by another process, the map would keep it on disk
+            del _tables[path]
+    if not os.path.exists(path):
+        if build is None:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # concurrent builds of the same table wait for the first one
+        with _lock(path):
+            if not os.path.exists(path):
+                start, n_rows = year_range(year)
+                values = np.ascontiguousarray(
+                    build(start + STEP_NS * np.arange(n_rows, dtype=np.int64)),
+                    dtype=float)
+                tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, values)
+                os.replace(tmp_path, path)
+            evict_tables(os.path.dirname(os.path.dirname(path)), keep=path)
+    table = np.load(path, mmap_mode='r')
+    _tables[path] = table
+    return table
+
+
+def read_table(site, name, utc_ns, build, root=TABLES_DIR, min_rows=None):
+    """
+    Read the rows of a site table at some timestamps. The table of a year is
+    built if missing only for min_rows timestamps or more in that year.
+
+    Parameters
+    ----------
+    site : tuple
+        Key of the site, e.g. (latitude, longitude, altitude).
+    name : str
+        Name of the table, e.g. 'geometry'.
+    utc_ns : numpy array of int64
+        UTC timestamps in ns.
+    build : callable
+        build(timestamps) returns the 2-D array of the table for a year of
+        UTC timestamps in ns, called when the table is not on disk yet.
+    root : str, optional
+        Root folder of the tables.
+    min_rows : int, optional
+        Timestamps in a year for its table to be built. The default is
+        TABLES_MIN_ROWS.
+
+    Returns
+    -------
+    found : numpy array of bool
+        True for the timestamps read from the tables, on a whole minute.
+    values : numpy array
+        Rows of the table, NaN where not found. None if no timestamp was
+        read from the tables.
+
+    """
+    if min_rows is None:
+        min_rows = TABLES_MIN_ROWS
+    utc_ns = np.asarray(utc_ns, dtype=np.int64)
+    found = utc_ns % STEP_NS == 0
+    if not found.any():
+        return found, None
+    folder = site_folder(site, root)
+    years = pd.DatetimeIndex(utc_ns).year.to_numpy()
+    values = None
+    for year in np.unique(years[found]):
+        rows = found & (years == year)
+        # a short upload is cheaper to compute than the year
+        table = _open(os.path.join(folder, '{}_{}{}'.format(
+                          name, year, TABLE_SUFFIX)),
+                      int(year), build if rows.sum() >= min_rows else None)
+        if table is None:
+            found[rows] = False
+            continue
+        if values is None:
+            values = np.full((len(utc_ns), table.shape[1]), np.nan)
+        start, _ = year_range(int(year))
+        values[rows] = table[(utc_ns[rows] - start) // STEP_NS]
+    return found, values
+
+
+def _remove_lock(path):
+    """Remove the lock file of a table unless a build holds it."""
+    if fcntl is None:
+        return
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _entries(root):
+    """List of (last access, size in bytes, path) of the tables."""
+    entries = []
+    for folder in os.scandir(root):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            if not entry.name.endswith(TABLE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def evict_tables(root=TABLES_DIR, ttl=None, max_bytes=None, keep=None):
+    """
+    Remove the tables not read for ttl seconds, then the least recently read
+    ones until the tables fit in max_bytes, with their lock files. The
+    processes which mapped a removed table keep reading it until they look
+    it up again.
+
+    Parameters
+    ----------
+    root : str, optional
+        Root folder of the tables.
+    ttl : float, optional
+        The default is TABLES_TTL.
+    max_bytes : int, optional
+        The default is TABLES_MAX_BYTES.
+    keep : str, optional
+        Path of a table never removed, e.g. the one just built.
+
+    Returns
+    -------
+    removed : int
+        Number of removed tables.
+    """
+    ttl = TABLES_TTL if ttl is None else ttl
+    max_bytes = TABLES_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    entries = sorted(_entries(root))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for last_access, size, path in entries:
+        if path == keep:
+            continue
+        if now - last_access > ttl or total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            _remove_lock(path + LOCK_SUFFIX)
+            _tables.pop(path, None)
+            total -= size
+            removed += 1
+    return removed
+
+
+def clear_tables():
+    """Close the memory maps opened by this process."""
+    _tables.clear()
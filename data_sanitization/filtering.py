@@ -1,6 +1,7 @@
 """Filtering outliers."""
 import pandas as pd
 import rdtools
+from data_pipeline.profiling import profile_stage
 
 
 def irradiance_filter(irrad, irrad_low=200, irrad_high=1200):
@@ -26,6 +27,7 @@ def irradiance_filter(irrad, irrad_low=200, irrad_high=1200):
     return irrad_mask
 
 
+@profile_stage()
 def multiindex_irradiance_filter(meteo_data, irrad_low=200, irrad_high=1200):
     """
     Filter POA irradiance readings based on measurement bounds.
@@ -54,7 +56,8 @@ def multiindex_irradiance_filter(meteo_data, irrad_low=200, irrad_high=1200):
 
 
 def current_filter(current, array_info,
-                   isc_col='i_sc', no_str_col='number_of_strings'):
+                   isc_col='i_sc', no_str_col='number_of_strings',
+                   isc_factor=1.2):
     """
     Filter current readings based on the short circuit current.
 
@@ -68,6 +71,8 @@ def current_filter(current, array_info,
         Name of the column with Isc information in "array_info".
     no_str_col: String, default 'number_of_strings'
         Name of the column with number of strings information in "array_info".
+    isc_factor: float, default 1.2
+        Multiple of the short circuit current accepted as upper bound.
 
     Returns
     -------
@@ -78,16 +83,17 @@ def current_filter(current, array_info,
     isc = float(array_info[isc_col])
     no_str = int(array_info[no_str_col])
 
-    # The short circuit current is multiplied by 1.2 to accommodate
+    # The short circuit current is multiplied by 1.2 by default to accommodate
     # the maximum threshold of 1200 W/m^2 in the irradiance_filter function.
     # It is then multiplied with the number of strings
     # to get the upper bound.
-    current_mask = (current > 0) & (current <= 1.2 * isc * no_str)
+    current_mask = (current > 0) & (current <= isc_factor * isc * no_str)
 
     return current_mask
 
 
-def multiindex_current_filter(inverter_data, array_info):
+@profile_stage()
+def multiindex_current_filter(inverter_data, array_info, isc_factor=1.2):
     """
     Filter current readings on the multi-index dataframe.
 
@@ -97,6 +103,8 @@ def multiindex_current_filter(inverter_data, array_info):
         DataFrame containing operational data.
     array_info : pandas DataFrame
         DataFrame containing system information.
+    isc_factor : float, default 1.2
+        Multiple of i_sc * number_of_strings accepted as upper bound.
 
     Returns
     -------
@@ -107,7 +115,7 @@ def multiindex_current_filter(inverter_data, array_info):
     inv_data_1 = inverter_data.filter(like='Inv')
     filter_df = inverter_data[(inv_data_1.xs('I', axis=1, level='curve').ge(0)
                                & inv_data_1.xs('I', axis=1, level='curve').le(
-                                  1.2 * array_info.xs('i_sc', axis=1)
+                                  isc_factor * array_info.xs('i_sc', axis=1)
                                   * array_info.xs('number_of_strings',
                                                   axis=1)))]
 
@@ -115,7 +123,8 @@ def multiindex_current_filter(inverter_data, array_info):
 
 
 def voltage_filter(voltage, array_info,
-                   voc_col='v_oc', mod_x_str_col='modules_per_string'):
+                   voc_col='v_oc', mod_x_str_col='modules_per_string',
+                   voc_factor=1.0):
     """
     Filter voltage readings based on the open circuit voltage.
 
@@ -129,6 +138,8 @@ def voltage_filter(voltage, array_info,
         Name of the column with Voc information in "array_info".
     mod_x_str_col : string, default 'modules_per_string'
         Name of the column with modules per string information in "array_info".
+    voc_factor : float, default 1.0
+        Multiple of the open circuit voltage accepted as upper bound.
 
     Returns
     -------
@@ -142,12 +153,13 @@ def voltage_filter(voltage, array_info,
 
     # The open circuit voltage is multiplied with the number of modules
     # per string to get the upper bound.
-    voltage_mask = (voltage > 0) & (voltage <= voc * mod_x_str)
+    voltage_mask = (voltage > 0) & (voltage <= voc_factor * voc * mod_x_str)
 
     return voltage_mask
 
 
-def multiindex_voltage_filter(inverter_data, array_info):
+@profile_stage()
+def multiindex_voltage_filter(inverter_data, array_info, voc_factor=1.0):
     """
     Filter voltage readings on the multi-index dataframe.
 
@@ -157,6 +169,8 @@ def multiindex_voltage_filter(inverter_data, array_info):
         DataFrame containing operational data.
     array_info : pandas DataFrame
         DataFrame containing system information.
+    voc_factor : float, default 1.0
+        Multiple of v_oc * modules_per_string accepted as upper bound.
 
     Returns
     -------
@@ -167,7 +181,7 @@ def multiindex_voltage_filter(inverter_data, array_info):
     inv_data_1 = inverter_data.filter(like='Inv')
     filter_df = inverter_data[(inv_data_1.xs('V', axis=1, level='curve').ge(0)
                                & inv_data_1.xs('V', axis=1, level='curve').le(
-                                   array_info.xs('v_oc', axis=1)
+                                   voc_factor * array_info.xs('v_oc', axis=1)
                                    * array_info.xs('modules_per_string',
                                                    axis=1)))]
 
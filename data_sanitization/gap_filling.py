@@ -0,0 +1,227 @@
+"""
+Gap-length-aware imputation of the inverter data.
+
+Most gaps of the inverter data are one or two samples long, a ridge
+regression per input is not needed to fill them. The gaps (runs of NaN) of
+every column are found in one vectorized pass, a gap being broken by the
+night and the missing timestamps. The short gaps are interpolated between
+the values on both sides, or hold the value on one side at the edges of the
+day: linearly for V, and as the ratio to the irradiance of the input for I
+and P, which follow the irradiance. Only the inputs left with gaps are sent
+to data_sanitization.models.predict_missing_data.
+"""
+import numpy as np
+import pandas as pd
+
+from data_pipeline.profiling import profile_stage
+from data_sanitization.models import predict_missing_data, resampling_meteo
+
+# Longest gap (samples) interpolated instead of predicted by the models
+SHORT_GAP = 2
+# Curves interpolated as their ratio to the irradiance of the input
+SCALED_CURVES = ['I', 'P']
+# Irradiance (W/m2) under which the curves are interpolated linearly
+IRRADIANCE_MIN = 10
+# Lower edges of the bins of the gap lengths (samples) in the data summary
+GAP_BINS = [1, 2, 3, 7, 13]
+
+
+def segment_breaks(index, freq=None):
+    """
+    True for the rows starting a run of regular timestamps, e.g. the first
+    daytime row of each day.
+
+    Parameters
+    ----------
+    index : pandas DatetimeIndex
+        Sorted timestamps.
+    freq : pandas Timedelta, optional
+        Time resolution. The default is the smallest step of index.
+    """
+    times = index.asi8
+    breaks = np.ones(len(times), dtype=bool)
+    if len(times) > 1:
+        steps = np.diff(times)
+        step = steps.min() if freq is None else pd.Timedelta(freq).value
+        breaks[1:] = steps != step
+    return breaks
+
+
+def gap_runs(missing, breaks=None):
+    """
+    Runs of missing values of each column of a 2-D mask.
+
+    Parameters
+    ----------
+    missing : numpy array of bool
+        (time x column) mask of the missing values.
+    breaks : numpy array of bool, optional
+        True for the rows a run cannot continue over from the previous row,
+        see segment_breaks.
+
+    Returns
+    -------
+    run : numpy array
+        (time x column) index of the run of each missing value, -1 for the
+        values which are not missing.
+    column, start, length : numpy arrays
+        Column, first row and number of rows of each run, by column then
+        row.
+    before, after : numpy arrays of bool
+        True for the runs with a value before (after) them in their segment.
+    """
+    n_rows = missing.shape[0]
+    if breaks is None:
+        breaks = np.zeros(n_rows, dtype=bool)
+    # a break after the last row too, the runs end there
+    breaks = np.append(breaks, True)
+    breaks[0] = True
+    # one row per column, the runs in column then row order
+    mask = missing.T
+    joined = ~breaks[1:-1]
+    before = np.zeros_like(mask)
+    before[:, 1:] = mask[:, :-1] & joined
+    first = mask & ~before
+    starts = np.flatnonzero(first)
+    column, start = np.divmod(starts, n_rows)
+    after = np.zeros_like(mask)
+    after[:, :-1] = mask[:, 1:] & joined
+    length = np.flatnonzero(mask & ~after) - starts + 1
+    run = np.where(mask, np.cumsum(first.ravel()).reshape(mask.shape) - 1, -1)
+    return (run.T, column, start, length, ~breaks[start],
+            ~breaks[start + length])
+
+
+def gap_histogram(frame, freq=None, bins=GAP_BINS):
+    """
+    Number of gaps of the columns of a frame by length.
+
+    Returns
+    -------
+    dict
+        Number of gaps of each bin of lengths (samples), by label, e.g.
+        '3-6' or '13+'.
+    """
+    _, _, _, length, _, _ = gap_runs(np.isnan(frame.to_numpy(dtype=float)),
+                                  segment_breaks(frame.index, freq))
+    counts, _ = np.histogram(length, bins=list(bins) + [np.inf])
+    labels = [str(low) if high == low + 1 else
+              '{}+'.format(low) if high == np.inf else
+              '{}-{}'.format(low, high - 1)
+              for low, high in zip(bins, list(bins[1:]) + [np.inf])]
+    return dict(zip(labels, counts.tolist()))
+
+
+@profile_stage()
+def fill_short_gaps(frame, irradiance=None, freq=None, short_gap=SHORT_GAP):
+    """
+    Interpolate the gaps of at most short_gap samples between the values
+    around them, or hold the value before (after) them at the end (start) of
+    a segment.
+
+    Parameters
+    ----------
+    frame : pandas DataFrame
+        Inverter data with ('ag_level_2', 'ag_level_1', 'curve') columns,
+        NaN where missing.
+    irradiance : pandas DataFrame, optional
+        Weather data with the G of each input on the timestamps of frame.
+        The SCALED_CURVES are interpolated as their ratio to G where G is
+        above IRRADIANCE_MIN. The default is None, linearly.
+    freq : pandas Timedelta, optional
+        Time resolution of frame, the gaps do not span missing timestamps.
+    short_gap : int, optional
+        Longest gap interpolated, 0 for none. The default is SHORT_GAP.
+
+    Returns
+    -------
+    pandas DataFrame
+        frame with the short gaps filled, the longer ones and the ones
+        filling a whole segment are left NaN.
+    """
+    values = frame.to_numpy(dtype=float, copy=True)
+    run, _, start, length, has_before, has_after = gap_runs(
+        np.isnan(values), segment_breaks(frame.index, freq))
+    short = np.append((has_before | has_after) & (length <= short_gap), False)
+    rows, columns = np.nonzero(short[run])
+    run = run[rows, columns]
+    # rows of the values around the gaps, the same row for one side only
+    before = np.where(has_before[run], start[run] - 1, start[run] + length[run])
+    after = np.where(has_after[run], start[run] + length[run], before)
+    weight = (rows - before) / np.maximum(after - before, 1) * (after > before)
+    y_before, y_after = values[before, columns], values[after, columns]
+    filled = y_before + weight * (y_after - y_before)
+
+    if irradiance is not None and len(rows):
+        g = irradiance.xs('G', axis=1, level='curve').reindex(
+            index=frame.index, columns=frame.columns.droplevel('curve'))
+        g = g.to_numpy(dtype=float)
+        g_before, g_after, g_now = (g[before, columns], g[after, columns],
+                                    g[rows, columns])
+        scaled = frame.columns.get_level_values('curve').isin(SCALED_CURVES)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scaled = (scaled[columns] & (g_before > IRRADIANCE_MIN)
+                      & (g_after > IRRADIANCE_MIN) & (g_now > IRRADIANCE_MIN))
+            ratio = y_before / g_before + weight * (y_after / g_after
+                                                    - y_before / g_before)
+            filled = np.where(scaled, g_now * ratio, filled)
+    values[rows, columns] = filled
+    print('Short gaps interpolated: {} of {}'.format(
+        int(np.count_nonzero(short)), len(length)))
+    return pd.DataFrame(values, index=frame.index, columns=frame.columns)
+
+
+def impute_gaps(inv_data, meteo_data, array_info, general_info,
+                short_gap=SHORT_GAP, site=None):
+    """
+    Fill the gaps of the V and I of each input: the short ones are
+    interpolated (see fill_short_gaps) and the inputs left with gaps are
+    predicted by predict_missing_data, whose models are fitted on the
+    measured values only.
+
+    Parameters
+    ----------
+    inv_data : pandas DataFrame
+        Inverter data, NaN where missing.
+    meteo_data : pandas DataFrame
+        Weather data with the G and Tmod of each input.
+    array_info : pandas DataFrame
+        System information, with the input_name of each input.
+    general_info : dict
+        Time resolutions of the inverter and weather data.
+    short_gap : int, optional
+        Longest gap interpolated, 0 for none. The default is SHORT_GAP.
+    site : str, optional
+        Identity of the site in the model registry, see
+        model_registry.site_key and predict_missing_data.
+
+    Returns
+    -------
+    pandas DataFrame
+        V and I of each input, as predict_missing_data.
+    """
+    freq = pd.Timedelta(minutes=general_info['inverter_time_resolution'])
+    irradiance = resampling_meteo(meteo_data, general_info)
+    filled = fill_short_gaps(inv_data, irradiance, freq, short_gap)
+    columns = pd.MultiIndex.from_tuples(
+        [tuple(key) + (name,) for key in array_info.index
+         for name in ['V', 'I']],
+        names=['ag_level_2', 'ag_level_1', 'curve'])
+    result = filled.reindex(columns=columns).to_numpy()
+
+    # inputs with gaps left, the other models are not fitted
+    left = np.isnan(result).reshape(len(result), -1, 2).any(axis=(0, 2))
+    print('Inputs predicted by the models: {} of {}'.format(
+        int(np.count_nonzero(left)), len(left)))
+    if left.any():
+        keys = array_info.index[left]
+        predicted = predict_missing_data(
+            inv_data.loc[:, inv_data.columns.droplevel('curve').isin(keys)],
+            meteo_data.loc[:, meteo_data.columns.droplevel('curve').isin(keys)],
+            array_info[left], general_info, site=site)
+        # the V and I columns of these inputs, the short gaps kept
+        positions = columns.get_indexer(predicted.columns)
+        block = result[:, positions]
+        result[:, positions] = np.where(np.isnan(block),
+                                        predicted.to_numpy(), block)
+    return pd.DataFrame(result, index=inv_data.index, columns=columns)
@@ -0,0 +1,236 @@
+"""
+Per-site registry of the imputation models on disk.
+
+The ridge regressions of data_sanitization.models predicting the V and I of
+each input barely change between the weekly uploads of a site. The registry
+keeps, for each site, input name and target curve, the sufficient statistics
+of the fit (number of rows, means and covariances of the predictors and
+target, i.e. the scaler statistics) and the coefficients. A site is
+identified by its name, location and input layout (see site_key), the system
+name alone being free text. The next upload of the site starts from them:
+the statistics of its rows are merged in, or the stored model is reused, and
+the model is refit from the new rows only when they drift from it. An upload
+overlapping the rows of the statistics is predicted from its own rows (see
+data_sanitization.models.warm_start_ridge).
+
+A site is one .npz file, written atomically. Concurrent uploads of the same
+site are serialized on save, the last one wins.
+"""
+import os
+import hashlib
+import contextlib
+import urllib.parse
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, concurrent saves may race
+    fcntl = None
+
+from data_store.result_store import STORE_DIR
+
+# Root folder of the registry, shared by all the workers of the server
+REGISTRY_DIR = os.environ.get('DST_MODEL_REGISTRY_DIR',
+                              os.path.join(STORE_DIR, '.models'))
+# Set to 0 to fit the models of every upload from its own rows only
+REGISTRY_ENABLED = os.environ.get('DST_MODEL_REGISTRY', '1') != '0'
+
+# Statistics and model of each input, see empty_models
+FIELDS = ['n', 'mean_x', 'mean_y', 'cov_xx', 'cov_xy', 'cov_yy', 'coef',
+          'end']
+# Columns of the system information identifying the layout of the inputs
+LAYOUT_COLUMNS = ['input_name', 'number_of_strings', 'modules_per_string']
+# Decimals of the latitude and longitude identifying a site, about 100 m
+LOCATION_DECIMALS = 3
+
+
+def site_key(general_info, array_info):
+    """
+    Identity of a site in the registry: its name, followed by a hash of its
+    location and of the layout of its inputs (LAYOUT_COLUMNS), so that
+    another plant or a new layout under the same name starts from scratch.
+
+    Parameters
+    ----------
+    general_info : dict
+        Site information, with the ID, lat and long.
+    array_info : pandas DataFrame
+        System information of all the inputs of the site.
+
+    Returns
+    -------
+    str
+        e.g. 'Plant-1f3a...'.
+    """
+    columns = [name for name in LAYOUT_COLUMNS if name in array_info]
+    layout = array_info[columns].astype(str).sort_values(columns[0])
+    identity = [round(float(general_info['lat']), LOCATION_DECIMALS),
+                round(float(general_info['long']), LOCATION_DECIMALS),
+                columns, layout.to_numpy().tolist()]
+    digest = hashlib.blake2b(repr(identity).encode(), digest_size=8)
+    return '{}-{}'.format(general_info['ID'], digest.hexdigest())
+
+
+def site_path(site, root=REGISTRY_DIR):
+    """File of the models of a site."""
+    return os.path.join(root, urllib.parse.quote(str(site), safe='') + '.npz')
+
+
+def empty_models(n_inputs, n_features):
+    """
+    Models of inputs never fitted.
+
+    Returns
+    -------
+    dict of numpy arrays
+        n: number of rows the statistics were computed on,
+        mean_x, mean_y: means of the predictors and target,
+        cov_xx, cov_xy, cov_yy: (ddof=0) covariances,
+        coef: coefficients on the centered predictors,
+        end: last timestamp (unix seconds) of the rows, to not merge the
+        same rows twice.
+    """
+    return {'n': np.zeros(n_inputs),
+            'mean_x': np.zeros((n_inputs, n_features)),
+            'mean_y': np.zeros(n_inputs),
+            'cov_xx': np.zeros((n_inputs, n_features, n_features)),
+            'cov_xy': np.zeros((n_inputs, n_features)),
+            'cov_yy': np.zeros(n_inputs),
+            'coef': np.full((n_inputs, n_features), np.nan),
+            'end': np.full(n_inputs, np.iinfo(np.int64).min)}
+
+
+@contextlib.contextmanager
+def _lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read(path):
+    """Arrays of a site file, None if missing or unreadable."""
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            return dict(stored)
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            print('Model registry {} ignored: {}'.format(path, e))
+        return None
+
+
+def site_digest(site, root=REGISTRY_DIR):
+    """
+    Hash of the stored models of a site, None for a new site, e.g. for the
+    key of the cached imputation.
+    """
+    stored = _read(site_path(site, root))
+    if stored is None:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(stored):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(stored[name]).tobytes())
+    return digest.hexdigest()
+
+
+def load_models(site, input_names, features, root=REGISTRY_DIR):
+    """
+    Stored models of some inputs of a site.
+
+    Parameters
+    ----------
+    site : str
+        Identity of the site, see site_key.
+    input_names : list of str
+        Names of the inputs.
+    features : dict
+        Predictors of each target curve, e.g. models.FEATURES.
+    root : str, optional
+        Root folder of the registry.
+
+    Returns
+    -------
+    origin : int or None
+        Unix time (seconds) the time feature of the models counts from, None
+        for a new site.
+    models : dict
+        Models of each target, as empty_models, in the order of input_names.
+        The inputs not in the registry are empty.
+    """
+    models = {target: empty_models(len(input_names), len(names))
+              for target, names in features.items()}
+    stored = _read(site_path(site, root))
+    if stored is None:
+        return None, models
+    rows = np.flatnonzero(np.isin(input_names, stored['names']))
+    stored_rows = np.searchsorted(stored['names'],
+                                  np.asarray(input_names)[rows])
+    for target, names in features.items():
+        if list(stored[target + '_features']) != list(names):
+            # fitted on other predictors, refit
+            continue
+        for field in FIELDS:
+            models[target][field][rows] = stored[target + '_' + field][
+                stored_rows]
+    return int(stored['origin']), models
+
+
+def save_models(site, input_names, features, origin, models,
+                root=REGISTRY_DIR):
+    """
+    Store the models of some inputs of a site, keeping the other inputs.
+
+    Parameters
+    ----------
+    site : str
+        Identity of the site, see site_key.
+    input_names : list of str
+        Names of the inputs, in the order of models.
+    features : dict
+        Predictors of each target curve.
+    origin : int
+        Unix time (seconds) the time feature counts from.
+    models : dict
+        Models of each target, as empty_models.
+    root : str, optional
+        Root folder of the registry.
+    """
+    path = site_path(site, root)
+    os.makedirs(root, exist_ok=True)
+    with _lock(path):
+        stored = _read(path)
+        input_names = np.asarray(input_names, dtype=str)
+        if stored is None or int(stored['origin']) != origin:
+            names = np.unique(input_names)
+            stored = {}
+        else:
+            names = np.union1d(stored['names'], input_names)
+        arrays = {'names': names, 'origin': np.int64(origin)}
+        for target, feature_names in features.items():
+            merged = empty_models(len(names), len(feature_names))
+            if stored and list(stored[target + '_features']) == \
+                    list(feature_names):
+                kept = np.searchsorted(names, stored['names'])
+                for field in FIELDS:
+                    merged[field][kept] = stored[target + '_' + field]
+            rows = np.searchsorted(names, input_names)
+            for field in FIELDS:
+                merged[field][rows] = models[target][field]
+                arrays[target + '_' + field] = merged[field]
+            arrays[target + '_features'] = np.asarray(feature_names, dtype=str)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+
+def clear_site(site, root=REGISTRY_DIR):
+    """Forget the models of a site, the next upload is fitted from scratch."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(site_path(site, root))
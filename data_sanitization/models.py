@@ -2,9 +2,51 @@
 
 from sklearn.linear_model import Ridge
 from sklearn.preprocessing import StandardScaler
+import os
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 import pandas as pd
 import numpy as np
 import time
+from data_pipeline.profiling import profile_stage
+from data_sanitization import model_registry
+
+# Predictors of each curve, V is predicted first and used to predict I
+FEATURES = {'V': ['G', 'Tmod', 'unix'], 'I': ['V', 'G', 'Tmod', 'unix']}
+# Number of inputs whose arrays are stacked at once by the numpy engine
+BLOCK_INPUTS = 64
+# Number of processes the blocks of inputs are spread over by the numpy
+# engine, 1 predicts them in the calling process
+IMPUTATION_WORKERS = int(os.environ.get('DST_IMPUTATION_WORKERS', 1))
+# Start method of the pool processes, 'spawn' is safe in threaded servers
+IMPUTATION_START_METHOD = os.environ.get('DST_IMPUTATION_START_METHOD',
+                                         'spawn')
+# Working memory (bytes) of the numpy engine above which the data is
+# streamed by chunks of rows (see _predict_stream) instead of predicted at once
+IMPUTATION_MEMORY_BYTES = int(os.environ.get('DST_IMPUTATION_MEMORY_BYTES',
+                                             2 * 1024 ** 3))
+# Working memory of the numpy engine per cell (row x input) predicted at once,
+# measured by benchmarks.bench_streaming
+BATCH_BYTES_PER_CELL = 280
+# Cells of each chunk of the streamed data, about 64 MB of working memory
+IMPUTATION_CHUNK_CELLS = int(os.environ.get('DST_IMPUTATION_CHUNK_CELLS',
+                                            2 ** 18))
+
+# A stored model is refit from the rows of an upload when its RMSE on them
+# exceeds this factor times the RMSE of a model fitted on them
+DRIFT_FACTOR = float(os.environ.get('DST_MODEL_DRIFT_FACTOR', 1.5))
+# Rows of an upload needed to detect a drift of a stored model
+DRIFT_MIN_ROWS = 100
+# What warm_start_ridge did with the model of each input
+MODEL_ACTIONS = ['unfitted', 'new', 'refit', 'merged', 'reused',
+                 'overlapped']
+
+# Pool of the numpy engine, created on first use and kept for the next calls
+_pool = None
+_pool_workers = 0
 
 def resampling_meteo(m_data, general_info):
     if general_info['meteo_time_resolution'] != \
@@ -12,30 +54,730 @@ def resampling_meteo(m_data, general_info):
         freq = general_info[ 'inverter_time_resolution']
         m_data_resampled = m_data.resample(str(freq)+'min').mean()
         return m_data_resampled
+    # already at the inverter resolution
+    return m_data
+
+@profile_stage()
+def predict_missing_data(inv_data, meteo_data, array_info, general_info,
+                         engine='numpy', alpha=1, workers=None, site=None,
+                         chunk_rows=None, sink=None):
+    """
+    Predict the missing V and I of each input with a ridge regression on
+    the standardized weather data and time (V), then on V too (I).
+
+    Parameters
+    ----------
+    inv_data : pandas DataFrame
+        Inverter data, NaN where missing.
+    meteo_data : pandas DataFrame
+        Weather data with the G and Tmod of each input.
+    array_info : pandas DataFrame
+        System information, with the input_name of each input.
+    general_info : dict
+        Time resolutions of the inverter and weather data.
+    engine : str, optional
+        'numpy' solves the ridge regressions of all the inputs at once from
+        their moments (see impute_ridge), 'sklearn' fits a StandardScaler
+        and a Ridge per input. The default is 'numpy'.
+    alpha : float, optional
+        Regularization strength of the ridge regressions. The default is 1.
+    workers : int, optional
+        Number of processes the inputs are spread over by the numpy engine.
+        The default is IMPUTATION_WORKERS.
+    site : str, optional
+        Identity of the site, see model_registry.site_key. The numpy engine
+        then starts from the models of the previous uploads of the site in
+        the model registry (see warm_start_ridge) and stores the updated
+        models. The default is None, the models are fitted on this upload
+        only.
+    chunk_rows : int, optional
+        Rows predicted at once by the numpy engine, longer data is streamed
+        by chunks of chunk_rows (see _predict_stream). The default streams
+        the data whose prediction at once would take more than
+        IMPUTATION_MEMORY_BYTES, by chunks of IMPUTATION_CHUNK_CELLS cells.
+        Without a sink the result is still held in memory, about 6% of the
+        memory of the prediction at once.
+    sink : callable, optional
+        Called with each chunk of result_df, e.g. codec.FrameWriter.write,
+        instead of returning it. The numpy engine then streams the data,
+        the sklearn engine does not support it.
 
-def predict_missing_data(inv_data, meteo_data, array_info, general_info):
+    Returns
+    -------
+    result_df : pandas DataFrame
+        V and I of each input with the missing values predicted, with
+        ('ag_level_2', 'ag_level_1', 'curve') columns in the order of
+        array_info. None with a sink.
+    """
 
     # timer starts here
     start_time = time.time()
 
-    # creating opy of the dataframes
-    inv_df = inv_data.copy()
-    meteo_df = meteo_data.copy()
+    input_names = list(array_info['input_name'])
+    # the V and I columns of each input, as the inverter data
+    columns = pd.MultiIndex.from_tuples(
+        [tuple(key) + (name,) for key in array_info.index
+         for name in ['V', 'I']],
+        names=['ag_level_2', 'ag_level_1', 'curve'])
+    if engine not in ('numpy', 'sklearn'):
+        raise ValueError('{} is not a valid engine. Must be numpy or '
+                         'sklearn'.format(engine))
+    if sink is not None and engine != 'numpy':
+        raise ValueError('Only the numpy engine streams to a sink')
+    origin, models = None, None
+    if engine == 'numpy' and site is not None and \
+            model_registry.REGISTRY_ENABLED and len(inv_data):
+        origin, models = model_registry.load_models(site, input_names,
+                                                    FEATURES)
+        if origin is None:
+            origin = int(inv_data.index[0].value // 10 ** 9)
+    n_inputs = max(len(input_names), 1)
+    stream = sink is not None or (
+        len(inv_data) * n_inputs * BATCH_BYTES_PER_CELL
+        > IMPUTATION_MEMORY_BYTES
+        if chunk_rows is None else len(inv_data) > chunk_rows)
+    if chunk_rows is None:
+        chunk_rows = max(IMPUTATION_CHUNK_CELLS // n_inputs, 1)
 
-    # defining the Output dataframe variable
-    result_df = pd.DataFrame(index = inv_df.index)
+    if engine == 'numpy' and stream:
+        result_df, models = _predict_stream(
+            inv_data, meteo_data, general_info, input_names, columns, alpha,
+            chunk_rows, origin, models, sink, workers or IMPUTATION_WORKERS)
+    else:
+        # resampling meteo data if time freq is not same
+        meteo_df = resampling_meteo(m_data=meteo_data,
+                                    general_info=general_info)
+
+        # Concatenating inverter and meteo to get a single dataframe, on the
+        # inverter timestamps which are the only ones predicted
+        final_df = pd.concat([inv_data, meteo_df],
+                             axis=1).reindex(inv_data.index)
+
+        # joining column level to get list of all column name
+        final_df.columns = final_df.columns.map('-'.join)
+
+        if engine == 'numpy':
+            result_df, models = _predict_numpy(final_df, input_names, alpha,
+                                               workers or IMPUTATION_WORKERS,
+                                               origin, models)
+        else:
+            result_df = _predict_sklearn(final_df, input_names, alpha)
+        result_df.columns = columns
+        result_df.index.names = ['datetime']
+
+    if models is not None and input_names:
+        model_registry.save_models(site, input_names, FEATURES, origin,
+                                   models)
+        for target, target_models in models.items():
+            counts = np.bincount(target_models['action'],
+                                 minlength=len(MODEL_ACTIONS))
+            print('{} models of site {}: {}'.format(
+                target, site, dict(zip(MODEL_ACTIONS, counts.tolist()))))
+
+    # timer ends here
+    end_time = time.time()
+    print('\nModel Execution Time:{} seconds'.format(end_time-start_time))
+    return result_df
+
+
+def ridge_moments(x, y, train):
+    """
+    Moments of the training rows of stacked regressions.
+
+    Parameters
+    ----------
+    x : numpy array
+        (model x time x feature) predictors.
+    y : numpy array
+        (model x time) target.
+    train : numpy array of bool
+        (model x time) rows used to fit each model.
+
+    Returns
+    -------
+    n : numpy array
+        Number of training rows of each model.
+    mean_x, mean_y : numpy arrays
+        Means of the predictors and target.
+    cov_xx, cov_xy, cov_yy : numpy arrays
+        (model x feature x feature), (model x feature) and (model)
+        covariances, with ddof=0 as StandardScaler.
+    """
+    n = train.sum(axis=1)
+    count = np.maximum(n, 1)
+    x = np.where(train[:, :, None], x, 0.0)
+    y = np.where(train, y, 0.0)
+    mean_x = x.sum(axis=1) / count[:, None]
+    mean_y = y.sum(axis=1) / count
+    # centered, two-pass products
+    x = np.where(train[:, :, None], x - mean_x[:, None, :], 0.0)
+    y = np.where(train, y - mean_y[:, None], 0.0)
+    x_t = x.transpose(0, 2, 1)
+    cov_xx = np.matmul(x_t, x) / count[:, None, None]
+    cov_xy = np.matmul(x_t, y[:, :, None])[:, :, 0] / count[:, None]
+    cov_yy = (y * y).sum(axis=1) / count
+    return n, mean_x, mean_y, cov_xx, cov_xy, cov_yy
+
+
+def merge_moments(a, b):
+    """
+    Moments of the union of the rows of two ridge_moments, with the
+    pairwise update of Chan et al.
+    """
+    n_a, mean_x_a, mean_y_a, cov_xx_a, cov_xy_a, cov_yy_a = a
+    n_b, mean_x_b, mean_y_b, cov_xx_b, cov_xy_b, cov_yy_b = b
+    n = n_a + n_b
+    count = np.maximum(n, 1)
+    d_x = mean_x_b - mean_x_a
+    d_y = mean_y_b - mean_y_a
+    mean_x = mean_x_a + d_x * (n_b / count)[:, None]
+    mean_y = mean_y_a + d_y * n_b / count
+    w_a, w_b, w_ab = n_a / count, n_b / count, n_a * n_b / count ** 2
+    cov_xx = (w_a[:, None, None] * cov_xx_a + w_b[:, None, None] * cov_xx_b
+              + w_ab[:, None, None] * d_x[:, :, None] * d_x[:, None, :])
+    cov_xy = (w_a[:, None] * cov_xy_a + w_b[:, None] * cov_xy_b
+              + w_ab[:, None] * d_x * d_y[:, None])
+    cov_yy = w_a * cov_yy_a + w_b * cov_yy_b + w_ab * d_y ** 2
+    return n, mean_x, mean_y, cov_xx, cov_xy, cov_yy
+
+
+def residual_mse(moments, mean_x, mean_y, coef):
+    """
+    Mean squared error of the models mean_y + (x - mean_x) . coef on the
+    rows of ridge_moments, from the moments alone.
+    """
+    n, rows_mean_x, rows_mean_y, cov_xx, cov_xy, cov_yy = moments
+    bias = rows_mean_y - mean_y - ((rows_mean_x - mean_x) * coef).sum(axis=1)
+    mse = (cov_yy - 2 * (coef * cov_xy).sum(axis=1)
+           + np.matmul(coef[:, None, :], np.matmul(cov_xx, coef[:, :, None]))[
+               :, 0, 0] + bias ** 2)
+    return np.maximum(mse, 0)
+
+
+def ridge_coefficients(n, mean_x, mean_y, cov_xx, cov_xy, cov_yy=None,
+                       alpha=1):
+    """
+    Coefficients of stacked ridge regressions on standardized predictors,
+    as StandardScaler followed by Ridge(alpha), from ridge_moments.
+
+    Returns
+    -------
+    coef : numpy array
+        (model x feature) coefficients on the predictors centered on
+        mean_x, NaN for the models without training rows. The predictions
+        are mean_y + (x - mean_x) . coef
+    """
+    var = np.diagonal(cov_xx, axis1=1, axis2=2)
+    # near constant features are not scaled, as StandardScaler
+    eps = np.finfo(float).eps
+    constant = var <= (n[:, None] * eps * var
+                       + (n[:, None] * mean_x * eps) ** 2)
+    scale = np.where(constant, 1.0, np.sqrt(var))
+    # normal equations of the standardized predictors, (Z'Z + alpha) w = Z'y
+    gram = n[:, None, None] * cov_xx / (scale[:, :, None] * scale[:, None, :])
+    gram += alpha * np.eye(cov_xx.shape[1])
+    rhs = n[:, None] * cov_xy / scale
+    coef = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0] / scale
+    coef[n == 0] = np.nan
+    return coef
+
+
+def _predict_ridge(x, y, test, mean_x, mean_y, coef):
+    """Fill the test rows of y with the ridge regression predictions."""
+    prediction = mean_y[:, None] + np.matmul(
+        x - mean_x[:, None, :], coef[:, :, None])[:, :, 0]
+    y[test] = prediction[test]
+    return y
+
+
+def impute_ridge(x, y, alpha=1):
+    """
+    Replace the NaN of stacked targets by ridge regression predictions.
+
+    Parameters
+    ----------
+    x : numpy array
+        (model x time x feature) predictors.
+    y : numpy array
+        (model x time) target, NaN where missing.
+    alpha : float, optional
+        Regularization strength. The default is 1.
+
+    Returns
+    -------
+    y : numpy array
+        Copy of y, NaN where a predictor is NaN too.
+    """
+    y = y.copy()
+    known = np.isfinite(x).all(axis=2)
+    missing = np.isnan(y)
+    test = known & missing
+    models = np.flatnonzero(test.any(axis=1))
+    if not len(models):
+        return y
+    x, test = x[models], test[models]
+    moments = ridge_moments(x, y[models], known[models] & ~missing[models])
+    coef = ridge_coefficients(*moments, alpha=alpha)
+    y[models] = _predict_ridge(x, y[models], test, moments[1], moments[2],
+                               coef)
+    return y
+
+
+def warm_start_ridge(x, y, models, start, end, alpha=1,
+                     drift_factor=DRIFT_FACTOR, min_rows=DRIFT_MIN_ROWS):
+    """
+    Replace the NaN of stacked targets by the predictions of ridge
+    regressions started from stored models (see model_registry).
+
+    The moments of the rows of y are computed for every model, then:
+      - new: a model never fitted is fitted on them,
+      - refit: a model whose RMSE on them exceeds drift_factor times the
+        RMSE of a model fitted on them (with min_rows rows at least) is
+        refit on them only,
+      - merged: else the moments of rows after the last rows of the model
+        are merged into its moments and the model is refit on the union,
+      - overlapped: else rows overlapping the rows of the model, which may
+        count them already, are predicted by a model fitted on them, the
+        stored model being kept,
+      - reused: else (no row) the model is used as is.
+    The errors are computed from the moments, the rows are read once.
+
+    Parameters
+    ----------
+    x : numpy array
+        (model x time x feature) predictors.
+    y : numpy array
+        (model x time) target, NaN where missing.
+    models : dict
+        Stored models, see model_registry.empty_models.
+    start, end : int
+        First and last timestamps of the rows (unix seconds).
+    alpha : float, optional
+        Regularization strength. The default is 1.
+    drift_factor : float, optional
+        RMSE ratio above which a model is refit. The default is
+        DRIFT_FACTOR.
+    min_rows : int, optional
+        Rows needed to detect a drift. The default is DRIFT_MIN_ROWS.
+
+    Returns
+    -------
+    y : numpy array
+        Copy of y, NaN where a predictor is NaN too.
+    models : dict
+        Updated models, with the index in MODEL_ACTIONS of what was done
+        with each one ('action').
+    """
+    y = y.copy()
+    known = np.isfinite(x).all(axis=2)
+    missing = np.isnan(y)
+    rows = ridge_moments(x, y, known & ~missing)
+    moments, coef, updated = warm_start_moments(
+        models, rows, start, end, alpha, drift_factor, min_rows)
+    y = _predict_ridge(x, y, known & missing, moments[1], moments[2], coef)
+    return y, updated
+
+
+def warm_start_moments(models, rows, start, end, alpha=1,
+                       drift_factor=DRIFT_FACTOR, min_rows=DRIFT_MIN_ROWS):
+    """
+    Models of warm_start_ridge from the ridge_moments of the rows.
+
+    Returns
+    -------
+    moments : tuple
+        Moments of the models predicting the rows.
+    coef : numpy array
+        Coefficients of these models, see ridge_coefficients.
+    models : dict
+        Updated models, with the index in MODEL_ACTIONS of what was done
+        with each one ('action').
+    """
+    fields = ['n', 'mean_x', 'mean_y', 'cov_xx', 'cov_xy', 'cov_yy']
+    stored = tuple(models[field] for field in fields)
+    fitted = stored[0] > 0
+    with np.errstate(invalid='ignore'):
+        mse = residual_mse(rows, models['mean_x'], models['mean_y'],
+                           models['coef'])
+        own_mse = residual_mse(rows, rows[1], rows[2],
+                               ridge_coefficients(*rows, alpha=alpha))
+        # a NaN error is a drift too
+        drift = fitted & (rows[0] >= min_rows) & ~(
+            mse <= drift_factor ** 2 * own_mse)
+    merge = fitted & ~drift & (rows[0] > 0) & (models['end'] < start)
+    overlap = fitted & ~drift & (rows[0] > 0) & ~merge
+    fresh = ~fitted | drift
+    merged = merge_moments(stored, rows)
 
-    # resampling meteo data if time freq is not same
-    meteo_df = resampling_meteo(m_data=meteo_df, general_info=general_info)
+    def choose(condition, a, b):
+        # per model, the moments a where condition holds, else b
+        return tuple(
+            np.where(condition.reshape((-1,) + (1,) * (x.ndim - 1)), x, y)
+            for x, y in zip(a, b))
 
-    # Concatenating inverter and meteo to get a single dataframe
-    final_df = pd.concat([inv_df, meteo_df], axis=1)
+    moments = choose(fresh, rows, choose(merge, merged, stored))
+    coef = ridge_coefficients(*moments, alpha=alpha)
+    updated = dict(zip(fields, moments))
+    updated['coef'] = coef
+    updated['end'] = np.where((fresh | merge) & (rows[0] > 0), end,
+                              models['end'])
+    updated['action'] = np.select(
+        [~fitted & (rows[0] == 0), ~fitted, drift, merge, overlap],
+        [0, 1, 2, 3, 5], default=4)
+    if overlap.any():
+        # the stored models are kept, the rows are predicted from their own
+        moments = choose(overlap, rows, moments)
+        coef = np.where(overlap[:, None],
+                        ridge_coefficients(*rows, alpha=alpha), coef)
+    return moments, coef, updated
 
-    # joining column level to get list of all column name
-    final_df.columns = final_df.columns.map('-'.join)
+
+def _block_curves(values, unix, positions):
+    """(input x time) V, I, G, Tmod and time of the inputs of a block."""
+    n_inputs = len(positions['V'])
+    curves = {'unix': np.broadcast_to(unix, (n_inputs, len(unix)))}
+    for name in ['V', 'I', 'G', 'Tmod']:
+        # NaN for the inputs without the curve
+        curves[name] = values[:, positions[name]].T
+        curves[name][positions[name] < 0] = np.nan
+    return curves
+
+
+def _impute_block(values, unix, positions, alpha=1, models=None, span=None):
+    """
+    V then I of a block of inputs.
+
+    Parameters
+    ----------
+    values : numpy array
+        (time x column) inverter and weather data.
+    unix : numpy array
+        Time feature of each row.
+    positions : dict
+        Column of each input of the block in values for V, I, G and Tmod,
+        -1 when missing.
+    alpha : float, optional
+        Regularization strength. The default is 1.
+    models : dict, optional
+        Stored models of the inputs of the block for V and I, see
+        warm_start_ridge. The default is None, fitted on values only.
+    span : tuple, optional
+        First and last timestamps (unix seconds) of values, with models.
+
+    Returns
+    -------
+    numpy array
+        (time x 2 * input) V and I of each input with the missing values
+        predicted.
+    models : dict
+        Updated models of the inputs for V and I, None without models.
+    """
+    curves = _block_curves(values, unix, positions)
+    updated = None if models is None else {}
+    for target in ['V', 'I']:
+        x = np.stack([curves[name] for name in FEATURES[target]], axis=2)
+        if models is None:
+            curves[target] = impute_ridge(x, curves[target], alpha=alpha)
+        else:
+            curves[target], updated[target] = warm_start_ridge(
+                x, curves[target], models[target], *span, alpha=alpha)
+    return np.stack([curves['V'], curves['I']], axis=2).transpose(
+        1, 0, 2).reshape(len(unix), -1), updated
+
+
+def _get_pool(workers):
+    """Pool of the numpy engine with workers processes, 0 to drop it."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if not workers:
+            return None
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(IMPUTATION_START_METHOD))
+        _pool_workers = workers
+    return _pool
+
+
+def _share(array):
+    """Copy of an array in a new shared memory block."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=float, buffer=block.buf)[...] = array
+    return block
+
+
+def _impute_shared(shared, shapes, positions, columns, alpha=1, models=None,
+                   span=None):
+    """
+    Pool task predicting a block of inputs, reading the data from and
+    writing the predictions to the shared memory blocks of _predict_numpy.
+    Returns the updated models of the block.
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name in shared]
+    try:
+        values, unix, result = [np.ndarray(shape, dtype=float, buffer=block.buf)
+                                for block, shape in zip(blocks, shapes)]
+        result[:, columns[0]:columns[1]], models = _impute_block(
+            values, unix, positions, alpha, models, span)
+        del values, unix, result
+    finally:
+        for block in blocks:
+            block.close()
+    return models
+
+
+def _block_models(models, start, stop):
+    """Models of the inputs start to stop."""
+    if models is None:
+        return None
+    return {target: {field: values[start:stop]
+                     for field, values in target_models.items()}
+            for target, target_models in models.items()}
+
+
+def _predict_numpy(final_df, input_names, alpha=1, workers=1, origin=None,
+                   models=None):
+    """
+    V then I of all the inputs, predicted by blocks of inputs. With the
+    stored models of the inputs (see warm_start_ridge), whose time feature
+    counts from origin, returns their updated models too.
+    """
+    input_names = list(input_names)
+    if not input_names:
+        # nothing to predict, e.g. all the gaps were short
+        return pd.DataFrame(index=final_df.index), models
+    values = final_df.to_numpy(dtype=float)
+    # seconds from the first timestamp, as the unix time once standardized,
+    # or from the origin of the stored models
+    unix = final_df.index.asi8 // 10 ** 9
+    span = (int(unix[0]), int(unix[-1])) if len(unix) else (0, 0)
+    unix = (unix - (unix[:1] if origin is None else origin)).astype(float)
+    positions = {name: final_df.columns.get_indexer(
+        [inv_name + '-' + name for inv_name in input_names])
+        for name in ['V', 'I', 'G', 'Tmod']}
+    # as many blocks as workers at least
+    n_blocks = max(-(-len(input_names) // BLOCK_INPUTS), workers)
+    bounds = np.linspace(0, len(input_names), min(n_blocks, len(input_names))
+                         + 1).astype(int)
+    blocks = [({name: position[start:stop]
+                for name, position in positions.items()}, (2 * start, 2 * stop),
+               _block_models(models, start, stop))
+              for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    result = np.empty((len(final_df), 2 * len(input_names)))
+    updated = []
+    if workers > 1 and len(blocks) > 1:
+        try:
+            updated = _predict_parallel(values, unix, result, blocks, alpha,
+                                        workers, span)
+            blocks = []
+        except BrokenProcessPool as e:
+            # e.g. a worker killed out of memory, a new pool is created
+            # on the next call
+            print('Imputation pool failed ({}), predicting serially'.format(e))
+            _get_pool(0)
+    for block_positions, columns, block_models in blocks:
+        result[:, columns[0]:columns[1]], block_models = _impute_block(
+            values, unix, block_positions, alpha, block_models, span)
+        updated.append(block_models)
+    if models is not None:
+        models = {target: {field: np.concatenate(
+            [block_models[target][field] for block_models in updated])
+            for field in updated[0][target]} for target in models}
+    return pd.DataFrame(result, index=final_df.index,
+                        columns=[inv_name + '-' + name
+                                 for inv_name in input_names
+                                 for name in ['V', 'I']]), models
+
+
+def _predict_parallel(values, unix, result, blocks, alpha, workers, span):
+    """
+    Blocks of _predict_numpy spread over the pool. The data is published
+    once in shared memory, the tasks only carry the column positions of
+    their inputs, and the predictions are written to a shared result.
+    Returns the updated models of each block.
+    """
+    shared = [_share(values), _share(unix), _share(result)]
+    try:
+        shapes = [values.shape, unix.shape, result.shape]
+        pool = _get_pool(workers)
+        futures = [pool.submit(_impute_shared, [block.name for block in shared],
+                               shapes, block_positions, columns, alpha,
+                               block_models, span)
+                   for block_positions, columns, block_models in blocks]
+        updated = [future.result() for future in futures]
+        result[...] = np.ndarray(result.shape, dtype=float,
+                                 buffer=shared[2].buf)
+    finally:
+        for block in shared:
+            block.close()
+            block.unlink()
+    return updated
+
+
+def _stream_chunks(inv_data, meteo_data, general_info, input_names,
+                   chunk_rows, origin):
+    """
+    Rows of the inverter data by chunks of chunk_rows, with the weather data
+    of their timestamps: yields the index, values, time feature and column
+    positions of each input of the chunk, as _predict_numpy.
+    """
+    resolution = pd.Timedelta(minutes=general_info['inverter_time_resolution'])
+    meteo_times = meteo_data.index
+    for start in range(0, len(inv_data), chunk_rows):
+        inv_chunk = inv_data.iloc[start:start + chunk_rows]
+        times = inv_chunk.index
+        # the weather rows averaged into the inverter timestamps of the chunk
+        meteo_chunk = meteo_data.iloc[
+            meteo_times.searchsorted(times[0]):
+            meteo_times.searchsorted(times[-1] + resolution)]
+        chunk = pd.concat([inv_chunk, resampling_meteo(meteo_chunk,
+                                                       general_info)],
+                          axis=1).reindex(times)
+        chunk.columns = chunk.columns.map('-'.join)
+        unix = (times.asi8 // 10 ** 9 - origin).astype(float)
+        positions = {name: chunk.columns.get_indexer(
+            [inv_name + '-' + name for inv_name in input_names])
+            for name in ['V', 'I', 'G', 'Tmod']}
+        yield times, chunk.to_numpy(dtype=float), unix, positions
+
+
+def _chunk_fit(fits, curves, target):
+    """Predict the missing target of the curves of a chunk from its fit."""
+    x = np.stack([curves[name] for name in FEATURES[target]], axis=2)
+    test = np.isfinite(x).all(axis=2) & np.isnan(curves[target])
+    mean_x, mean_y, coef = fits[target]
+    curves[target] = _predict_ridge(x, curves[target], test, mean_x, mean_y,
+                                    coef)
+
+
+def _chunk_moments(values, unix, positions, target, fits):
+    """
+    Pool task of _predict_stream: ridge_moments of the target of each
+    input of a chunk, I being fitted on V predicted by fits['V'].
+    """
+    curves = _block_curves(values, unix, positions)
+    if target == 'I':
+        _chunk_fit(fits, curves, 'V')
+    x = np.stack([curves[name] for name in FEATURES[target]], axis=2)
+    train = np.isfinite(x).all(axis=2) & ~np.isnan(curves[target])
+    return ridge_moments(x, curves[target], train)
+
+
+def _chunk_predict(values, unix, positions, fits):
+    """Pool task of _predict_stream: V then I of each input of a chunk."""
+    curves = _block_curves(values, unix, positions)
+    _chunk_fit(fits, curves, 'V')
+    _chunk_fit(fits, curves, 'I')
+    return np.stack([curves['V'], curves['I']], axis=2).transpose(
+        1, 0, 2).reshape(len(unix), -1)
+
+
+def _map_chunks(func, chunks, workers, *args):
+    """
+    func(values, unix, positions, *args) of each chunk of _stream_chunks,
+    yielded in order with the index of the chunk. With workers > 1 the
+    chunks are spread over the pool, 2 * workers of them in flight at most
+    so the memory stays bounded.
+    """
+    pool = _get_pool(workers) if workers > 1 else None
+    pending = collections.deque()
+
+    def result(index, chunk, future):
+        nonlocal pool
+        if future is not None:
+            try:
+                return index, future.result()
+            except BrokenProcessPool as e:
+                # e.g. a worker killed out of memory, the rest is serial
+                print('Imputation pool failed ({}), predicting '
+                      'serially'.format(e))
+                _get_pool(0)
+                pool = None
+        return index, func(*chunk, *args)
+
+    for index, *chunk in chunks:
+        future = None
+        if pool is not None:
+            try:
+                future = pool.submit(func, *chunk, *args)
+            except BrokenProcessPool:
+                _get_pool(0)
+                pool = None
+        pending.append((index, chunk, future))
+        while pending and (pool is None or len(pending) >= 2 * workers):
+            yield result(*pending.popleft())
+    while pending:
+        yield result(*pending.popleft())
+
+
+def _predict_stream(inv_data, meteo_data, general_info, input_names, columns,
+                    alpha=1, chunk_rows=10000, origin=None, models=None,
+                    sink=None, workers=1):
+    """
+    V then I of all the inputs, the data read by chunks of rows so the
+    working memory is bounded by the chunk size whatever the length of the
+    data. The moments of the V models are accumulated over the chunks
+    (see merge_moments), then those of the I models on the predicted V, then
+    both are predicted chunk by chunk. The chunks are spread over the pool
+    with workers > 1. The chunks of the result are passed to sink, or
+    concatenated and returned. With the stored models of the inputs, whose
+    time feature counts from origin, returns their updated models too.
+    """
+    times = inv_data.index.asi8 // 10 ** 9
+    span = (int(times[0]), int(times[-1])) if len(times) else (0, 0)
+    if origin is None:
+        origin = span[0]
+    chunks = lambda: _stream_chunks(inv_data, meteo_data, general_info,
+                                    input_names, chunk_rows, origin)
+    fits = {}
+    updated = None if models is None else {}
+
+    for target in ['V', 'I']:
+        n_features = len(FEATURES[target])
+        moments = (np.zeros(len(input_names)),
+                   np.zeros((len(input_names), n_features)),
+                   np.zeros(len(input_names)),
+                   np.zeros((len(input_names), n_features, n_features)),
+                   np.zeros((len(input_names), n_features)),
+                   np.zeros(len(input_names)))
+        # merged in the order of the chunks, the result does not depend on
+        # the workers
+        for _, chunk_moments in _map_chunks(_chunk_moments, chunks(), workers,
+                                            target, fits):
+            moments = merge_moments(moments, chunk_moments)
+        if models is None:
+            coef = ridge_coefficients(*moments, alpha=alpha)
+        else:
+            moments, coef, updated[target] = warm_start_moments(
+                models[target], moments, *span, alpha=alpha)
+        fits[target] = (moments[1], moments[2], coef)
+
+    result = []
+    for index, values in _map_chunks(_chunk_predict, chunks(), workers, fits):
+        chunk = pd.DataFrame(values, index=index.rename('datetime'),
+                             columns=columns)
+        if sink is None:
+            result.append(chunk)
+        else:
+            sink(chunk)
+    if sink is not None:
+        return None, updated
+    if not result:
+        return pd.DataFrame(index=inv_data.index.rename('datetime'),
+                            columns=columns, dtype=float), updated
+    return pd.concat(result), updated
+
+
+def _predict_sklearn(final_df, input_names, alpha=1):
+    """V then I predicted input by input, with StandardScaler and Ridge."""
+    # defining the Output dataframe variable
+    result_df = pd.DataFrame(index = final_df.index)
 
     # using input name index as its index is a list of input names
-    for inv_name in array_info['input_name']:
+    for inv_name in input_names:
         # extracting all column names which starts with selected inverter name
         filter_col = [col for col in final_df if col.startswith(inv_name)]
         filter_col = filter_col
@@ -62,7 +804,7 @@ def predict_missing_data(inv_data, meteo_data, array_info, general_info):
 
             # Ridge regression
             yhat_train, yhat_test = ridge_regression(xtrain_s, xtest_s,
-                                                     ytrain, alpha=1)
+                                                     ytrain, alpha=alpha)
             ytest[v_column] = yhat_test
             y_var = pd.concat([ytrain, ytest])
             df_f[v_column] = y_var
@@ -82,7 +824,7 @@ def predict_missing_data(inv_data, meteo_data, array_info, general_info):
 
             # Ridge regression
             yhat_train, yhat_test = ridge_regression(xtrain_s, xtest_s,
-                                                     ytrain, alpha=1)
+                                                     ytrain, alpha=alpha)
             ytest[i_column] = yhat_test
             y_var = pd.concat([ytrain, ytest])
             df_f[i_column] = y_var
@@ -91,9 +833,6 @@ def predict_missing_data(inv_data, meteo_data, array_info, general_info):
         result_df[v_column] = df_f[v_column]
         result_df[i_column] = df_f[i_column]
 
-    # timer ends here
-    end_time = time.time()
-    print('\nModel Execution Time:{} seconds'.format(end_time-start_time))
     return result_df
 
 def scaler(xtrain, xtest):
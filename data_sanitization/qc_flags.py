@@ -0,0 +1,152 @@
+"""
+Quality control flags of the 3-level data frames, one bit per reason.
+
+The frames of the pipeline have ('ag_level_2', 'ag_level_1', 'curve')
+columns. They are viewed as a (time x input x curve) array and all the range
+rules of the frame (irradiance bounds of the weather data, current and
+voltage limits of the inverter data) are evaluated in one vectorized pass,
+instead of building and aligning a boolean frame per filter. The result is
+a uint8 array of the shape of the frame recording why each cell was
+rejected:
+
+    MISSING      the value is NaN
+    NIGHT        the timestamp is night (clear sky POA below the threshold)
+    IRRADIANCE   the G of the input is out of the irradiance bounds
+    CURRENT      the I of the input is out of the current limits
+    VOLTAGE      the V of the input is out of the voltage limits
+
+As the filters of data_sanitization.filtering, a rule failing on an input
+(including a NaN reading) rejects all the curves of that input at that
+timestamp. The missing data and outlier statistics are counted from the
+flags.
+"""
+import numpy as np
+import pandas as pd
+
+from data_pipeline.profiling import profile_stage
+
+MISSING = 1
+NIGHT = 2
+IRRADIANCE = 4
+CURRENT = 8
+VOLTAGE = 16
+
+FLAG_NAMES = {MISSING: 'missing', NIGHT: 'night', IRRADIANCE: 'irradiance',
+              CURRENT: 'current', VOLTAGE: 'voltage'}
+
+
+def _cube(frame):
+    """
+    (time x input x curve) array of a 3-level frame, the inputs and curves
+    along its axes and the position of each column in the flattened
+    (input x curve) axis.
+    """
+    columns = frame.columns
+    input_labels = columns.droplevel('curve')
+    curve_labels = columns.get_level_values('curve')
+    inputs = input_labels.unique()
+    curves = curve_labels.unique()
+    cells = (inputs.get_indexer(input_labels) * len(curves)
+             + curves.get_indexer(curve_labels))
+    values = frame.to_numpy(dtype=float)
+    n_cells = len(inputs) * len(curves)
+    if n_cells == len(columns) and (cells == np.arange(n_cells)).all():
+        # the usual sorted full grid, a view of the values
+        cube = values.reshape(len(frame), len(inputs), len(curves))
+    else:
+        # inputs without some curves, the missing cells are NaN
+        cube = np.full((len(frame), n_cells), np.nan)
+        cube[:, cells] = values
+        cube = cube.reshape(len(frame), len(inputs), len(curves))
+    return cube, inputs, curves, cells
+
+
+def current_limits(array_info, isc_factor=1.2):
+    """Upper bound of the current of each input, see current_filter."""
+    return (isc_factor * array_info['i_sc']
+            * array_info['number_of_strings'])
+
+
+def voltage_limits(array_info, voc_factor=1.0):
+    """Upper bound of the voltage of each input, see voltage_filter."""
+    return (voc_factor * array_info['v_oc']
+            * array_info['modules_per_string'])
+
+
+@profile_stage()
+def qc_flags(frame, rules=(), night=None):
+    """
+    Flags of the cells of a 3-level frame.
+
+    Parameters
+    ----------
+    frame : pandas DataFrame
+        Frame with ('ag_level_2', 'ag_level_1', 'curve') columns.
+    rules : list of tuple, optional
+        (flag, curve, low, high) range rules: the values of the curve of an
+        input must be within [low, high], else all the cells of the input are
+        flagged. low and high are floats or pandas Series indexed by
+        (ag_level_2, ag_level_1), the inputs missing from a Series fail.
+    night : numpy array of bool, optional
+        True for the night rows of the frame, flagged NIGHT.
+
+    Returns
+    -------
+    flags : pandas DataFrame
+        uint8 flags, with the index and columns of frame.
+
+    """
+    cube, inputs, curves, cells = _cube(frame)
+    # MISSING is the first bit, the NaN mask read as uint8
+    flags = np.isnan(cube).view(np.uint8)
+    if rules:
+        # bits of the failed rules of each input, (time x input)
+        input_flags = np.zeros(cube.shape[:2], dtype=np.uint8)
+        for flag, curve, low, high in rules:
+            values = cube[:, :, curves.get_loc(curve)]
+            if isinstance(low, pd.Series):
+                low = low.reindex(inputs).to_numpy(dtype=float)
+            if isinstance(high, pd.Series):
+                high = high.reindex(inputs).to_numpy(dtype=float)
+            # NaN values and bounds fail
+            passed = values >= low
+            passed &= values <= high
+            input_flags |= np.uint8(flag) * ~passed
+        flags |= input_flags[:, :, None]
+    if night is not None:
+        flags[np.asarray(night, dtype=bool)] |= np.uint8(NIGHT)
+    flags = flags.reshape(len(frame), -1)
+    if not (len(cells) == flags.shape[1]
+            and (cells == np.arange(len(cells))).all()):
+        flags = flags[:, cells]
+    return pd.DataFrame(flags, index=frame.index, columns=frame.columns)
+
+
+def apply_flags(frame, flags, ignore=0):
+    """
+    Frame with NaN in the flagged cells.
+
+    Parameters
+    ----------
+    frame : pandas DataFrame
+        Frame the flags were computed on.
+    flags : pandas DataFrame
+        Output of qc_flags.
+    ignore : int, optional
+        Flags to keep the values of, e.g. NIGHT. The default is 0.
+
+    Returns
+    -------
+    pandas DataFrame
+
+    """
+    rejected = (flags.to_numpy() & np.uint8(~ignore & 0xFF)) != 0
+    return pd.DataFrame(np.where(rejected, np.nan, frame.to_numpy()),
+                        index=frame.index, columns=frame.columns)
+
+
+def flag_counts(flags):
+    """Number of cells flagged for each reason, by name."""
+    values = flags.to_numpy()
+    return {name: int(np.count_nonzero(values & np.uint8(flag)))
+            for flag, name in FLAG_NAMES.items()}
@@ -0,0 +1,213 @@
+"""
+Solar geometry shared by the POA transposition and the clear sky curves.
+
+The solar position, extraterrestrial radiation and airmass of a site are
+kept in memory per process, keyed by the site (latitude, longitude,
+altitude, air temperature of the refraction) and the UTC timestamps. A time grid already computed, or a coarser
+grid within it (e.g. the 10 min inverter data within the 5 min weather
+data), is read from the cache. Only the timestamps of a shifted or longer
+grid which were never seen are read from the per-site tables on disk (see
+data_sanitization.ephemeris_tables) or computed, then merged into the cached
+grid.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pvlib import atmosphere, solarposition
+from pvlib.irradiance import get_extra_radiation
+from data_sanitization.ephemeris_tables import TABLES_ENABLED, read_table
+from data_sanitization.clear_sky_models import CLEAR_SKY_MODELS
+from data_sanitization.clear_sky_models import compute_clearsky
+
+# Number of sites kept in memory, the least recently used are dropped
+CACHE_SITES = int(os.environ.get('DST_SOLAR_CACHE_SITES', 8))
+# Maximum number of timestamps kept per site
+CACHE_POINTS = int(os.environ.get('DST_SOLAR_CACHE_POINTS', 2000000))
+
+# Default air temperature used for the refraction, as pvlib Location does
+TEMPERATURE = 12
+AIRMASS_MODEL = 'kastenyoung1989'
+
+GEOMETRY_COLUMNS = ['apparent_zenith', 'zenith', 'apparent_elevation',
+                    'elevation', 'azimuth', 'equation_of_time', 'dni_extra',
+                    'airmass_relative', 'airmass_absolute']
+CLEARSKY_COLUMNS = ['ghi', 'dni', 'dhi']
+
+# site -> (sorted UTC timestamps in ns, values in the order of GEOMETRY_COLUMNS)
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _site(latitude, longitude, altitude, temperature=TEMPERATURE):
+    return (round(float(latitude), 6), round(float(longitude), 6),
+            round(float(altitude), 1), round(float(temperature), 1))
+
+
+def _utc_ns(times):
+    # naive timestamps are taken as UTC, as pvlib does
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    return times.asi8
+
+
+def _compute(utc_ns, latitude, longitude, altitude, temperature):
+    """Geometry of the sorted unique timestamps utc_ns, as a 2-D array."""
+    times = pd.DatetimeIndex(utc_ns)
+    pressure = atmosphere.alt2pres(altitude)
+    solar_position = solarposition.get_solarposition(
+        times, latitude=latitude, longitude=longitude, altitude=altitude,
+        pressure=pressure, temperature=temperature)
+    geometry = solar_position.reindex(columns=GEOMETRY_COLUMNS)
+    geometry['dni_extra'] = get_extra_radiation(times)
+    geometry['airmass_relative'] = atmosphere.get_relative_airmass(
+        geometry['apparent_zenith'], AIRMASS_MODEL)
+    geometry['airmass_absolute'] = atmosphere.get_absolute_airmass(
+        geometry['airmass_relative'], pressure)
+    return geometry.to_numpy(dtype=float)
+
+
+def _lookup(utc_ns, site):
+    """Geometry of utc_ns from the tables on disk, computed if off the grid."""
+    if not TABLES_ENABLED:
+        return _compute(utc_ns, *site)
+    found, values = read_table(site, 'geometry', utc_ns,
+                               lambda table_ns: _compute(table_ns, *site))
+    if values is None:
+        return _compute(utc_ns, *site)
+    if not found.all():
+        values[~found] = _compute(utc_ns[~found], *site)
+    return values
+
+
+def _compute_clearsky(utc_ns, site, model):
+    """Clear sky GHI, DNI and DHI of utc_ns, as a 2-D array."""
+    times = pd.DatetimeIndex(utc_ns)
+    geometry = get_solar_geometry(times, *site)
+    return compute_clearsky(times, geometry, site[:3],
+                            model=model).to_numpy(dtype=float)
+
+
+def get_solar_geometry(times, latitude, longitude, altitude,
+                       temperature=TEMPERATURE):
+    """
+    Solar position, extraterrestrial radiation and airmass of a site.
+
+    Parameters
+    ----------
+    times : Pandas DatetimeIndex
+        Timestamps, in UTC when naive.
+    latitude : Float
+        Latitude of the site in decimal degrees.
+    longitude : Float
+        Longitude of the site in decimal degrees.
+    altitude : Float
+        Altitude of the site in meters.
+    temperature : Float, optional
+        Air temperature in degrees C used for the atmospheric refraction.
+        The default is 12.
+
+    Returns
+    -------
+    geometry : Pandas DataFrame
+        Indexed by times, columns apparent_zenith, zenith,
+        apparent_elevation, elevation, azimuth, equation_of_time (as
+        pvlib.solarposition.get_solarposition), dni_extra, airmass_relative
+        and airmass_absolute (as pvlib Location.get_airmass).
+
+    """
+    site = _site(latitude, longitude, altitude, temperature)
+    utc_ns = _utc_ns(times)
+    with _lock:
+        entry = _cache.get(site)
+        if entry is not None:
+            _cache.move_to_end(site)
+
+    if entry is not None and len(entry[0]):
+        cached_ns, cached_values = entry
+        positions = np.minimum(np.searchsorted(cached_ns, utc_ns),
+                               len(cached_ns) - 1)
+        found = cached_ns[positions] == utc_ns
+    else:
+        cached_ns, cached_values = None, None
+        found = np.zeros(len(utc_ns), dtype=bool)
+
+    if not found.all():
+        missing_ns = np.unique(utc_ns[~found])
+        if (cached_ns is not None
+                and len(cached_ns) + len(missing_ns) <= CACHE_POINTS):
+            # merging the new timestamps into the cached grid
+            merged_ns = np.concatenate([cached_ns, missing_ns])
+            order = np.argsort(merged_ns, kind='stable')
+            cached_ns = merged_ns[order]
+            cached_values = np.concatenate([
+                cached_values, _lookup(missing_ns, site)])[order]
+        else:
+            # the cached grid is replaced by the requested one
+            cached_ns = np.unique(utc_ns)
+            cached_values = _lookup(cached_ns, site)
+        with _lock:
+            _cache[site] = (cached_ns, cached_values)
+            _cache.move_to_end(site)
+            while len(_cache) > CACHE_SITES:
+                _cache.popitem(last=False)
+        positions = np.searchsorted(cached_ns, utc_ns)
+
+    return pd.DataFrame(cached_values[positions], index=times,
+                        columns=GEOMETRY_COLUMNS)
+
+
+def get_clearsky(site_location, times, model='simplified_solis',
+                 solar_geometry=None, tables=True, temperature=TEMPERATURE):
+    """
+    Clear sky GHI, DNI and DHI from the shared solar geometry (see
+    data_sanitization.clear_sky_models).
+
+    Parameters
+    ----------
+    site_location : PVLib object
+        Location object from PVLib Library.
+    times : Pandas DatetimeIndex
+        Timestamps, in UTC when naive.
+    model : String, optional
+        'ineichen', 'haurwitz', 'simplified_solis' or another model of
+        CLEAR_SKY_MODELS. The default is 'simplified_solis'.
+    solar_geometry : Pandas DataFrame, optional
+        Output of get_solar_geometry for times, read from the cache by
+        default.
+    tables : bool, optional
+        Read the timestamps on whole minutes from the clear sky table of the
+        site on disk. The default is True.
+    temperature : Float, optional
+        Air temperature of the solar geometry. The default is 12.
+
+    Returns
+    -------
+    clearsky : Pandas DataFrame
+        Columns ghi, dni and dhi.
+
+    """
+    site = _site(site_location.latitude, site_location.longitude,
+                 site_location.altitude, temperature)
+    if tables and TABLES_ENABLED and model in CLEAR_SKY_MODELS:
+        utc_ns = _utc_ns(times)
+        found, values = read_table(
+            site, 'clearsky_' + model, utc_ns,
+            lambda table_ns: _compute_clearsky(table_ns, site, model))
+        if values is not None:
+            if not found.all():
+                values[~found] = _compute_clearsky(utc_ns[~found], site,
+                                                   model)
+            return pd.DataFrame(values, index=times,
+                                columns=CLEARSKY_COLUMNS)
+    if solar_geometry is None:
+        solar_geometry = get_solar_geometry(times, *site)
+    return compute_clearsky(times, solar_geometry, site[:3], model=model)
+
+
+def clear_cache():
+    """Drop the solar geometry of all the sites."""
+    with _lock:
+        _cache.clear()
@@ -2,13 +2,103 @@
 """
 This file contains the tools to be used for the UTC awareness.
 
+The time zone boundaries of tzwhere are loaded lazily, once per process, and
+the time zone of each (rounded) location is memoized. The pipeline runs in
+the processes of the job pool, which load them when they start (see
+data_pipeline.jobs). With forked pool processes, loading them before the
+server forks (gunicorn --preload, see preload_timezones) shares the index
+between the workers and their pools.
+
 @author: DorianGuzman
 """
-from tzwhere import tzwhere
+import os
+import time
+import threading
+import functools
+import pytz
 import pandas as pd
+from data_pipeline.profiling import profile_stage
+
+# Decimals of the latitude and longitude memoized, about 1 km
+TZ_DECIMALS = 2
+# Seconds before loading the time zone boundaries again after a failure
+TZ_RETRY = 300
+
+# tzwhere index of this process, False if it could not be loaded
+_tzwhere = None
+# time of the last failed load
+_tzwhere_failed = 0
+_tzwhere_lock = threading.Lock()
+
+
+def _reset_lock():
+    # a lock held by another thread while forking would never be released
+    global _tzwhere_lock
+    _tzwhere_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+def _get_tzwhere():
+    """
+    The tzwhere index of the process, loaded on first use. False if it
+    could not be loaded, the load is retried after TZ_RETRY seconds.
+    """
+    global _tzwhere, _tzwhere_failed
+    if _tzwhere is False and time.time() - _tzwhere_failed > TZ_RETRY:
+        _tzwhere = None
+    if _tzwhere is None:
+        with _tzwhere_lock:
+            if _tzwhere is None:
+                try:
+                    from tzwhere import tzwhere
+                    _tzwhere = tzwhere.tzwhere()
+                except Exception as e:
+                    print('Time zone boundaries not available: {}'.format(e))
+                    _tzwhere = False
+                    _tzwhere_failed = time.time()
+    return _tzwhere
+
+
+def preload_timezones():
+    """Load the time zone boundaries, e.g. before forking the workers."""
+    return _get_tzwhere() is not False
+
+
+@functools.lru_cache(maxsize=4096)
+def _tz_name_lookup(latitude, longitude):
+    return _get_tzwhere().tzNameAt(latitude, longitude)
 
 
-def get_tz(latitude, longitude):
+def _tz_name_at(latitude, longitude):
+    # the failures are not memoized, the boundaries may load later
+    if _get_tzwhere() is False:
+        return None
+    return _tz_name_lookup(latitude, longitude)
+
+
+def offset_timezone(time_zone):
+    """
+    Fixed offset time zone of a UTC offset in hours, e.g. 'Etc/GMT-1' for 1.
+    None for an empty or invalid offset.
+    """
+    if pd.isna(time_zone) or not str(time_zone).strip():
+        return None
+    try:
+        minutes = int(round(float(time_zone) * 60))
+    except ValueError:
+        print('Invalid time zone: {!r}'.format(time_zone))
+        return None
+    if minutes % 60 == 0:
+        # the sign of the Etc zones is inverted
+        return 'Etc/GMT{:+d}'.format(-minutes // 60) if minutes else 'UTC'
+    return pytz.FixedOffset(minutes)
+
+
+@profile_stage()
+def get_tz(latitude, longitude, time_zone=None):
     """
     This function computes the Time zone from a given latitude and longitude.
 
@@ -18,16 +108,29 @@ def get_tz(latitude, longitude):
         Latitude in float numbers.
     longitude : Float
         Longitude in Float numbers.
+    time_zone : String or Float, optional
+        time_zone of 'General Info'. An IANA name (e.g. 'Europe/Zurich') is
+        returned as is, a UTC offset in hours is used when the location
+        cannot be resolved. Empty (NaN) cells are ignored.
 
     Returns
     -------
     timezone_str : String
-        Time zone in described in string.
+        Time zone in described in string. Without boundaries nor time_zone,
+        the offset of the longitude (15 degrees per hour) is used.
 
     """
+    if isinstance(time_zone, str) and time_zone in pytz.all_timezones_set:
+        return time_zone
     # Get the time zone based on the GPS location
-    tz = tzwhere.tzwhere()
-    timezone_str = tz.tzNameAt(latitude, longitude)
+    timezone_str = _tz_name_at(round(float(latitude), TZ_DECIMALS),
+                               round(float(longitude), TZ_DECIMALS))
+    if timezone_str is None and time_zone is not None:
+        timezone_str = offset_timezone(time_zone)
+    if timezone_str is None:
+        timezone_str = offset_timezone(round(float(longitude) / 15))
+        print('Time zone of ({}, {}) not resolved, {} of the longitude '
+              'used'.format(latitude, longitude, timezone_str))
     return timezone_str
 
 
@@ -0,0 +1,442 @@
+"""
+This file contains the binary codec used to store the dataframes of the app.
+
+The time series frames of the app have a datetime index and 3-level
+('ag_level_2', 'ag_level_1', 'curve') columns. They are written as Arrow IPC
+files: the index is kept as int64 epoch nanoseconds, each column keeps its
+numpy dtype (float32/float64/int64) and NaNs are kept as plain float values,
+so reading a memory-mapped file back into pandas does not copy the data.
+The column labels and level names are kept in the schema metadata.
+
+Other frames (e.g. array_info with its string columns) go through the
+generic pyarrow/pandas conversion, still as Arrow IPC.
+
+3-level frames can also be written partitioned by input (ag_level_2,
+ag_level_1), one record batch per input, so that a single input is read
+without reading the rest of the plant.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CODEC_KEY = b'dst_codec'
+CODEC_VERSION = 1
+INDEX_FIELD = '__index__'
+
+
+def _is_timeseries_frame(df):
+    """True if the frame can use the zero-copy time series layout."""
+    return (isinstance(df.index, pd.DatetimeIndex)
+            and all(np.issubdtype(dtype, np.number) for dtype in df.dtypes))
+
+
+def _column_fields(columns):
+    """Positional arrow field names, the labels are kept in the metadata."""
+    return ['c{}'.format(i) for i in range(len(columns))]
+
+
+def frame_to_table(df):
+    """
+    Convert a dataframe into an arrow table.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Time series frame with a datetime index, or any other frame.
+
+    Returns
+    -------
+    table : pyarrow.Table
+        Arrow table with the codec metadata.
+    """
+    if not _is_timeseries_frame(df):
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        meta = {'version': CODEC_VERSION, 'layout': 'pandas'}
+        return table.replace_schema_metadata(
+            {**(table.schema.metadata or {}),
+             CODEC_KEY: json.dumps(meta).encode()})
+
+    index = df.index
+    index_type = pa.timestamp('ns', tz=str(index.tz) if index.tz else None)
+    arrays = [pa.Array.from_buffers(index_type, len(index),
+                                    [None, pa.py_buffer(index.asi8)])]
+    for i in range(df.shape[1]):
+        values = np.ascontiguousarray(df.iloc[:, i].values)
+        # from_pandas=False keeps NaN as a value instead of a null
+        arrays.append(pa.array(values, from_pandas=False))
+
+    columns = df.columns
+    if isinstance(columns, pd.MultiIndex):
+        labels = [list(label) for label in columns]
+    else:
+        labels = list(columns)
+    meta = {
+        'version': CODEC_VERSION,
+        'layout': 'timeseries',
+        'index_name': index.name,
+        'column_names': list(columns.names),
+        'column_labels': labels,
+        'multiindex': isinstance(columns, pd.MultiIndex),
+    }
+    schema = pa.schema(
+        [pa.field(INDEX_FIELD, index_type)]
+        + [pa.field(name, array.type)
+           for name, array in zip(_column_fields(columns), arrays[1:])],
+        metadata={CODEC_KEY: json.dumps(meta, default=str).encode()})
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def table_to_frame(table):
+    """
+    Convert an arrow table written by frame_to_table back into a dataframe.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+        Arrow table with the codec metadata.
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The decoded dataframe.
+    """
+    meta = json.loads(table.schema.metadata[CODEC_KEY])
+    if meta['layout'] == 'pandas':
+        return table.to_pandas()
+
+    index_column = table.column(INDEX_FIELD).combine_chunks()
+    index_values = np.frombuffer(index_column.buffers()[1], dtype=np.int64,
+                                 count=len(index_column),
+                                 offset=index_column.offset * 8)
+    index = pd.DatetimeIndex(index_values.view('datetime64[ns]'),
+                             name=meta['index_name'])
+    if index_column.type.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(index_column.type.tz)
+
+    # one numpy view per column, no consolidation into a single block
+    data = {}
+    for i in range(1, table.num_columns):
+        data[i - 1] = table.column(i).combine_chunks().to_numpy(
+            zero_copy_only=False)
+    df = pd.DataFrame(data, index=index, copy=False)
+
+    if meta['multiindex']:
+        df.columns = pd.MultiIndex.from_tuples(
+            [tuple(label) for label in meta['column_labels']],
+            names=meta['column_names'])
+    else:
+        df.columns = pd.Index(meta['column_labels'],
+                              name=meta['column_names'][0])
+    return df
+
+
+def encode_frame(df):
+    """
+    Encode a dataframe into Arrow IPC bytes.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        The dataframe to encode.
+
+    Returns
+    -------
+    payload : bytes
+        Arrow IPC file content.
+    """
+    table = frame_to_table(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_frame(payload):
+    """
+    Decode Arrow IPC bytes written by encode_frame.
+
+    Parameters
+    ----------
+    payload : bytes or pyarrow.Buffer
+        Arrow IPC file content.
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The decoded dataframe.
+    """
+    reader = pa.ipc.open_file(pa.BufferReader(payload))
+    return table_to_frame(reader.read_all())
+
+
+def write_frame(df, path):
+    """
+    Write a dataframe to an Arrow IPC file.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        The dataframe to write.
+    path : str
+        Destination file path.
+    """
+    table = frame_to_table(df)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+class FrameWriter:
+    """
+    Arrow IPC file of a time series frame written chunk by chunk of rows,
+    e.g. the chunks of the streaming imputation (see
+    data_sanitization.models.predict_missing_data), so the whole frame is
+    never in memory. Read back by read_frame as one frame.
+
+    Parameters
+    ----------
+    path : str
+        Destination file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._sink = None
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        """
+        Append the rows of a frame, with the columns and dtypes of the
+        first one written.
+        """
+        table = frame_to_table(df)
+        if json.loads(table.schema.metadata[CODEC_KEY])['layout'] != \
+                'timeseries':
+            raise ValueError('Chunks need a time series frame.')
+        if self._writer is None:
+            self._sink = pa.OSFile(self.path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, table.schema)
+            self._schema = table.schema
+        elif not table.schema.equals(self._schema, check_metadata=True):
+            raise ValueError('The chunk does not have the columns of the '
+                             'frame.')
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        """Finish the file, nothing is written without any chunk."""
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            self._writer = self._sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_frame(path, columns=None):
+    """
+    Read a dataframe from an Arrow IPC file. The file is memory-mapped so
+    the numeric columns are views on the page cache.
+
+    Parameters
+    ----------
+    path : str
+        Arrow IPC file written by write_frame.
+    columns : list, optional
+        Subset of the column labels to read (time series frames only).
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        The decoded dataframe.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    table = reader.read_all()
+    if columns is not None:
+        table = select_columns(table, columns)
+    return table_to_frame(table)
+
+
+def select_columns(table, columns):
+    """
+    Keep only the given column labels of an arrow table written by
+    frame_to_table.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+        Arrow table with the codec metadata.
+    columns : list
+        Column labels (tuples for 3-level frames) to keep.
+
+    Returns
+    -------
+    table : pyarrow.Table
+        Arrow table with the index and the selected columns only.
+    """
+    meta = json.loads(table.schema.metadata[CODEC_KEY])
+    if meta['layout'] != 'timeseries':
+        raise ValueError('Column selection needs a time series frame.')
+    labels = [tuple(label) if meta['multiindex'] else label
+              for label in meta['column_labels']]
+    positions = [labels.index(tuple(col) if meta['multiindex'] else col)
+                 for col in columns]
+    meta['column_labels'] = [meta['column_labels'][i] for i in positions]
+    selected = table.select([0] + [i + 1 for i in positions])
+    return selected.replace_schema_metadata(
+        {CODEC_KEY: json.dumps(meta, default=str).encode()})
+
+
+PARTITION_DATA = 'data.arrow'
+PARTITION_TIME = 'time.arrow'
+
+
+def _index_table(index):
+    """Arrow table holding only a datetime index."""
+    index_type = pa.timestamp('ns', tz=str(index.tz) if index.tz else None)
+    array = pa.Array.from_buffers(index_type, len(index),
+                                  [None, pa.py_buffer(index.asi8)])
+    meta = {'version': CODEC_VERSION, 'index_name': index.name}
+    return pa.Table.from_arrays(
+        [array], schema=pa.schema([pa.field(INDEX_FIELD, index_type)],
+                                  metadata={CODEC_KEY: json.dumps(
+                                      meta, default=str).encode()}))
+
+
+def _read_index(folder):
+    """Read the datetime index written by write_partitioned_frame."""
+    table = pa.ipc.open_file(pa.memory_map(
+        os.path.join(folder, PARTITION_TIME), 'r')).read_all()
+    meta = json.loads(table.schema.metadata[CODEC_KEY])
+    column = table.column(INDEX_FIELD).combine_chunks()
+    values = np.frombuffer(column.buffers()[1], dtype=np.int64,
+                           count=len(column), offset=column.offset * 8)
+    index = pd.DatetimeIndex(values.view('datetime64[ns]'),
+                             name=meta['index_name'])
+    if column.type.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(column.type.tz)
+    return index
+
+
+def write_partitioned_frame(df, folder):
+    """
+    Write a 3-level time series frame partitioned by its first two column
+    levels (ag_level_2, ag_level_1). Each input is one record batch of an
+    Arrow IPC file, with one column per curve, so a single input can be
+    read without touching the others. The datetime index is written once
+    in a separate file. Each curve is stored with a dtype common to all the
+    inputs (float when an input lacks the curve).
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Frame with a datetime index and 3-level columns.
+    folder : str
+        Destination folder, created if needed.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with pa.OSFile(os.path.join(folder, PARTITION_TIME), 'wb') as sink:
+        table = _index_table(df.index)
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    labels = list(df.columns)
+    partitions = list(dict.fromkeys(label[:-1] for label in labels))
+    curves = list(dict.fromkeys(label[-1] for label in labels))
+    # common dtype of each curve across the inputs, float if any input
+    # lacks the curve so it can be padded with NaN
+    positions = {label: i for i, label in enumerate(labels)}
+    curve_types = []
+    for curve in curves:
+        dtypes = [df.dtypes.iloc[positions[key + (curve,)]]
+                  for key in partitions if key + (curve,) in positions]
+        if len(dtypes) < len(partitions):
+            dtypes.append(np.dtype('float32'))
+        curve_types.append(np.result_type(*dtypes))
+
+    meta = {
+        'version': CODEC_VERSION,
+        'layout': 'partitioned',
+        'column_names': list(df.columns.names),
+        'column_labels': [list(label) for label in labels],
+        'partitions': [list(key) for key in partitions],
+        'curves': curves,
+    }
+    schema = pa.schema(
+        [pa.field(str(curve), pa.from_numpy_dtype(dtype))
+         for curve, dtype in zip(curves, curve_types)],
+        metadata={CODEC_KEY: json.dumps(meta, default=str).encode()})
+    with pa.OSFile(os.path.join(folder, PARTITION_DATA), 'wb') as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for key in partitions:
+                arrays = []
+                for curve, dtype in zip(curves, curve_types):
+                    if key + (curve,) in positions:
+                        values = df.iloc[:, positions[key + (curve,)]].values
+                        values = np.ascontiguousarray(values, dtype=dtype)
+                    else:
+                        values = np.full(len(df), np.nan, dtype=dtype)
+                    arrays.append(pa.array(values, from_pandas=False))
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
+def read_partitions(folder, keys=None, curves=None):
+    """
+    Read some inputs of a frame written by write_partitioned_frame. Only the
+    record batches of the requested inputs are read.
+
+    Parameters
+    ----------
+    folder : str
+        Folder written by write_partitioned_frame.
+    keys : list of tuple, optional
+        (ag_level_2, ag_level_1) of the inputs to read. All by default.
+    curves : list of str, optional
+        Curves to read, e.g. ['I', 'V']. All by default.
+
+    Returns
+    -------
+    df : Pandas DataFrame
+        Frame with the requested inputs, in the original column order.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(
+        os.path.join(folder, PARTITION_DATA), 'r'))
+    meta = json.loads(reader.schema.metadata[CODEC_KEY])
+    partitions = [tuple(key) for key in meta['partitions']]
+    batch_numbers = {key: i for i, key in enumerate(partitions)}
+    if keys is not None:
+        keys = [tuple(key) for key in keys]
+        missing = [key for key in keys if key not in batch_numbers]
+        if missing:
+            raise KeyError('Partitions not found: {}'.format(missing))
+        keys = set(keys)
+    curve_positions = {curve: i for i, curve in enumerate(meta['curves'])}
+
+    batches = {}
+    data = {}
+    labels = []
+    for label in meta['column_labels']:
+        label = tuple(label)
+        key, curve = label[:-1], label[-1]
+        if (keys is not None and key not in keys) or \
+                (curves is not None and curve not in curves):
+            continue
+        if key not in batches:
+            batches[key] = reader.get_batch(batch_numbers[key])
+        data[len(labels)] = batches[key].column(
+            curve_positions[curve]).to_numpy(zero_copy_only=False)
+        labels.append(label)
+
+    df = pd.DataFrame(data, index=_read_index(folder), copy=False)
+    df.columns = pd.MultiIndex.from_tuples(labels,
+                                           names=meta['column_names'])
+    return df
@@ -0,0 +1,155 @@
+"""
+This file contains the in-process cache of the dataframes read from the
+result store.
+
+All the dashboard callbacks fire on the same upload and read overlapping
+frames. The cache keeps the parsed frames keyed by their content hash, so
+each frame is read once per worker, and evicts the least recently used
+frames above a memory budget. The frames are shared by all the callbacks:
+the read-only (memory-mapped) ones are returned as is, the others as copies.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Memory budget of the cache in bytes
+CACHE_MAX_BYTES = int(os.environ.get('DST_FRAME_CACHE_MAX_BYTES',
+                                     512 * 1024 ** 2))
+
+
+def frame_nbytes(df):
+    """Size of the data and the index of a dataframe in bytes."""
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+def is_read_only(df):
+    """True if the values of a dataframe cannot be modified in place."""
+    return not any(np.asarray(df.iloc[:, i]).flags.writeable
+                   for i in range(df.shape[1]))
+
+
+class FrameCache:
+    """
+    Thread-safe LRU cache of dataframes bounded by their memory size.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget of the cache. The least recently used frames are
+        dropped when it is exceeded.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._sizes = {}
+        # keys of the writable frames, copied for each caller
+        self._writable = set()
+        self._lock = threading.Lock()
+        # one lock per key being loaded, so concurrent callbacks asking for
+        # the same frame wait for a single read
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self):
+        """Memory used by the cached frames in bytes."""
+        return sum(self._sizes.values())
+
+    def get(self, key):
+        """
+        Return the cached frame for key, or None. A frame which is not
+        read-only is copied, the callers cannot modify the cached one.
+        """
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                df, writable = self._frames[key], key in self._writable
+            else:
+                self.misses += 1
+                return None
+        return df.copy() if writable else df
+
+    def put(self, key, df):
+        """
+        Add a frame to the cache, evicting the least recently used ones.
+        Returns True if the frame is writable, i.e. copied by get.
+        """
+        size = frame_nbytes(df)
+        writable = not is_read_only(df)
+        with self._lock:
+            if size > self.max_bytes:
+                return writable
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            self._sizes[key] = size
+            if writable:
+                self._writable.add(key)
+            else:
+                self._writable.discard(key)
+            while self.nbytes > self.max_bytes:
+                old_key, _ = self._frames.popitem(last=False)
+                del self._sizes[old_key]
+                self._writable.discard(old_key)
+                self.evictions += 1
+        return writable
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached frame for key, calling loader() to read it on a
+        miss. Concurrent misses on the same key call the loader only once.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key, e.g. (content hash, columns).
+        loader : callable
+            Function without arguments returning the dataframe.
+
+        Returns
+        -------
+        df : Pandas DataFrame
+            The cached or freshly loaded dataframe.
+        """
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # another thread may have loaded it while we were waiting
+            df = self.get(key)
+            if df is None:
+                df = loader()
+                if self.put(key, df):
+                    # the loaded frame is the cached one
+                    df = df.copy()
+        with self._lock:
+            self._loading.pop(key, None)
+        return df
+
+    def clear(self):
+        """Drop all the cached frames."""
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._writable.clear()
+
+    def stats(self):
+        """
+        Counters of the cache.
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, evictions, number of entries and bytes used.
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._frames),
+                    'bytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
@@ -0,0 +1,362 @@
+"""
+This file contains the server-side store for the processed upload results.
+
+Each processed upload is written once to local disk under an opaque result
+id, one Arrow IPC file per dataframe (see data_store.codec) plus a small json
+file with the non-tabular information (general info, data summary). The browser only keeps
+the result id and every gunicorn worker reads the frames it needs back from
+the disk. The content hash of each frame is kept in the json file, so the
+frames can be cached in memory by content (see data_store.frame_cache).
+
+The input level frames used by the visualization can be stored partitioned
+by input (ag_level_2, ag_level_1), so selecting one input in the dashboard
+reads only that input's series whatever the size of the plant.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from data_store import codec
+
+# Root folder of the store, shared by all the workers of the server
+STORE_DIR = os.environ.get('DST_RESULT_STORE_DIR',
+                           os.path.join(tempfile.gettempdir(),
+                                        'dst_result_store'))
+# Results not accessed for this many seconds are removed
+STORE_TTL = float(os.environ.get('DST_RESULT_STORE_TTL', 6 * 3600))
+# Maximum size of the store on disk in bytes
+STORE_MAX_BYTES = int(os.environ.get('DST_RESULT_STORE_MAX_BYTES',
+                                     2 * 1024 ** 3))
+
+META_FILE = 'meta.json'
+FRAME_SUFFIX = '.arrow'
+PARTITIONED_SUFFIX = '.parts'
+
+
+def _json_default(obj):
+    """Convert numpy scalars found in general_info into python types."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+def _files_digest(paths):
+    """Content hash of a list of files."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultStore:
+    """
+    Disk based store of processed results with TTL and LRU eviction.
+
+    Parameters
+    ----------
+    root : str, optional
+        Folder where the results are written.
+    ttl : float, optional
+        Seconds after the last access after which a result is removed.
+    max_bytes : int, optional
+        Disk quota of the store. The least recently used results are removed
+        when it is exceeded.
+    cache : FrameCache, optional
+        In-memory cache of the frames read, keyed by their content hash.
+    """
+
+    def __init__(self, root=STORE_DIR, ttl=STORE_TTL,
+                 max_bytes=STORE_MAX_BYTES, cache=None):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache = cache
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, result_id, name=None):
+        # result ids are generated by the store, refuse anything else
+        if not result_id or not str(result_id).isalnum():
+            raise KeyError('Invalid result id: {!r}'.format(result_id))
+        path = os.path.join(self.root, result_id)
+        if name is not None:
+            path = os.path.join(path, name)
+        return path
+
+    def write(self, frames, meta=None, result_id=None, partitioned=()):
+        """
+        Write the dataframes of a processed upload to the store.
+
+        Parameters
+        ----------
+        frames : dict of Pandas DataFrame
+            The dataframes to store, by name. A frame can also be the path
+            of an Arrow IPC file, e.g. written chunk by chunk by
+            codec.FrameWriter, which is moved into the result as is (not
+            partitioned).
+        meta : dict, optional
+            json serializable information stored along with the frames.
+        result_id : str, optional
+            Id to store the result under. A new random id is used by default.
+        partitioned : list of str, optional
+            Names of the 3-level frames to store partitioned by input.
+
+        Returns
+        -------
+        result_id : str
+            The key to read the result back.
+        """
+        result_id = result_id or uuid.uuid4().hex
+        # writing in a temporary folder first, then renaming it, so other
+        # workers never see a partially written result
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+        try:
+            digests = {}
+            for name, df in frames.items():
+                if isinstance(df, str):
+                    path = os.path.join(tmp_dir, name + FRAME_SUFFIX)
+                    shutil.move(df, path)
+                    digests[name] = _files_digest([path])
+                    continue
+                if name in partitioned:
+                    folder = os.path.join(tmp_dir, name + PARTITIONED_SUFFIX)
+                    codec.write_partitioned_frame(df, folder)
+                    digests[name] = _files_digest(
+                        [os.path.join(folder, codec.PARTITION_TIME),
+                         os.path.join(folder, codec.PARTITION_DATA)])
+                    continue
+                payload = codec.encode_frame(df)
+                digests[name] = hashlib.blake2b(payload,
+                                                digest_size=16).hexdigest()
+                with open(os.path.join(tmp_dir, name + FRAME_SUFFIX),
+                          'wb') as f:
+                    f.write(payload)
+            meta = dict(meta or {})
+            meta['frames'] = list(frames)
+            meta['partitioned'] = [name for name in frames
+                                   if name in partitioned
+                                   and not isinstance(frames[name], str)]
+            meta['digests'] = digests
+            meta['created'] = time.time()
+            with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+                json.dump(meta, f, default=_json_default)
+            target = self._path(result_id)
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+            os.rename(tmp_dir, target)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=result_id)
+        return result_id
+
+    def exists(self, result_id):
+        """Return True if the result is present in the store."""
+        try:
+            return os.path.exists(self._path(result_id, META_FILE))
+        except KeyError:
+            return False
+
+    def _touch(self, result_id):
+        # the mtime of the meta file is the last access time used by eviction
+        try:
+            os.utime(self._path(result_id, META_FILE))
+        except FileNotFoundError:
+            raise KeyError('Result {} not found in the store'.format(
+                result_id))
+
+    def read_meta(self, result_id):
+        """
+        Read the non-tabular information of a result.
+
+        Parameters
+        ----------
+        result_id : str
+            Key returned by ResultStore.write.
+
+        Returns
+        -------
+        meta : dict
+            The information stored along with the frames.
+        """
+        self._touch(result_id)
+        with open(self._path(result_id, META_FILE)) as f:
+            return json.load(f)
+
+    def update_meta(self, result_id, updates):
+        """
+        Add information to the meta of a stored result.
+
+        Parameters
+        ----------
+        result_id : str
+            Key returned by ResultStore.write.
+        updates : dict
+            json serializable items to add or replace.
+        """
+        meta = self.read_meta(result_id)
+        meta.update(updates)
+        path = self._path(result_id, META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, default=_json_default)
+        os.replace(path + '.tmp', path)
+
+    def results(self):
+        """
+        Ids of the stored results, the most recently accessed first.
+
+        Returns
+        -------
+        result_ids : list of str
+        """
+        return [result_id for _, _, result_id in
+                sorted(self._entries(), reverse=True)]
+
+    def read_frame(self, result_id, name, columns=None):
+        """
+        Read a single dataframe of a result. The file is memory-mapped, the
+        time series frames are read-only, the others are copies with a
+        cache.
+
+        Parameters
+        ----------
+        result_id : str
+            Key returned by ResultStore.write.
+        name : str
+            Name of the dataframe, e.g. 'inv_data_sani'.
+        columns : list, optional
+            Subset of the columns to read.
+
+        Returns
+        -------
+        df : Pandas DataFrame
+            The stored dataframe.
+        """
+        return self._read_frame(self.read_meta(result_id), result_id, name,
+                                columns)
+
+    def _cached(self, meta, result_id, name, key, loader):
+        if self.cache is None:
+            return loader()
+        # identical frames of different results share the cache entry
+        digest = meta.get('digests', {}).get(name, result_id + '/' + name)
+        return self.cache.get_or_load((digest,) + key, loader)
+
+    def _read_frame(self, meta, result_id, name, columns=None):
+        if name not in meta['frames']:
+            raise KeyError('Frame {} not found in result {}'.format(
+                name, result_id))
+        if name in meta.get('partitioned', []):
+            folder = self._path(result_id, name + PARTITIONED_SUFFIX)
+            df = self._cached(meta, result_id, name, ('all',),
+                              lambda: codec.read_partitions(folder))
+            return df if columns is None else df[columns]
+        path = self._path(result_id, name + FRAME_SUFFIX)
+        key = (tuple(columns) if columns is not None else None,)
+        return self._cached(meta, result_id, name, key,
+                            lambda: codec.read_frame(path, columns=columns))
+
+    def read_partition(self, result_id, name, key, curves=None):
+        """
+        Read the series of a single input of a partitioned frame.
+
+        Parameters
+        ----------
+        result_id : str
+            Key returned by ResultStore.write.
+        name : str
+            Name of a frame written with partitioned=[name].
+        key : tuple of str
+            (ag_level_2, ag_level_1) of the input, e.g. ('Inv1', 'M1').
+        curves : list of str, optional
+            Curves to read, e.g. ['I', 'V']. All by default.
+
+        Returns
+        -------
+        df : Pandas DataFrame
+            3-level frame with the columns of the input only.
+        """
+        meta = self.read_meta(result_id)
+        if name not in meta.get('partitioned', []):
+            raise KeyError('Frame {} of result {} is not partitioned'.format(
+                name, result_id))
+        folder = self._path(result_id, name + PARTITIONED_SUFFIX)
+        key = tuple(key)
+        curves = list(curves) if curves is not None else None
+        return self._cached(
+            meta, result_id, name,
+            ('partition', key, tuple(curves) if curves else None),
+            lambda: codec.read_partitions(folder, keys=[key], curves=curves))
+
+    def read_frames(self, result_id, names):
+        """
+        Read several dataframes of a result.
+
+        Parameters
+        ----------
+        result_id : str
+            Key returned by ResultStore.write.
+        names : list of str
+            Names of the dataframes to read.
+
+        Returns
+        -------
+        frames : dict of Pandas DataFrame
+            The requested dataframes, by name.
+        """
+        meta = self.read_meta(result_id)
+        return {name: self._read_frame(meta, result_id, name)
+                for name in names}
+
+    def _entries(self):
+        """List of (last access, size in bytes, result id) of the store."""
+        entries = []
+        for result_id in os.listdir(self.root):
+            path = os.path.join(self.root, result_id)
+            meta_path = os.path.join(path, META_FILE)
+            if result_id.startswith('.') or not os.path.exists(meta_path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(folder, file))
+                           for folder, _, files in os.walk(path)
+                           for file in files)
+                entries.append((os.path.getmtime(meta_path), size, result_id))
+            except FileNotFoundError:
+                # removed by another worker meanwhile
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Remove the expired results, then the least recently used ones until
+        the store fits in its disk quota.
+
+        Parameters
+        ----------
+        keep : str, optional
+            Id of a result which must not be removed (the one just written).
+
+        Returns
+        -------
+        removed : list of str
+            Ids of the removed results.
+        """
+        now = time.time()
+        removed = []
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for last_access, size, result_id in entries:
+            if result_id == keep:
+                continue
+            if now - last_access > self.ttl or total > self.max_bytes:
+                shutil.rmtree(os.path.join(self.root, result_id),
+                              ignore_errors=True)
+                total -= size
+                removed.append(result_id)
+        return removed